@@ -0,0 +1,106 @@
+#coding: utf-8
+import datetime
+import logging
+
+import transaction
+from sqlalchemy import exists
+
+import models
+
+
+logger = logging.getLogger('balaio.archive')
+
+
+def get_closed_attempts(session, older_than):
+    """
+    Returns a query of closed attempts started before `older_than`.
+
+    Attempts with notifications not delivered to SciELO Manager yet are
+    left out, so the outbox is not emptied by the archiving.
+
+    :param session: sqlalchemy db session.
+    :param older_than: instance of `datetime.datetime`.
+    """
+    Notification = models.Notification
+    has_pending_notifications = exists().where(
+        Notification.attempt_id == models.Attempt.id).where(
+        Notification.sent_at == None).where(
+        Notification.failed_at == None)
+
+    return session.query(models.Attempt).filter(
+        models.Attempt.is_closed()).filter(
+        ~has_pending_notifications).filter(
+        models.Attempt.started_at < older_than).order_by(models.Attempt.id)
+
+
+def archive_attempts(session, days, batch_size=100):
+    """
+    Moves closed attempts started more than `days` ago to the archive.
+
+    Checkpoints, notices and delivered or failed notifications of the
+    archived attempts are removed, in order to keep the `attempt`,
+    `checkpoint` and `notice` relations small.
+
+    Each batch is committed independently, so an interrupted run
+    keeps the progress already made.
+
+    :param session: sqlalchemy db session.
+    :param days: retention period, in days.
+    :param batch_size: (optional) max number of attempts per transaction.
+    :returns: the total of archived attempts.
+    """
+    older_than = datetime.datetime.now() - datetime.timedelta(days=days)
+    total = 0
+
+    while True:
+        attempts = get_closed_attempts(session, older_than).options(
+            *models.Attempt.serialization_options()).limit(batch_size).all()
+
+        if not attempts:
+            break
+
+        try:
+            for attempt in attempts:
+                session.add(models.ArchivedAttempt.from_attempt(attempt))
+            session.flush()
+
+            attempt_ids = [attempt.id for attempt in attempts]
+            checkpoint_ids = [cp.id for attempt in attempts for cp in attempt.checkpoint]
+
+            if checkpoint_ids:
+                session.query(models.Notice).filter(
+                    models.Notice.checkpoint_id.in_(checkpoint_ids)).delete(
+                    synchronize_session=False)
+                session.query(models.Checkpoint).filter(
+                    models.Checkpoint.id.in_(checkpoint_ids)).delete(
+                    synchronize_session=False)
+
+            session.query(models.Notification).filter(
+                models.Notification.attempt_id.in_(attempt_ids)).delete(
+                synchronize_session=False)
+            session.query(models.Attempt).filter(
+                models.Attempt.id.in_(attempt_ids)).delete(
+                synchronize_session=False)
+
+            transaction.commit()
+        except Exception as e:
+            transaction.abort()
+            logger.error('Failed to archive a batch of attempts: %s' % e)
+            raise
+        finally:
+            session.expunge_all()
+
+        total += len(attempts)
+        logger.info('%s attempts archived so far' % total)
+
+    return total
+
+
+def get_archived_attempt(session, attempt_id):
+    """
+    Returns the :class:`models.ArchivedAttempt` for `attempt_id` or None.
+
+    :param session: sqlalchemy db session.
+    :param attempt_id: the id the attempt had before being archived.
+    """
+    return session.query(models.ArchivedAttempt).get(attempt_id)
@@ -28,8 +28,17 @@ if __name__ == '__main__':
     parser.add_argument('--alembic-config',
                         action='store',
                         dest='alembic_configfile')
+    parser.add_argument('--days',
+                        action='store',
+                        dest='days',
+                        type=int,
+                        help='retention period used by archive')
+    parser.add_argument('--full',
+                        action='store_true',
+                        dest='full',
+                        help='list all the records, instead of the modified ones, used by snapshot')
     parser.add_argument('activity',
-                        choices=['syncdb', 'shell'])
+                        choices=['syncdb', 'shell', 'archive', 'snapshot'])
 
     args = parser.parse_args()
 
@@ -54,6 +63,37 @@ if __name__ == '__main__':
         print 'Done. All databases had been created'
         sys.exit(0)
 
+    elif activity == 'archive':
+        # Moves closed attempts older than the retention period
+        # to the archive.
+        import archive
+
+        config = utils.balaio_config_from_env()
+        models.Session.configure(bind=models.create_engine_from_config(config))
+
+        days = args.days or config.getint('archive', 'retention_days')
+        logger.info('Archiving closed attempts older than %s days' % days)
+
+        total = archive.archive_attempts(models.Session(), days)
+
+        print 'Done. %s attempts had been archived' % total
+        sys.exit(0)
+
+    elif activity == 'snapshot':
+        # Synchronizes the local snapshot of the journals and
+        # issues registered at SciELO Manager.
+        import manager
+        import snapshot
+
+        config = utils.balaio_config_from_env()
+        engine = models.create_engine_from_config(config)
+        client = manager.client_from_config(config)
+
+        journals, issues = snapshot.sync(engine, client, full=args.full)
+
+        print 'Done. %s journals and %s issues had been updated' % (journals, issues)
+        sys.exit(0)
+
     elif activity == 'shell':
         # Places de user on an interactive shell, with a
         # pre-configured Session object.
@@ -0,0 +1,387 @@
+# coding: utf-8
+"""
+Validation throughput benchmark.
+
+Generates a corpus of synthetic SPS packages, based on the sample package
+shipped in `samples/`, and runs the validation pipeline over it with
+stubbed SciELO Manager and DOI services. Reports the throughput, the time
+spent by each pipe and the peak memory, and compares them with a
+baseline report saved by a previous run.
+
+Usage: python balaio/benchmark.py -n 50 --references 60 --save baseline.json
+       python balaio/benchmark.py -n 50 --references 60 --baseline baseline.json
+"""
+import os
+import sys
+import copy
+import json
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import resource
+import tempfile
+
+from lxml import etree
+
+import utils
+import package
+import timing
+import validator
+
+
+SAMPLE_PACKAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              '..', 'samples', '0042-9686-bwho-91-08-545.zip')
+
+XLINK = 'http://www.w3.org/1999/xlink'
+
+SURNAMES = [u'Silva', u'Santos', u'Smith', u'García', u'Müller', u'Rossi', u'Evans', u'Chan']
+GIVEN_NAMES = [u'Maria', u'João', u'David B', u'Fiona', u'Hyeun-Kyoo', u'Carol E', u'Atif']
+SOURCES = ['Lancet', 'BMJ', 'Rev Saude Publica', 'Bull World Health Organ', 'Cad Saude Publica']
+
+
+####
+# Synthetic corpus
+####
+def load_sample(path=SAMPLE_PACKAGE):
+    """
+    Returns the XML tree and the PDF data of the sample package.
+    """
+    with zipfile.ZipFile(path) as sample:
+        xml_name, = [name for name in sample.namelist() if name.endswith('.xml')]
+        pdf_name, = [name for name in sample.namelist() if name.endswith('.pdf')]
+        return etree.fromstring(sample.read(xml_name)), sample.read(pdf_name)
+
+
+def _sub(parent, tag, text=None, **attrib):
+    elem = etree.SubElement(parent, tag, **attrib)
+    elem.text = text
+    return elem
+
+
+def make_article(sample_xml, name, references=30, authors=5, images=2, rng=random):
+    """
+    Returns the XML of a synthetic article, as a string.
+
+    :param sample_xml: XML tree the article is based on.
+    :param name: name of the package, used on the article ids.
+    """
+    article = copy.deepcopy(sample_xml)
+    article_meta = article.find('front/article-meta')
+
+    article_meta.find('article-id[@pub-id-type="doi"]').text = '10.2471/BLT.13.%s' % name
+
+    contrib_group = etree.Element('contrib-group')
+    article_meta.find('title-group').addnext(contrib_group)
+    for i in range(authors):
+        contrib = _sub(contrib_group, 'contrib', **{'contrib-type': 'author'})
+        contrib_name = _sub(contrib, 'name')
+        _sub(contrib_name, 'surname', rng.choice(SURNAMES))
+        _sub(contrib_name, 'given-names', rng.choice(GIVEN_NAMES))
+        _sub(contrib, 'xref', 'a%s' % (i % 3 + 1), **{'ref-type': 'aff', 'rid': 'aff%s' % (i % 3 + 1)})
+
+    for i in range(min(authors, 3)):
+        aff = etree.Element('aff', id='aff%s' % (i + 1))
+        _sub(aff, 'institution', 'University %s' % (i + 1), **{'content-type': 'orgname'})
+        _sub(aff, 'country', 'Brazil')
+        contrib_group.addnext(aff)
+
+    license = _sub(article_meta.find('permissions'), 'license',
+                   **{'license-type': 'open-access',
+                      '{%s}href' % XLINK: 'http://creativecommons.org/licenses/by/3.0/'})
+    _sub(license, 'license-p', 'This is an open-access article.')
+
+    body = article.find('body')
+    for i in range(images):
+        fig = _sub(body, 'fig', id='f%s' % (i + 1))
+        _sub(fig, 'graphic', **{'{%s}href' % XLINK: '%s-gf%s.tif' % (name, i + 1)})
+
+    back = _sub(article, 'back')
+    ack = _sub(back, 'ack')
+    _sub(ack, 'p', 'Supported by grant %s.' % rng.randint(1000, 9999))
+
+    ref_list = _sub(back, 'ref-list')
+    for i in range(references):
+        is_journal = rng.random() < 0.8
+        ref = _sub(ref_list, 'ref', id='B%s' % (i + 1))
+        citation = _sub(ref, 'element-citation',
+                        **{'publication-type': 'journal' if is_journal else 'book'})
+        person_group = _sub(citation, 'person-group', **{'person-group-type': 'author'})
+        ref_name = _sub(person_group, 'name')
+        _sub(ref_name, 'surname', rng.choice(SURNAMES))
+        _sub(ref_name, 'given-names', rng.choice(GIVEN_NAMES))
+        if is_journal:
+            _sub(citation, 'article-title', 'Article title %s' % (i + 1))
+        _sub(citation, 'source', rng.choice(SOURCES))
+        _sub(citation, 'year', str(rng.randint(1980, 2013)))
+
+    return etree.tostring(article, xml_declaration=True, encoding='utf-8')
+
+
+def generate_package(directory, name, sample, references=30, authors=5,
+                     images=2, image_size=512 * 1024, rng=random):
+    """
+    Writes a synthetic SPS package to `directory`, and returns its path.
+
+    :param sample: XML tree and PDF data returned by :func:`load_sample`.
+    :param image_size: size of each image, in bytes.
+    """
+    sample_xml, sample_pdf = sample
+    path = os.path.join(directory, '%s.zip' % name)
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as pkg:
+        pkg.writestr('%s/%s.xml' % (name, name),
+                     make_article(sample_xml, name, references=references,
+                                  authors=authors, images=images, rng=rng))
+        pkg.writestr('%s/%s.pdf' % (name, name), sample_pdf)
+        for i in range(images):
+            pkg.writestr('%s/%s-gf%s.tif' % (name, name, i + 1), os.urandom(image_size))
+
+    return path
+
+
+def generate_corpus(directory, count, seed=None, **kwargs):
+    """
+    Writes `count` synthetic packages to `directory`, and returns their paths.
+
+    Extra keyword arguments are passed to :func:`generate_package`.
+    """
+    rng = random.Random(seed)
+    sample = load_sample()
+    return [generate_package(directory, '0042-9686-bwho-91-08-%04d' % i, sample, rng=rng, **kwargs)
+            for i in range(count)]
+
+
+####
+# Stubbed services
+####
+ISSUE_DATA = {
+    'resource_uri': '/api/v1/issues/1/',
+    'updated': '2013-08-01T00:00:00',
+    'publication_year': 2013,
+    'publication_start_month': 8,
+    'publication_end_month': 0,
+    'sections': [{'titles': [['en', u'In This Month´s Bulletin']]},
+                 {'titles': [['en', 'Research'], ['es', u'Investigación']]}],
+    'journal': {
+        'publisher_name': 'World Health Organization',
+        'short_title': 'Bull. World Health Organ.',
+        'medline_title': 'Bull World Health Organ',
+    },
+}
+
+
+class EndpointStub(object):
+    def __init__(self, data):
+        self._data = data
+
+    def filter(self, **criteria):
+        return iter([copy.deepcopy(self._data)])
+
+
+class ManagerStub(object):
+    """
+    SciELO Manager API client returning the issue of the sample package,
+    after `latency` seconds.
+    """
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.journals = EndpointStub(ISSUE_DATA['journal'])
+        self.issues = EndpointStub(ISSUE_DATA)
+
+    def fetch_relations(self, dataset):
+        time.sleep(self.latency)
+        return dataset
+
+
+class DOIResolverStub(object):
+    """
+    Considers all DOIs registered, after `latency` seconds.
+    """
+    def __init__(self, latency=0):
+        self.latency = latency
+
+    def __call__(self, doi):
+        time.sleep(self.latency)
+        return True
+
+
+class NotifierStub(object):
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def start(self):
+        pass
+
+    def tell(self, message, status, label=None):
+        pass
+
+    def end(self):
+        pass
+
+
+class ArticlePkgStub(object):
+    journal_pissn = '0042-9686'
+    journal_eissn = None
+    issue_volume = '91'
+    issue_number = '8'
+    issue_suppl_volume = None
+    issue_suppl_number = None
+
+
+class AttemptStub(object):
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.is_valid = True
+        self.articlepkg = ArticlePkgStub()
+        self.analyzer = package.PackageAnalyzer(filepath)
+
+    def start_validation(self):
+        pass
+
+    def end_validation(self):
+        self.analyzer.restore_perms()
+
+    def __repr__(self):
+        return '<AttemptStub %s>' % os.path.basename(self.filepath)
+
+
+####
+# Harness
+####
+def peak_memory():
+    """
+    Returns the peak resident memory of the process, in megabytes.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run(paths, manager_latency=0, doi_latency=0, rule_workers=4, warmup=1):
+    """
+    Validates the packages at `paths` and returns the report, as a dict.
+
+    :param warmup: (optional) number of packages validated before measuring.
+    """
+    ppl = validator.get_pipeline(NotifierStub, ManagerStub(manager_latency),
+                                 DOIResolverStub(doi_latency), rule_workers=rule_workers)
+
+    for path in paths[:warmup]:
+        for _ in ppl.run([(AttemptStub(path), None)]):
+            pass
+
+    timing.registry = timing.TimingRegistry()
+    measured = paths[warmup:]
+
+    started_at = time.time()
+    for _ in ppl.run((AttemptStub(path), None) for path in measured):
+        pass
+    elapsed = time.time() - started_at
+
+    return {
+        'attempts': len(measured),
+        'elapsed': elapsed,
+        'throughput': len(measured) / elapsed if elapsed else 0,
+        'peak_memory': peak_memory(),
+        'pipes': timing.registry.snapshot(),
+    }
+
+
+def compare(report, baseline, tolerance=0.1, min_time=0.001):
+    """
+    Returns a list of (metric, value, baseline value, relative change,
+    is_regression) comparing `report` to `baseline`.
+
+    :param tolerance: (optional) relative change tolerated before a regression.
+    :param min_time: (optional) pipe times below this are considered noise, in seconds.
+    """
+    def change(value, base_value):
+        return (value - base_value) / base_value if base_value else 0
+
+    result = []
+    delta = change(report['throughput'], baseline['throughput'])
+    result.append(('throughput (attempts/s)', report['throughput'],
+                   baseline['throughput'], delta, -delta > tolerance))
+
+    delta = change(report['peak_memory'], baseline['peak_memory'])
+    result.append(('peak memory (MB)', report['peak_memory'],
+                   baseline['peak_memory'], delta, delta > tolerance))
+
+    for name in sorted(report['pipes']):
+        if name not in baseline['pipes']:
+            continue
+
+        value = report['pipes'][name]['wall']['p50']
+        base_value = baseline['pipes'][name]['wall']['p50']
+        delta = change(value, base_value)
+        result.append(('%s wall p50 (ms)' % name, value * 1000, base_value * 1000, delta,
+                       delta > tolerance and max(value, base_value) >= min_time))
+
+    return result
+
+
+def print_report(report, comparison=None, out=sys.stdout):
+    out.write('attempts: %(attempts)s  elapsed: %(elapsed).2fs  '
+              'throughput: %(throughput).2f attempts/s  '
+              'peak memory: %(peak_memory).1f MB\n\n' % report)
+
+    out.write('%-50s %10s %10s %10s\n' % ('pipe', 'wall p50', 'wall p95', 'cpu p50'))
+    for name, hists in sorted(report['pipes'].items()):
+        # CPU time is not recorded on every platform.
+        cpu = '%9.2fms' % (hists['cpu']['p50'] * 1000) if hists['cpu']['count'] else '%10s' % '-'
+        out.write('%-50s %9.2fms %9.2fms %s\n' % (name,
+            hists['wall']['p50'] * 1000, hists['wall']['p95'] * 1000, cpu))
+
+    if comparison:
+        out.write('\n%-60s %10s %10s %8s\n' % ('metric', 'current', 'baseline', 'change'))
+        for metric, value, base_value, delta, is_regression in comparison:
+            out.write('%-60s %10.2f %10.2f %+7.1f%% %s\n' % (metric, value, base_value,
+                delta * 100, 'REGRESSION' if is_regression else ''))
+
+
+if __name__ == '__main__':
+    utils.setup_logging()
+
+    parser = argparse.ArgumentParser(description=u'Validation throughput benchmark')
+    parser.add_argument('-n', '--packages', type=int, default=50)
+    parser.add_argument('--references', type=int, default=30)
+    parser.add_argument('--authors', type=int, default=5)
+    parser.add_argument('--images', type=int, default=2)
+    parser.add_argument('--image-size', type=int, default=512 * 1024,
+                        help='size of each image, in bytes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rule-workers', type=int, default=4)
+    parser.add_argument('--manager-latency', type=float, default=0,
+                        help='latency of SciELO Manager lookups, in seconds')
+    parser.add_argument('--doi-latency', type=float, default=0,
+                        help='latency of DOI checks, in seconds')
+    parser.add_argument('--save', help='write the report to this file, as JSON')
+    parser.add_argument('--baseline', help='compare to the report saved at this file')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='relative change tolerated before a regression')
+
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='balaio-benchmark-')
+    try:
+        paths = generate_corpus(directory, args.packages + 1, seed=args.seed,
+                                references=args.references, authors=args.authors,
+                                images=args.images, image_size=args.image_size)
+        report = run(paths, manager_latency=args.manager_latency,
+                     doi_latency=args.doi_latency, rule_workers=args.rule_workers)
+    finally:
+        shutil.rmtree(directory)
+
+    comparison = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            comparison = compare(report, json.load(f), tolerance=args.tolerance)
+
+    print_report(report, comparison)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if comparison and any(row[-1] for row in comparison):
+        sys.exit(1)
@@ -0,0 +1,166 @@
+#coding: utf-8
+"""
+On-disk cache of SciELO Manager lookups, shared by the processes
+running on the same host.
+
+Entries are stored in a SQLite database, with time-to-live expiration
+and least recently used eviction. Lookups that found nothing are cached
+as well, for a shorter period.
+"""
+import json
+import time
+import urllib
+import logging
+import sqlite3
+import threading
+
+
+logger = logging.getLogger('balaio.cache')
+
+# marks cached lookups that found nothing.
+MISSING = object()
+
+
+def make_key(namespace, **criteria):
+    """
+    Builds a cache key from the lookup criteria.
+
+    Criteria with empty values are ignored, so that equivalent
+    lookups share the same key.
+
+    :param namespace: the kind of the lookup, e.g. `issue`.
+    """
+    items = sorted((k, v) for k, v in criteria.items() if v)
+    return '%s?%s' % (namespace, urllib.urlencode(items))
+
+
+class DiskCache(object):
+    """
+    Key-value store for JSON serializable values.
+    """
+    def __init__(self, path, ttl=3600, negative_ttl=300, max_entries=10000):
+        """
+        :param path: path to the SQLite database file.
+        :param ttl: (optional) seconds a value is kept.
+        :param negative_ttl: (optional) seconds a missing value is kept.
+        :param max_entries: (optional) max number of entries.
+        """
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+
+        self._local = threading.local()
+        self._setup()
+
+    @property
+    def _conn(self):
+        """
+        SQLite connections cannot be shared among threads.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10,
+                isolation_level=None)
+        return conn
+
+    def _setup(self):
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS entry (
+            key TEXT PRIMARY KEY,
+            issn TEXT,
+            value TEXT,
+            expires_at REAL NOT NULL,
+            accessed_at REAL NOT NULL)""")
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_entry_issn ON entry (issn)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_entry_accessed_at ON entry (accessed_at)')
+
+    def get(self, key):
+        """
+        Returns the value stored under `key`, :data:`MISSING` for cached
+        negative results, or None if `key` is unknown or expired.
+        """
+        now = time.time()
+        row = self._conn.execute(
+            'SELECT value FROM entry WHERE key = ? AND expires_at > ?',
+            (key, now)).fetchone()
+
+        if row is None:
+            return None
+
+        self._conn.execute('UPDATE entry SET accessed_at = ? WHERE key = ?', (now, key))
+        value, = row
+        return MISSING if value is None else json.loads(value)
+
+    def set(self, key, value, issn=None):
+        """
+        Stores `value` under `key`. :data:`MISSING` stores a negative result.
+
+        :param issn: (optional) ISSN the value refers to, used on invalidation.
+        """
+        now = time.time()
+        if value is MISSING:
+            data, ttl = None, self.negative_ttl
+        else:
+            data, ttl = json.dumps(value), self.ttl
+
+        self._conn.execute(
+            'INSERT OR REPLACE INTO entry (key, issn, value, expires_at, accessed_at) '
+            'VALUES (?, ?, ?, ?, ?)', (key, issn, data, now + ttl, now))
+        self._evict()
+
+    def _evict(self):
+        """
+        Removes the least recently used entries exceeding `max_entries`.
+        """
+        self._conn.execute('DELETE FROM entry WHERE key IN ('
+            'SELECT key FROM entry ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,))
+
+    def invalidate(self, key=None, issn=None):
+        """
+        Removes the entry stored under `key`, or all entries related
+        to `issn`, or all entries if none is given.
+        """
+        if key is not None:
+            self._conn.execute('DELETE FROM entry WHERE key = ?', (key,))
+        elif issn is not None:
+            self._conn.execute('DELETE FROM entry WHERE issn = ?', (issn,))
+        else:
+            self._conn.execute('DELETE FROM entry')
+
+    def get_or_fetch(self, key, fetch, issn=None):
+        """
+        Returns the value under `key`, calling `fetch` on cache misses.
+
+        `fetch` must raise ValueError when nothing is found. The negative
+        result is cached and the ValueError is raised again on every hit.
+        """
+        value = self.get(key)
+        if value is MISSING:
+            raise ValueError('cached negative result for %s' % key)
+        elif value is not None:
+            return value
+
+        try:
+            value = fetch()
+        except ValueError:
+            self.set(key, MISSING, issn=issn)
+            raise
+
+        self.set(key, value, issn=issn)
+        return value
+
+
+def cache_from_config(config):
+    """
+    Returns a :class:`DiskCache` set at `[manager] cache_path`, or
+    None if the cache is disabled.
+    """
+    if not (config.has_option('manager', 'cache_path') and
+            config.get('manager', 'cache_path')):
+        return None
+
+    return DiskCache(config.get('manager', 'cache_path'),
+                     ttl=config.getint('manager', 'cache_ttl'),
+                     negative_ttl=config.getint('manager', 'cache_negative_ttl'),
+                     max_entries=config.getint('manager', 'cache_max_entries'))
@@ -6,12 +6,15 @@ from StringIO import StringIO
 from multiprocessing.dummy import Pool as ThreadPool
 
 import transaction
-import scieloapi
 
 import utils
+import cache
 import models
 import meta_extractor
-from uploader import StaticScieloBackend
+import rules
+import snapshot
+import manager
+from uploader import StaticScieloBackend, BackendPool
 
 
 FILES_EXTENSION = ['xml', 'pdf',]
@@ -46,7 +49,7 @@ def upload_static_files(attempt, conn_static):
     Send the ``PDF``, ``XML`` files to the static server
 
     :param attempt: Attempt object
-    :param conn_static: connection with static server
+    :param conn_static: connection with static server, or a pool of connections
     """
     uri_dict = {}
     filename_list = []
@@ -76,19 +79,21 @@ def upload_static_files(attempt, conn_static):
         return uri_dict
 
 
-def upload_meta_front(attempt, client, uri_dict):
+def upload_meta_front(attempt, client, uri_dict, manager_cache=None, manager_snapshot=None):
     """
     Send the extracted front to SciELO Manager
 
     :param attempt: Attempt object
     :param cfg: cfguration file
     :param uri_dict: dict content the uri to the static file
+    :param manager_cache: (optional) instance of :class:`cache.DiskCache`
+    :param manager_snapshot: (optional) instance of :class:`snapshot.ManagerSnapshot`
     """
     dict_filter = {}
 
     ppl =  meta_extractor.get_meta_ppl()
 
-    xml = attempt.analyzer.xml
+    xml = rules.get_matches(attempt.analyzer, group='meta')
 
     articlepkg = attempt.articlepkg
 
@@ -100,7 +105,24 @@ def upload_meta_front(attempt, client, uri_dict):
     dict_filter['suppl_volume'] = articlepkg.issue_suppl_volume if articlepkg.issue_suppl_volume else None
     dict_filter['publication_year'] = articlepkg.issue_year if articlepkg.issue_year else None
 
-    issue = next(client.issues.filter(**dict_filter))
+    def fetch_issue():
+        try:
+            return next(client.issues.filter(**dict_filter))
+        except StopIteration:
+            raise ValueError('issue not found')
+
+    issue = None
+    if manager_snapshot is not None:
+        issue = manager_snapshot.find_issue(
+            print_issn=dict_filter['pissn'], eletronic_issn=dict_filter['eissn'],
+            **dict((k, v) for k, v in dict_filter.items() if k not in ('pissn', 'eissn')))
+
+    if issue is None:
+        if manager_cache is None:
+            issue = next(client.issues.filter(**dict_filter))
+        else:
+            issue = manager_cache.get_or_fetch(cache.make_key('checkout-issue', **dict_filter),
+                fetch_issue, issn=dict_filter['pissn'] or dict_filter['eissn'])
 
     data = {
         'issue': issue['resource_uri'],
@@ -122,7 +144,7 @@ def checkout_procedure(item):
 
     :param attempt: item (Attempt, cfg)
     """
-    attempt, client, conn = item
+    attempt, client, conn, manager_cache, manager_snapshot = item
 
     logger.info("Starting checkout to attempt: %s" % attempt)
 
@@ -134,27 +156,35 @@ def checkout_procedure(item):
 
     logger.info("Upload static files for attempt: %s" % attempt)
 
-    upload_meta_front(attempt, client, uri_dict)
+    upload_meta_front(attempt, client, uri_dict, manager_cache=manager_cache,
+                      manager_snapshot=manager_snapshot)
 
     logger.info("Set queued_checkout to False attempt: %s" % attempt)
 
     attempt.queued_checkout = False
 
 
-def main(config):
+def main(config, engine):
 
     session = models.Session()
 
-    client = scieloapi.Client(config.get('manager', 'api_username'),
-                              config.get('manager', 'api_key'),
-                              config.get('manager', 'api_url'), 'v1')
+    client = manager.client_from_config(config)
 
-    conn = StaticScieloBackend(config.get('static_server', 'username'),
-                               config.get('static_server', 'password'),
-                               config.get('static_server', 'path'),
-                               config.get('static_server', 'host'))
+    # each thread uploads through its own connection.
+    if config.has_option('checkout', 'workers'):
+        workers = config.getint('checkout', 'workers')
+    else:
+        workers = 4
+    conn = BackendPool(lambda: StaticScieloBackend(config.get('static_server', 'username'),
+                                                   config.get('static_server', 'password'),
+                                                   config.get('static_server', 'path'),
+                                                   config.get('static_server', 'host')),
+                       size=workers)
 
-    pool = ThreadPool()
+    manager_cache = cache.cache_from_config(config)
+    manager_snapshot = snapshot.snapshot_from_config(config, engine)
+
+    pool = ThreadPool(workers)
 
     while True:
 
@@ -169,7 +199,7 @@ def main(config):
 
             try:
                 for attempt in attempts_checkout:
-                    checkout_lst.append((attempt, client, conn))
+                    checkout_lst.append((attempt, client, conn, manager_cache, manager_snapshot))
 
                 #Execute the checkout procedure for each item
                 pool.map(checkout_procedure, checkout_lst)
@@ -188,8 +218,9 @@ if __name__ == '__main__':
     utils.setup_logging()
     config = utils.balaio_config_from_env()
 
-    models.Session.configure(bind=models.create_engine_from_config(config))
+    engine = models.create_engine_from_config(config)
+    models.Session.configure(bind=engine)
 
     print('Start checkout process...')
 
-    main(config)
+    main(config, engine)
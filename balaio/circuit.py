@@ -0,0 +1,217 @@
+#coding: utf-8
+"""
+Circuit breakers and rate limiters of remote dependencies, e.g. SciELO
+Manager and dx.doi.org.
+
+The state of each dependency is kept in a SQLite database, shared by the
+processes running on the same host. After `failure_threshold` consecutive
+failures the circuit opens, and calls fail immediately with
+:class:`excepts.CircuitOpenError` during `reset_timeout` seconds. Then a
+single call is let through: its success closes the circuit, its failure
+opens it again.
+
+Calls are also limited to `rate` per second, with bursts of up to `burst`
+calls, by a token bucket. Calls exceeding the rate wait for their turn.
+"""
+import time
+import logging
+import sqlite3
+import threading
+import contextlib
+
+import utils
+import excepts
+
+
+logger = logging.getLogger('balaio.circuit')
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+_COLUMNS = ('state', 'failures', 'open_until', 'tokens', 'refilled_at')
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class StateStore(object):
+    """
+    Circuit and token bucket states, by dependency name.
+    """
+    def __init__(self, path):
+        """
+        :param path: path to the SQLite database file.
+        """
+        self.path = path
+        self._local = threading.local()
+        self._setup()
+
+    @property
+    def _conn(self):
+        """
+        SQLite connections cannot be shared among threads.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10,
+                isolation_level=None)
+        return conn
+
+    def _setup(self):
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS circuit (
+            name TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            failures INTEGER NOT NULL,
+            open_until REAL NOT NULL,
+            tokens REAL NOT NULL,
+            refilled_at REAL NOT NULL)""")
+
+    def get(self, name):
+        """
+        Returns the state of `name` as a dict, or None if it is unknown.
+        """
+        row = self._conn.execute('SELECT %s FROM circuit WHERE name = ?' % ', '.join(_COLUMNS),
+                                 (name,)).fetchone()
+        return dict(zip(_COLUMNS, row)) if row is not None else None
+
+    @contextlib.contextmanager
+    def update(self, name, tokens):
+        """
+        Yields the state of `name`, that is written back on exit, holding
+        the database lock meanwhile.
+
+        :param tokens: tokens of the bucket of an unknown `name`.
+        """
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            state = self.get(name) or dict(state=CLOSED, failures=0, open_until=0,
+                                           tokens=tokens, refilled_at=time.time())
+            original = dict(state)
+            yield state
+
+            if state != original:
+                conn.execute('INSERT OR REPLACE INTO circuit (name, %s) VALUES (?, ?, ?, ?, ?, ?)' % (
+                    ', '.join(_COLUMNS)), [name] + [state[column] for column in _COLUMNS])
+        except:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+
+class Guard(object):
+    """
+    Circuit breaker and rate limiter of the calls to a dependency.
+    """
+    def __init__(self, name, store, failure_threshold=5, reset_timeout=30, rate=0, burst=1):
+        """
+        :param name: name of the dependency, e.g. `manager`.
+        :param store: instance of :class:`StateStore`.
+        :param failure_threshold: (optional) consecutive failures that open the circuit.
+        :param reset_timeout: (optional) seconds the circuit stays open.
+        :param rate: (optional) max calls per second. 0 means unlimited.
+        :param burst: (optional) max calls at once, within the rate.
+        """
+        self.name = name
+        self.store = store
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.rate = rate
+        self.burst = burst
+
+        # known open circuit, checked without touching the store.
+        self._open_until = 0
+
+    def _acquire(self):
+        """
+        Checks the circuit and takes a token from the bucket.
+        Returns the seconds to wait before calling.
+        """
+        now = time.time()
+        with self.store.update(self.name, self.burst) as state:
+            if state['state'] != CLOSED:
+                if now < state['open_until']:
+                    self._open_until = state['open_until']
+                    raise excepts.CircuitOpenError('%s is unavailable' % self.name)
+
+                # this is the trial call. Others are rejected until it
+                # ends, or until `reset_timeout` if it is lost.
+                state['state'] = HALF_OPEN
+                state['open_until'] = now + self.reset_timeout
+
+            if not self.rate:
+                return 0
+
+            state['tokens'] = min(self.burst,
+                                  state['tokens'] + (now - state['refilled_at']) * self.rate) - 1
+            state['refilled_at'] = now
+
+        # the token is taken in advance, so the waiting calls are queued.
+        return -state['tokens'] / self.rate if state['tokens'] < 0 else 0
+
+    def _record(self, failed):
+        if not failed:
+            state = self.store.get(self.name)
+            if state is None or (state['state'] == CLOSED and not state['failures']):
+                return None
+
+        with self.store.update(self.name, self.burst) as state:
+            if failed:
+                state['failures'] += 1
+                if state['state'] == HALF_OPEN or state['failures'] >= self.failure_threshold:
+                    if state['state'] != OPEN:
+                        logger.warning('Circuit of %s opened for %s seconds' % (
+                            self.name, self.reset_timeout))
+                    state['state'] = OPEN
+                    state['open_until'] = self._open_until = time.time() + self.reset_timeout
+            else:
+                if state['state'] != CLOSED:
+                    logger.info('Circuit of %s closed' % self.name)
+                state.update(state=CLOSED, failures=0, open_until=0)
+
+    def call(self, func, *args, **kwargs):
+        """
+        Returns `func(*args, **kwargs)`, or raises :class:`excepts.CircuitOpenError`
+        if the circuit is open.
+
+        Only errors caused by unavailable dependencies count as failures,
+        see :func:`utils.is_transient_error`.
+        """
+        if time.time() < self._open_until:
+            raise excepts.CircuitOpenError('%s is unavailable' % self.name)
+
+        wait = self._acquire()
+        if wait:
+            time.sleep(wait)
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            # other errors are answers of an available dependency.
+            self._record(failed=utils.is_transient_error(e))
+            raise
+
+        self._record(failed=False)
+        return result
+
+
+def guard_from_config(config, name):
+    """
+    Returns the :class:`Guard` of the dependency `name`, set up by the
+    `[circuit]` section, or None if `path` is empty.
+
+    :param name: the prefix of the `rate` and `burst` options, e.g. `manager`.
+    """
+    if not (config.has_option('circuit', 'path') and config.get('circuit', 'path')):
+        return None
+
+    path = config.get('circuit', 'path')
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = StateStore(path)
+
+    return Guard(name, _stores[path],
+                 failure_threshold=config.getint('circuit', 'failure_threshold'),
+                 reset_timeout=config.getint('circuit', 'reset_timeout'),
+                 rate=config.getfloat('circuit', '%s_rate' % name),
+                 burst=config.getint('circuit', '%s_burst' % name))
@@ -0,0 +1,204 @@
+#coding: utf-8
+"""
+Delivery of the notifications written to the outbox by :class:`notifier.Notifier`.
+
+Notifications are delivered to SciELO Manager in batches, in order per
+attempt: the checkin of an attempt is always delivered before its notices.
+When the delivery of a notification fails because Manager is unavailable,
+it is retried with exponential backoff, and the following notifications
+of the same attempt wait for it. Notifications rejected by Manager are
+marked as failed and are not retried. When the rejected notification is
+a checkin, the pending notifications of its attempt fail with it.
+
+Delivery is at-least-once: a notification may be delivered again if the
+dispatcher dies before committing its batch. Only one dispatcher process
+must run at a time.
+"""
+import time
+import random
+import logging
+import datetime
+
+import transaction
+from sqlalchemy import func
+
+import utils
+import models
+import notifier
+import manager
+
+
+logger = logging.getLogger('balaio.dispatcher')
+
+
+def deliver(client, notification):
+    """
+    Posts `notification` to SciELO Manager.
+
+    :param client: instance of `scieloapi.Client`.
+    :param notification: instance of :class:`models.Notification`.
+    """
+    attempt = notification.attempt
+
+    if notification.kind != 'checkin' and attempt.checkin_uri is None:
+        raise ValueError('attempt %s has no checkin' % attempt.id)
+
+    if notification.kind == 'checkin':
+        payload = notification.payload
+        # the article is kept, so retries do not create it again.
+        if 'article' not in payload:
+            resource_id = client.checkins_articles.post(notifier.checkin_article_data(attempt))
+            payload['article'] = '/api/v1/checkins_articles/%s/' % resource_id
+            notification.payload = payload
+
+        resource_id = client.checkins.post(notifier.checkin_data(attempt, payload['article']))
+        attempt.checkin_uri = '/api/v1/checkins/%s/' % resource_id
+
+    elif notification.kind in ('notice', 'checkout'):
+        data = notification.payload
+        data['checkin'] = attempt.checkin_uri
+        client.notices.post(data)
+
+    elif notification.kind == 'notices':
+        payload = notification.payload
+        data = {'checkpoint': payload['checkpoint'], 'checkin': attempt.checkin_uri}
+        # the notices posted one by one are kept, so retries do not post them again.
+        try:
+            notifier.post_notices(client, data, payload['notices'], progress=payload)
+        finally:
+            notification.payload = payload
+
+    else:
+        raise ValueError('unknown notification kind %s' % notification.kind)
+
+
+class Dispatcher(object):
+    """
+    Delivers the pending notifications of the outbox.
+    """
+    def __init__(self, client, batch_size=100, retry_base_delay=30, retry_max_delay=3600):
+        """
+        :param client: instance of `scieloapi.Client`.
+        :param batch_size: (optional) max number of notifications delivered per transaction.
+        :param retry_base_delay: (optional) seconds before the first retry of a notification.
+        :param retry_max_delay: (optional) max seconds between retries of a notification.
+        """
+        self.client = client
+        self.batch_size = batch_size
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+
+    def _load_batch(self, session):
+        """
+        Returns the next pending notifications, of the attempts whose
+        oldest pending notification is due.
+        """
+        now = datetime.datetime.now()
+        Notification = models.Notification
+        is_pending = (Notification.sent_at == None) & (Notification.failed_at == None)
+
+        heads = session.query(func.min(Notification.id)).filter(
+            is_pending).group_by(Notification.attempt_id).subquery()
+        due_attempts = session.query(Notification.attempt_id).filter(
+            Notification.id.in_(heads)).filter(
+            (Notification.next_try_at == None) | (Notification.next_try_at <= now))
+
+        return session.query(Notification).filter(is_pending).filter(
+            Notification.attempt_id.in_(due_attempts)).order_by(
+            Notification.id).limit(self.batch_size).all()
+
+    def _retry_later(self, notification, error):
+        delay = min(self.retry_max_delay,
+                    self.retry_base_delay * 2 ** notification.tries) * random.uniform(0.5, 1)
+        notification.tries += 1
+        notification.next_try_at = datetime.datetime.now() + datetime.timedelta(seconds=delay)
+        notification.last_error = unicode(error)
+
+    def _fail(self, notification, error):
+        notification.tries += 1
+        notification.failed_at = datetime.datetime.now()
+        notification.last_error = unicode(error)
+
+    def _fail_pending(self, session, attempt_id, error):
+        """
+        Fails the pending notifications of an attempt whose checkin was rejected.
+        """
+        Notification = models.Notification
+        pending = session.query(Notification).filter_by(attempt_id=attempt_id).filter(
+            Notification.sent_at == None).filter(Notification.failed_at == None)
+
+        for notification in pending:
+            notification.failed_at = datetime.datetime.now()
+            notification.last_error = u'Checkin rejected: %s' % error
+
+    def run_once(self):
+        """
+        Delivers a batch of notifications, in a single transaction.
+        Returns the total of notifications processed.
+        """
+        session = models.Session()
+        blocked = set()
+        notifications = self._load_batch(session)
+
+        for notification in notifications:
+            if notification.attempt_id in blocked:
+                continue
+
+            try:
+                deliver(self.client, notification)
+            except Exception as e:
+                if utils.is_transient_error(e):
+                    logger.warning('Could not deliver notification %s: %s. Retrying later.' % (
+                        notification.id, e))
+                    self._retry_later(notification, e)
+                    # the following notifications of the attempt must wait.
+                    blocked.add(notification.attempt_id)
+                else:
+                    logger.error('Notification %s was rejected: %s' % (notification.id, e))
+                    self._fail(notification, e)
+                    if notification.kind == 'checkin':
+                        # the notices cannot be delivered without a checkin.
+                        blocked.add(notification.attempt_id)
+                        self._fail_pending(session, notification.attempt_id, e)
+            else:
+                notification.tries += 1
+                notification.sent_at = datetime.datetime.now()
+
+        try:
+            transaction.commit()
+        except Exception as e:
+            logger.error('Could not commit the delivered notifications: %s' % e)
+            transaction.abort()
+        finally:
+            session.close()
+
+        return len(notifications)
+
+    def start(self, poll_interval=10):
+        """
+        Runs forever, delivering full batches without waiting.
+
+        :param poll_interval: seconds between lookups for pending notifications.
+        """
+        while True:
+            while self.run_once() >= self.batch_size:
+                pass
+            time.sleep(poll_interval)
+
+
+if __name__ == '__main__':
+    utils.setup_logging()
+    config = utils.balaio_config_from_env()
+
+    engine = models.create_engine_from_config(config)
+    models.Session.configure(bind=engine)
+
+    client = manager.client_from_config(config)
+
+    print('Start dispatcher process...')
+
+    Dispatcher(client,
+               batch_size=config.getint('dispatcher', 'batch_size'),
+               retry_base_delay=config.getint('dispatcher', 'retry_base_delay'),
+               retry_max_delay=config.getint('dispatcher', 'retry_max_delay')).start(
+        poll_interval=config.getint('dispatcher', 'poll_interval'))
@@ -0,0 +1,205 @@
+#coding: utf-8
+"""
+Resolution of DOIs at doi.org, backed by the `doi_status` relation.
+"""
+import time
+import datetime
+import logging
+import threading
+import urlparse
+from multiprocessing.dummy import Pool as ThreadPool
+
+import requests
+from requests.exceptions import RequestException
+from sqlalchemy.exc import IntegrityError
+
+import models
+import excepts
+import circuit
+
+
+logger = logging.getLogger('balaio.doi')
+
+DOI_XPATH = './/article-id/[@pub-id-type="doi"]'
+
+RESOLVER_URL = 'https://doi.org/%s'
+
+# doi.org redirects registered DOIs to their landing pages, elsewhere.
+REDIRECT_STATUS_CODES = (302, 303)
+NOT_FOUND_STATUS_CODE = 404
+
+
+class DOIResolver(object):
+    """
+    Checks if DOIs are registered at doi.org.
+
+    Known statuses are kept in the `doi_status` relation, registered DOIs for
+    `ttl` seconds and unregistered ones for `negative_ttl` seconds. Remote
+    checks share keep-alive HTTP connections and may be started ahead of
+    time, concurrently, with :meth:`prefetch`. Prefetched statuses are
+    stored as soon as they are known, even if they are never looked up.
+
+    After a network failure, the resolver is considered offline during
+    `outage_backoff` seconds and every check returns None, i.e. unknown.
+    The same happens while the circuit of `guard` is open.
+    """
+    def __init__(self, engine, ttl=2592000, negative_ttl=86400, timeout=2.5,
+                 workers=8, outage_backoff=60, guard=None):
+        """
+        :param engine: sqlalchemy engine.
+        :param ttl: (optional) seconds a registered DOI is not checked again.
+        :param negative_ttl: (optional) seconds an unregistered DOI is not checked again.
+        :param timeout: (optional) timeout of remote checks, in seconds.
+        :param workers: (optional) max number of concurrent remote checks.
+        :param outage_backoff: (optional) seconds offline after a network failure.
+        :param guard: (optional) instance of :class:`circuit.Guard`, shared by the processes.
+        """
+        self.engine = engine
+        self.ttl = datetime.timedelta(seconds=ttl)
+        self.negative_ttl = datetime.timedelta(seconds=negative_ttl)
+        self.timeout = timeout
+        self.outage_backoff = outage_backoff
+        self.guard = guard
+
+        self.http = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.http.mount('https://', adapter)
+
+        self._pool = ThreadPool(workers)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._offline_until = 0
+
+    @property
+    def is_offline(self):
+        return time.time() < self._offline_until
+
+    def _fetch_remote(self, doi):
+        """
+        Returns the registration status of `doi` at doi.org, or None
+        if it could not be verified.
+        """
+        if self.is_offline:
+            return None
+
+        url = RESOLVER_URL % doi
+        try:
+            if self.guard is not None:
+                resp = self.guard.call(self.http.head, url,
+                                       allow_redirects=False, timeout=self.timeout)
+            else:
+                resp = self.http.head(url, allow_redirects=False, timeout=self.timeout)
+        except excepts.CircuitOpenError as e:
+            logger.debug('Can not validate doi %s: %s' % (doi, e))
+            return None
+        except RequestException as e:
+            logger.error('Can not validate doi: %s. Retrying in %s seconds.' % (e, self.outage_backoff))
+            self._offline_until = time.time() + self.outage_backoff
+            return None
+
+        return self._is_registered(resp)
+
+    def _is_registered(self, resp):
+        """
+        Registered DOIs are redirected away from doi.org, and unregistered
+        ones are not found. Other answers, e.g. a redirect to the doi.org
+        error page, are unknown.
+        """
+        if resp.status_code == NOT_FOUND_STATUS_CODE:
+            return False
+
+        if resp.status_code in REDIRECT_STATUS_CODES:
+            host = urlparse.urlparse(resp.headers.get('location', '')).hostname or ''
+            if host and host != 'doi.org' and not host.endswith('.doi.org'):
+                return True
+
+        return None
+
+    def _get_stored(self, doi):
+        table = models.DOIStatus.__table__
+        row = self.engine.execute(table.select().where(table.c.doi == doi)).first()
+        if row is None:
+            return None
+
+        ttl = self.ttl if row.is_registered else self.negative_ttl
+        if row.checked_at + ttl < datetime.datetime.now():
+            return None
+
+        return row.is_registered
+
+    def _store(self, doi, is_registered):
+        table = models.DOIStatus.__table__
+        values = dict(is_registered=is_registered, checked_at=datetime.datetime.now())
+
+        result = self.engine.execute(table.update().where(table.c.doi == doi).values(**values))
+        if not result.rowcount:
+            try:
+                self.engine.execute(table.insert().values(doi=doi, **values))
+            except IntegrityError:
+                # stored concurrently by another worker.
+                pass
+
+    def _prefetch_one(self, doi):
+        """
+        Checks `doi` at doi.org and stores its status, in background.
+        """
+        try:
+            is_registered = self._fetch_remote(doi)
+            if is_registered is not None:
+                self._store(doi, is_registered)
+            return is_registered
+        finally:
+            with self._lock:
+                self._pending.pop(doi, None)
+
+    def prefetch(self, dois):
+        """
+        Starts checking `dois` concurrently, in background.
+
+        :param dois: iterable of DOIs.
+        """
+        with self._lock:
+            for doi in set(dois):
+                if doi in self._pending or self._get_stored(doi) is not None:
+                    continue
+                self._pending[doi] = self._pool.apply_async(self._prefetch_one, (doi,))
+
+    def __call__(self, doi):
+        """
+        Returns a bool indicating if `doi` is registered, or None if
+        it could not be verified.
+        """
+        with self._lock:
+            pending = self._pending.get(doi)
+
+        if pending is not None:
+            # the prefetch stores the status, even after this timeout.
+            try:
+                return pending.get(self.timeout * 2)
+            except Exception as e:
+                logger.error('Can not validate doi %s: %s' % (doi, e))
+                return None
+
+        # finished prefetches are stored before they stop being pending.
+        is_registered = self._get_stored(doi)
+        if is_registered is not None:
+            return is_registered
+
+        is_registered = self._fetch_remote(doi)
+        if is_registered is not None:
+            self._store(doi, is_registered)
+
+        return is_registered
+
+
+def resolver_from_config(config, engine):
+    """
+    Returns a :class:`DOIResolver` set up by the `[doi]` section.
+    """
+    return DOIResolver(engine,
+                       ttl=config.getint('doi', 'ttl'),
+                       negative_ttl=config.getint('doi', 'negative_ttl'),
+                       timeout=config.getfloat('doi', 'timeout'),
+                       workers=config.getint('doi', 'workers'),
+                       outage_backoff=config.getint('doi', 'outage_backoff'),
+                       guard=circuit.guard_from_config(config, 'doi'))
@@ -3,3 +3,19 @@ class DuplicatedPackage(Exception):
     Raised when a duplicated package is submitted to checkin.
     """
     pass
+
+
+class TransientError(Exception):
+    """
+    Raised when a dependency is temporarily unavailable. The operation
+    may succeed if retried later.
+    """
+    pass
+
+
+class CircuitOpenError(TransientError):
+    """
+    Raised when a dependency is not called because its circuit
+    breaker is open.
+    """
+    pass
@@ -1,7 +1,7 @@
 #coding: utf-8
 import datetime
 
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import OperationalError, DBAPIError
 
 
 class CheckItem(object):
@@ -83,3 +83,55 @@ class DBConnection(CheckItem):
         else:
             return True
 
+
+class ReplicaLag(CheckItem):
+    """
+    The DB replica must be available and up to date with the primary.
+    """
+    def __init__(self, engine, max_lag, refresh=5):
+        """
+        :param engine: sqlalchemy engine bound to the replica.
+        :param max_lag: max acceptable replication lag, in seconds.
+        :param refresh: (optional) refresh rate in seconds.
+        """
+        self.engine = engine
+        self.max_lag = max_lag
+
+        self._refresh_rate = datetime.timedelta(seconds=refresh)
+        self._refreshed_at = None
+        self._status = False
+
+    def lag(self):
+        """
+        Seconds since the last transaction replayed by the replica, or 0
+        if the replica has replayed all the WAL it received, i.e. the
+        primary had no writes since.
+
+        Returns None when the backend cannot tell it, i.e. the server
+        is not a PostgreSQL standby.
+        """
+        if self.engine.dialect.name != 'postgresql':
+            return None
+
+        return self.engine.scalar(
+            'SELECT CASE WHEN pg_last_xlog_receive_location() = pg_last_xlog_replay_location() '
+            'THEN 0 ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END')
+
+    def __call__(self):
+        """
+        Measures the replication lag respecting the refresh rate.
+        """
+        now = datetime.datetime.now()
+        if self._refreshed_at is None or (
+            self._refreshed_at + self._refresh_rate <= now):
+
+            try:
+                lag = self.lag()
+            except DBAPIError:
+                self._status = False
+            else:
+                self._status = lag is None or lag <= self.max_lag
+
+            self._refreshed_at = now
+
+        return self._status
@@ -13,6 +13,7 @@ from sqlalchemy.exc import DataError
 
 import models
 import health
+import archive
 
 
 def get_query_filters(model, request_params):
@@ -39,7 +40,8 @@ def package(request):
     Get a single object and return a serialized dict
     """
 
-    article = request.db.query(models.ArticlePkg).get(request.matchdict['id'])
+    article = request.db.query(models.ArticlePkg).options(
+        *models.ArticlePkg.serialization_options()).get(request.matchdict['id'])
 
     if article is None:
         return HTTPNotFound()
@@ -57,7 +59,9 @@ def list_package(request):
     offset = request.params.get('offset', 0)
 
     filters = get_query_filters(models.ArticlePkg, request.params)
-    articles = request.db.query(models.ArticlePkg).filter_by(**filters).limit(limit).offset(offset)
+    articles = request.db.query(models.ArticlePkg).options(
+        *models.ArticlePkg.serialization_options()).filter_by(
+        **filters).order_by(models.ArticlePkg.id).limit(limit).offset(offset)
 
     return {'limit': limit,
             'offset': offset,
@@ -71,7 +75,12 @@ def attempt(request):
     """
     Get a single object and return a serialized dict
     """
-    attempt = request.db.query(models.Attempt).get(request.matchdict['id'])
+    attempt = request.db.query(models.Attempt).options(
+        *models.Attempt.serialization_options()).get(request.matchdict['id'])
+
+    if not attempt:
+        # closed attempts may have been moved to the archive.
+        attempt = archive.get_archived_attempt(request.db, request.matchdict['id'])
 
     if not attempt:
         return HTTPNotFound()
@@ -89,7 +98,9 @@ def attempts(request):
     offset = request.params.get('offset', 0)
 
     filters = get_query_filters(models.Attempt, request.params)
-    attempts = request.db.query(models.Attempt).filter_by(**filters).limit(limit).offset(offset)
+    attempts = request.db.query(models.Attempt).options(
+        *models.Attempt.serialization_options()).filter_by(
+        **filters).order_by(models.Attempt.id).limit(limit).offset(offset)
 
     return {'limit': limit,
             'offset': offset,
@@ -246,15 +257,25 @@ def get_file_from_attempt(request):
     return response if has_body else HTTPBadRequest()
 
 
-def main(config, engine):
+def main(config, engine, replica_engine=None):
     """
     Returns a pyramid app.
 
     :param config: an instance of :class:`utils.Configuration`.
     :param engine: sqlalchemy engine.
+    :param replica_engine: (optional) sqlalchemy engine bound to a read replica.
     """
     def bind_db(event):
-        event.request.db = event.request.registry.Session()
+        """
+        GET requests are served by the replica, unless it is unavailable
+        or lagging behind the primary.
+        """
+        registry = event.request.registry
+        if (event.request.method == 'GET' and
+                registry.replica_lag is not None and registry.replica_lag()):
+            event.request.db = registry.ReplicaSession()
+        else:
+            event.request.db = registry.Session()
 
     def update_health_status(event):
         event.request.registry.health_status.update()
@@ -285,6 +306,17 @@ def main(config, engine):
     #DB session bound to each request
     config_pyrmd.registry.Session = models.ScopedSession
     config_pyrmd.registry.Session.configure(bind=engine)
+
+    # Read-only DB session bound to each GET request, if
+    # a replica is available.
+    if replica_engine is not None:
+        config_pyrmd.registry.ReplicaSession = models.ReplicaScopedSession
+        config_pyrmd.registry.ReplicaSession.configure(bind=replica_engine)
+        config_pyrmd.registry.replica_lag = health.ReplicaLag(replica_engine,
+            config.getint('app', 'db_replica_max_lag'))
+    else:
+        config_pyrmd.registry.replica_lag = None
+
     config_pyrmd.add_subscriber(bind_db, NewRequest)
 
     # Health check is available globally on the application
@@ -292,6 +324,8 @@ def main(config, engine):
     # periodically.
     check_list = health.CheckList(refresh=1)
     check_list.add_check(health.DBConnection(engine))
+    if replica_engine is not None:
+        check_list.add_check(config_pyrmd.registry.replica_lag)
 
     config_pyrmd.registry.health_status = check_list
     config_pyrmd.add_subscriber(update_health_status, NewRequest)
@@ -0,0 +1,137 @@
+#coding: utf-8
+"""
+Process-wide client of SciELO Manager.
+
+All the traffic to Manager goes through a single `scieloapi.Client`, whose
+requests share a pool of keep-alive connections. The client is thread-safe:
+at most `pool_size` requests run at once, and the other threads wait for
+a free connection.
+
+Requests may also be guarded by a :class:`circuit.Guard`. While the circuit
+is open, they fail immediately with `scieloapi.exceptions.ServiceUnavailable`.
+"""
+import logging
+import threading
+import functools
+
+import requests
+import scieloapi
+from scieloapi import httpbroker
+
+import excepts
+import circuit
+
+
+logger = logging.getLogger('balaio.manager')
+
+_client = None
+_lock = threading.Lock()
+
+
+class HTTPBroker(object):
+    """
+    Replacement of `scieloapi.httpbroker` that keeps the connections alive.
+
+    :param pool_size: (optional) max number of concurrent requests.
+    :param timeout: (optional) seconds to wait for a connection or a response.
+    :param guard: (optional) instance of :class:`circuit.Guard`.
+    """
+    def __init__(self, pool_size=10, timeout=10, guard=None):
+        self.timeout = timeout
+        self.guard = guard
+        self.session = requests.Session()
+
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=pool_size,
+                                                pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _optionals(self, url, auth, check_ca):
+        optionals = {'timeout': self.timeout}
+        if auth and all(auth):
+            optionals['auth'] = httpbroker.ApiKeyAuth(*auth)
+        if url.startswith('https'):
+            optionals['verify'] = check_ca
+
+        return optionals
+
+    def _request(self, method, url, **kwargs):
+        resp = getattr(self.session, method)(url, **kwargs)
+        httpbroker.check_http_status(resp)
+
+        return resp
+
+    def _guarded_request(self, method, url, **kwargs):
+        if self.guard is None:
+            return self._request(method, url, **kwargs)
+
+        try:
+            return self.guard.call(self._request, method, url, **kwargs)
+        except excepts.CircuitOpenError as e:
+            raise scieloapi.exceptions.ServiceUnavailable(e)
+
+    @httpbroker.translate_exceptions
+    def get(self, api_uri, endpoint=None, resource_id=None, params=None, auth=None, check_ca=False):
+        """
+        Same as `scieloapi.httpbroker.get`.
+        """
+        if not endpoint and resource_id:
+            raise ValueError('resource_id depends on an endpoint definition')
+
+        url = httpbroker._make_full_url(api_uri, endpoint, resource_id)
+        resp = self._guarded_request('get', url,
+                                     headers={'User-Agent': scieloapi.__user_agent__},
+                                     params=httpbroker.prepare_params(params),
+                                     **self._optionals(url, auth, check_ca))
+
+        return resp.json()
+
+    @httpbroker.translate_exceptions
+    def post(self, api_uri, data, endpoint=None, auth=None, check_ca=False):
+        """
+        Same as `scieloapi.httpbroker.post`.
+        """
+        url = httpbroker._make_full_url(api_uri, endpoint)
+        resp = self._guarded_request('post', url,
+                                     data=httpbroker.prepare_data(data),
+                                     headers={'User-Agent': scieloapi.__user_agent__,
+                                              'Content-Type': 'application/json'},
+                                     **self._optionals(url, auth, check_ca))
+
+        if resp.status_code != 201:
+            raise scieloapi.exceptions.APIError('The server gone nuts: %s' % resp.status_code)
+
+        return resp.headers['location']
+
+
+def create_client(username, api_key, api_uri=None, pool_size=10, timeout=10, guard=None):
+    """
+    Returns a `scieloapi.Client` backed by a :class:`HTTPBroker`.
+    """
+    connector = functools.partial(scieloapi.core.Connector,
+        http_broker=HTTPBroker(pool_size=pool_size, timeout=timeout, guard=guard))
+
+    return scieloapi.Client(username, api_key, api_uri=api_uri, connector_dep=connector)
+
+
+def client_from_config(config):
+    """
+    Returns the process-wide client, set up by the `[manager]` section
+    on the first call. `pool_size` and `timeout` are optional.
+    """
+    global _client
+    with _lock:
+        if _client is None:
+            options = {}
+            if config.has_option('manager', 'pool_size'):
+                options['pool_size'] = config.getint('manager', 'pool_size')
+            if config.has_option('manager', 'timeout'):
+                options['timeout'] = config.getfloat('manager', 'timeout')
+
+            _client = create_client(config.get('manager', 'api_username'),
+                                    config.get('manager', 'api_key'),
+                                    api_uri=config.get('manager', 'api_url'),
+                                    guard=circuit.guard_from_config(config, 'manager'),
+                                    **options)
+        return _client
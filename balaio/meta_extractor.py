@@ -1,12 +1,15 @@
 # coding: utf-8
 import plumber
 
+import rules
+
 class SetupPipe(plumber.Pipe):
 
     def transform(self, xml):
         return (xml, {})
 
 
+@rules.rule('.//title-group', group='meta')
 class TitlePipe(plumber.Pipe):
 
     def transform(self, item):
@@ -25,6 +28,7 @@ class TitlePipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//journal-title-group/abbrev-journal-title[@abbrev-type="publisher"]', group='meta')
 class AbbrevJournalTitlePipe(plumber.Pipe):
 
     def transform(self, item):
@@ -38,6 +42,7 @@ class AbbrevJournalTitlePipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//article-meta', './/article-meta/abstract', group='meta')
 class AbstractPipe(plumber.Pipe):
 
     def transform(self, item):
@@ -56,6 +61,7 @@ class AbstractPipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//journal-meta/journal-id[@journal-id-type="nlm-ta"]', group='meta')
 class JournalIDPipe(plumber.Pipe):
 
     def transform(self, item):
@@ -69,6 +75,7 @@ class JournalIDPipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//article-meta/lpage', group='meta')
 class LpagePipe(plumber.Pipe):
 
     def transform(self, item):
@@ -81,6 +88,7 @@ class LpagePipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//article-meta/fpage', group='meta')
 class FpagePipe(plumber.Pipe):
 
     def transform(self, item):
@@ -93,6 +101,7 @@ class FpagePipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//journal-title-group/journal-title', group='meta')
 class JournalTitlePipe(plumber.Pipe):
 
     def transform(self, item):
@@ -105,6 +114,7 @@ class JournalTitlePipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//contrib-group/contrib[@contrib-type="author"]', group='meta')
 class AuthorPipe(plumber.Pipe):
 
     def transform(self, item):
@@ -124,6 +134,7 @@ class AuthorPipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//article-meta/aff', group='meta')
 class AffiliationPipe(plumber.Pipe):
 
     def transform(self, item):
@@ -157,6 +168,7 @@ class AffiliationPipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//article-meta/kwd-group', group='meta')
 class KeywordPipe(plumber.Pipe):
 
     def transform(self, item):
@@ -182,6 +194,7 @@ class DefaultLanguagePipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//article-meta/volume', group='meta')
 class VolumePipe(plumber.Pipe):
 
     def transform(self, item):
@@ -194,6 +207,7 @@ class VolumePipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//article-meta/issue', group='meta')
 class NumberPipe(plumber.Pipe):
 
     def transform(self, item):
@@ -206,6 +220,7 @@ class NumberPipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//pub-date/', group='meta')
 class PubDatePipe(plumber.Pipe):
 
     def transform(self, item):
@@ -221,6 +236,7 @@ class PubDatePipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//journal-meta/issn[@pub-type="epub"]', group='meta')
 class ISSNPipe(plumber.Pipe):
 
     def transform(self, item):
@@ -233,6 +249,7 @@ class ISSNPipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//journal-meta/publisher/publisher-name', group='meta')
 class PublisherNamePipe(plumber.Pipe):
 
     def transform(self, item):
@@ -245,6 +262,7 @@ class PublisherNamePipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//article-meta/article-categories/subj-group', group='meta')
 class SubjectPipe(plumber.Pipe):
 
     def transform(slef, item):
@@ -260,6 +278,7 @@ class SubjectPipe(plumber.Pipe):
         return (xml, dict_data)
 
 
+@rules.rule('.//article-meta/article-id', group='meta')
 class PublisherIDPipe(plumber.Pipe):
 
     def transform(self, item):
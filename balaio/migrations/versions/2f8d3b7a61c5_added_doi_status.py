@@ -0,0 +1,29 @@
+"""Added doi status
+
+Revision ID: 2f8d3b7a61c5
+Revises: 6a2e91c4d8f3
+Create Date: 2014-03-19 09:31:07.214880
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2f8d3b7a61c5'
+down_revision = '6a2e91c4d8f3'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('doi_status',
+        sa.Column('doi', sa.String(), nullable=False),
+        sa.Column('is_registered', sa.Boolean(), nullable=False),
+        sa.Column('checked_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('doi')
+    )
+    op.create_index('ix_doi_status_checked_at', 'doi_status', ['checked_at'])
+
+
+def downgrade():
+    op.drop_index('ix_doi_status_checked_at', 'doi_status')
+    op.drop_table('doi_status')
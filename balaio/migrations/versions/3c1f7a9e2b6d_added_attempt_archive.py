@@ -0,0 +1,35 @@
+"""Added attempt_archive
+
+Revision ID: 3c1f7a9e2b6d
+Revises: 1e30ab23b61f
+Create Date: 2014-03-10 10:12:31.482211
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3c1f7a9e2b6d'
+down_revision = '1e30ab23b61f'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('attempt_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('package_checksum', sa.String(length=64), nullable=True),
+        sa.Column('articlepkg_id', sa.Integer(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(['articlepkg_id'], ['articlepkg.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_attempt_archive_package_checksum', 'attempt_archive', ['package_checksum'])
+    op.create_index('ix_attempt_archive_started_at', 'attempt_archive', ['started_at'])
+
+
+def downgrade():
+    op.drop_index('ix_attempt_archive_started_at', 'attempt_archive')
+    op.drop_index('ix_attempt_archive_package_checksum', 'attempt_archive')
+    op.drop_table('attempt_archive')
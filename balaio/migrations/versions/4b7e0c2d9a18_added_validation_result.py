@@ -0,0 +1,35 @@
+"""Added validation result
+
+Revision ID: 4b7e0c2d9a18
+Revises: 2f8d3b7a61c5
+Create Date: 2014-03-21 16:02:51.771436
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4b7e0c2d9a18'
+down_revision = '2f8d3b7a61c5'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('validation_result',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('xml_hash', sa.String(length=64), nullable=False),
+        sa.Column('rule', sa.String(), nullable=False),
+        sa.Column('rule_version', sa.Integer(), nullable=False),
+        sa.Column('data_version', sa.String(length=64), nullable=False),
+        sa.Column('status', sa.Integer(), nullable=False),
+        sa.Column('description', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('xml_hash', 'rule', 'rule_version', 'data_version')
+    )
+    op.create_index('ix_validation_result_created_at', 'validation_result', ['created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_validation_result_created_at', 'validation_result')
+    op.drop_table('validation_result')
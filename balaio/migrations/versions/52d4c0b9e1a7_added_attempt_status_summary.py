@@ -0,0 +1,67 @@
+"""Added attempt status summary
+
+Revision ID: 52d4c0b9e1a7
+Revises: 3c1f7a9e2b6d
+Create Date: 2014-03-12 15:40:02.117354
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '52d4c0b9e1a7'
+down_revision = '3c1f7a9e2b6d'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('attempt', sa.Column('current_point', sa.Integer(), nullable=True))
+    op.add_column('attempt', sa.Column('checkin_status', sa.Integer(), nullable=True))
+    op.add_column('attempt', sa.Column('validation_status', sa.Integer(), nullable=True))
+    op.add_column('attempt', sa.Column('checkout_status', sa.Integer(), nullable=True))
+    op.add_column('attempt', sa.Column('notices_ok', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('attempt', sa.Column('notices_warning', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('attempt', sa.Column('notices_error', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('attempt', sa.Column('status_updated_at', sa.DateTime(), nullable=True))
+
+    op.create_index('ix_attempt_current_point', 'attempt', ['current_point'])
+    op.create_index('ix_attempt_checkin_status', 'attempt', ['checkin_status'])
+    op.create_index('ix_attempt_validation_status', 'attempt', ['validation_status'])
+    op.create_index('ix_attempt_checkout_status', 'attempt', ['checkout_status'])
+    op.create_index('ix_attempt_status_updated_at', 'attempt', ['status_updated_at'])
+
+    # backfill the summary of existing attempts.
+    op.execute("""
+        UPDATE attempt SET
+            current_point = (SELECT max(c.point) FROM checkpoint c
+                             WHERE c.attempt_id = attempt.id AND c.started_at IS NOT NULL),
+            checkin_status = (SELECT max(n.status) FROM notice n JOIN checkpoint c ON n.checkpoint_id = c.id
+                              WHERE c.attempt_id = attempt.id AND c.point = 1),
+            validation_status = (SELECT max(n.status) FROM notice n JOIN checkpoint c ON n.checkpoint_id = c.id
+                                 WHERE c.attempt_id = attempt.id AND c.point = 2),
+            checkout_status = (SELECT max(n.status) FROM notice n JOIN checkpoint c ON n.checkpoint_id = c.id
+                               WHERE c.attempt_id = attempt.id AND c.point = 3),
+            notices_ok = (SELECT count(*) FROM notice n JOIN checkpoint c ON n.checkpoint_id = c.id
+                          WHERE c.attempt_id = attempt.id AND n.status = 1),
+            notices_warning = (SELECT count(*) FROM notice n JOIN checkpoint c ON n.checkpoint_id = c.id
+                               WHERE c.attempt_id = attempt.id AND n.status = 2),
+            notices_error = (SELECT count(*) FROM notice n JOIN checkpoint c ON n.checkpoint_id = c.id
+                             WHERE c.attempt_id = attempt.id AND n.status = 3)
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_attempt_status_updated_at', 'attempt')
+    op.drop_index('ix_attempt_checkout_status', 'attempt')
+    op.drop_index('ix_attempt_validation_status', 'attempt')
+    op.drop_index('ix_attempt_checkin_status', 'attempt')
+    op.drop_index('ix_attempt_current_point', 'attempt')
+
+    op.drop_column('attempt', 'status_updated_at')
+    op.drop_column('attempt', 'notices_error')
+    op.drop_column('attempt', 'notices_warning')
+    op.drop_column('attempt', 'notices_ok')
+    op.drop_column('attempt', 'checkout_status')
+    op.drop_column('attempt', 'validation_status')
+    op.drop_column('attempt', 'checkin_status')
+    op.drop_column('attempt', 'current_point')
@@ -0,0 +1,22 @@
+"""Added checkpoint timings
+
+Revision ID: 5d1a8f3e7c02
+Revises: 4b7e0c2d9a18
+Create Date: 2014-03-24 11:47:19.302116
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5d1a8f3e7c02'
+down_revision = '4b7e0c2d9a18'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('checkpoint', sa.Column('timings', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('checkpoint', 'timings')
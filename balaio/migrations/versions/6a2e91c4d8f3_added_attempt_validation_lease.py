@@ -0,0 +1,26 @@
+"""Added attempt validation lease
+
+Revision ID: 6a2e91c4d8f3
+Revises: 52d4c0b9e1a7
+Create Date: 2014-03-17 10:12:45.530817
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6a2e91c4d8f3'
+down_revision = '52d4c0b9e1a7'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('attempt', sa.Column('validation_lease_owner', sa.String(), nullable=True))
+    op.add_column('attempt', sa.Column('validation_lease_expires_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_attempt_validation_lease_owner', 'attempt', ['validation_lease_owner'])
+
+
+def downgrade():
+    op.drop_index('ix_attempt_validation_lease_owner', 'attempt')
+    op.drop_column('attempt', 'validation_lease_expires_at')
+    op.drop_column('attempt', 'validation_lease_owner')
@@ -0,0 +1,49 @@
+"""Added manager snapshot
+
+Revision ID: 7c4e2a9f1b35
+Revises: 5d1a8f3e7c02
+Create Date: 2014-03-26 15:02:44.810273
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7c4e2a9f1b35'
+down_revision = '5d1a8f3e7c02'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('manager_journal',
+        sa.Column('resource_uri', sa.String(), nullable=False),
+        sa.Column('print_issn', sa.String(), nullable=True),
+        sa.Column('eletronic_issn', sa.String(), nullable=True),
+        sa.Column('updated', sa.String(), nullable=True),
+        sa.Column('data', sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint('resource_uri')
+    )
+    op.create_index('ix_manager_journal_print_issn', 'manager_journal', ['print_issn'])
+    op.create_index('ix_manager_journal_eletronic_issn', 'manager_journal', ['eletronic_issn'])
+
+    op.create_table('manager_issue',
+        sa.Column('resource_uri', sa.String(), nullable=False),
+        sa.Column('journal_uri', sa.String(), nullable=True),
+        sa.Column('volume', sa.String(), nullable=True),
+        sa.Column('number', sa.String(), nullable=True),
+        sa.Column('suppl_volume', sa.String(), nullable=True),
+        sa.Column('suppl_number', sa.String(), nullable=True),
+        sa.Column('publication_year', sa.String(), nullable=True),
+        sa.Column('updated', sa.String(), nullable=True),
+        sa.Column('data', sa.Text(), nullable=False),
+        sa.PrimaryKeyConstraint('resource_uri')
+    )
+    op.create_index('ix_manager_issue_journal_uri', 'manager_issue', ['journal_uri'])
+
+
+def downgrade():
+    op.drop_index('ix_manager_issue_journal_uri', 'manager_issue')
+    op.drop_table('manager_issue')
+    op.drop_index('ix_manager_journal_eletronic_issn', 'manager_journal')
+    op.drop_index('ix_manager_journal_print_issn', 'manager_journal')
+    op.drop_table('manager_journal')
@@ -0,0 +1,26 @@
+"""Added attempt validation retry
+
+Revision ID: 8e3b5f1d2a64
+Revises: 7c4e2a9f1b35
+Create Date: 2014-03-28 11:20:17.402951
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8e3b5f1d2a64'
+down_revision = '7c4e2a9f1b35'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('attempt', sa.Column('validation_retry_at', sa.DateTime(), nullable=True))
+    op.add_column('attempt', sa.Column('validation_retries', sa.Integer(), nullable=False, server_default='0'))
+    op.create_index('ix_attempt_validation_retry_at', 'attempt', ['validation_retry_at'])
+
+
+def downgrade():
+    op.drop_index('ix_attempt_validation_retry_at', 'attempt')
+    op.drop_column('attempt', 'validation_retries')
+    op.drop_column('attempt', 'validation_retry_at')
@@ -0,0 +1,39 @@
+"""Added notification outbox
+
+Revision ID: 9a4f6c2e8b17
+Revises: 8e3b5f1d2a64
+Create Date: 2014-03-31 09:41:26.118305
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '9a4f6c2e8b17'
+down_revision = '8e3b5f1d2a64'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('notification',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('attempt_id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.Column('failed_at', sa.DateTime(), nullable=True),
+        sa.Column('tries', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('next_try_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['attempt_id'], ['attempt.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_notification_attempt_id', 'notification', ['attempt_id'])
+    op.create_index('ix_notification_sent_at', 'notification', ['sent_at'])
+
+
+def downgrade():
+    op.drop_index('ix_notification_sent_at', 'notification')
+    op.drop_index('ix_notification_attempt_id', 'notification')
+    op.drop_table('notification')
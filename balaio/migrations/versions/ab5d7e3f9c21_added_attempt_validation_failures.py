@@ -0,0 +1,22 @@
+"""Added attempt validation failures
+
+Revision ID: ab5d7e3f9c21
+Revises: 9a4f6c2e8b17
+Create Date: 2014-04-02 10:14:52.631207
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'ab5d7e3f9c21'
+down_revision = '9a4f6c2e8b17'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('attempt', sa.Column('validation_failures', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    op.drop_column('attempt', 'validation_failures')
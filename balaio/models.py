@@ -2,6 +2,9 @@
 import datetime
 import logging
 import os
+import json
+import zlib
+import random
 
 import enum
 
@@ -13,6 +16,9 @@ from sqlalchemy import (
     DateTime,
     String,
     Boolean,
+    LargeBinary,
+    Text,
+    UniqueConstraint,
     Table,
     event,
 )
@@ -21,7 +27,12 @@ from sqlalchemy.orm import (
     backref,
     scoped_session,
     sessionmaker,
+    subqueryload,
+    deferred,
+    reconstructor,
+    object_session,
 )
+from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy.orm.exc import MultipleResultsFound, NoResultFound
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.hybrid import hybrid_property, hybrid_method
@@ -37,6 +48,10 @@ logger = logging.getLogger(__name__)
 ScopedSession = scoped_session(
     sessionmaker(expire_on_commit=False, extension=ZopeTransactionExtension()))
 
+#Read-only sessions bound to a replica, used by the web app
+ReplicaScopedSession = scoped_session(
+    sessionmaker(expire_on_commit=False, extension=ZopeTransactionExtension()))
+
 Session = sessionmaker(expire_on_commit=False, extension=ZopeTransactionExtension())
 Base = declarative_base()
 
@@ -49,6 +64,19 @@ def create_engine_from_config(config):
                          echo=config.getboolean('app', 'debug'))
 
 
+def create_replica_engine_from_config(config):
+    """
+    Create a sqlalchemy.engine bound to the read replica set at
+    `[app] db_replica_dsn`, or None if no replica is configured.
+    """
+    if not (config.has_option('app', 'db_replica_dsn') and
+            config.get('app', 'db_replica_dsn')):
+        return None
+
+    return create_engine(config.get('app', 'db_replica_dsn'),
+                         echo=config.getboolean('app', 'debug'))
+
+
 def init_database(engine):
     """
     Creates the database structure for the application.
@@ -88,11 +116,30 @@ class Attempt(Base):
     proceed_to_validation = Column(Boolean, nullable=False, default=False)
     validation_started_at = Column(DateTime(timezone=True))
     validation_ended_at = Column(DateTime(timezone=True))
+    # lease held by the validator worker processing the attempt.
+    validation_lease_owner = Column(String, index=True)
+    validation_lease_expires_at = Column(DateTime)
+    # validation deferred after failures caused by unavailable dependencies.
+    validation_retry_at = Column(DateTime, index=True)
+    validation_retries = Column(Integer, nullable=False, default=0)
+    # validations that failed for other reasons, e.g. corrupt packages.
+    validation_failures = Column(Integer, nullable=False, default=0)
 
     proceed_to_checkout = Column(Boolean, nullable=False)
     checkout_started_at = Column(DateTime)
     queued_checkout = Column(Boolean)
 
+    # denormalized summary of checkpoints and notices, maintained
+    # at write time by :meth:`update_summary`.
+    current_point = Column(Integer, index=True)
+    checkin_status = Column(Integer, index=True)
+    validation_status = Column(Integer, index=True)
+    checkout_status = Column(Integer, index=True)
+    notices_ok = Column(Integer, nullable=False, default=0)
+    notices_warning = Column(Integer, nullable=False, default=0)
+    notices_error = Column(Integer, nullable=False, default=0)
+    status_updated_at = Column(DateTime, index=True)
+
     articlepkg = relationship('ArticlePkg',
                               backref=backref('attempts',
                               cascade='all, delete-orphan'))
@@ -103,6 +150,7 @@ class Attempt(Base):
         self.is_valid = kwargs.get('is_valid', True)
         self.proceed_to_validation = kwargs.get('proceed_to_validation', False)
         self.proceed_to_checkout = kwargs.get('proceed_to_checkout', False)
+        self.notices_ok = self.notices_warning = self.notices_error = 0
 
     @property
     def analyzer(self):
@@ -129,10 +177,60 @@ class Attempt(Base):
                            is_valid=self.is_valid,
                            proceed_to_checkout=self.proceed_to_checkout,
                            checkout_started_at=self.checkout_started_at,
-                           queued_checkout=self.queued_checkout)
+                           queued_checkout=self.queued_checkout,
+                           summary=self.summary())
 
         return checkpoints
 
+    def summary(self):
+        """
+        Returns the status summary without touching checkpoints and notices.
+        """
+        def status_name(value):
+            return Status(value).name if value else None
+
+        return dict(current_point=Point(self.current_point).name if self.current_point else None,
+                    checkin=status_name(self.checkin_status),
+                    validation=status_name(self.validation_status),
+                    checkout=status_name(self.checkout_status),
+                    notices=dict(ok=self.notices_ok or 0,
+                                 warning=self.notices_warning or 0,
+                                 error=self.notices_error or 0),
+                    updated_at=str(self.status_updated_at) if self.status_updated_at else None)
+
+    def update_summary(self, point, status=None):
+        """
+        Updates the status summary with an event happened at `point`.
+
+        :param point: instance of :class:`Point`.
+        :param status: (optional) instance of :class:`Status`, of a notice.
+        """
+        self.current_point = point.value
+
+        if status is not None:
+            status_attr = '%s_status' % point.name
+            worst_status = getattr(self, status_attr)
+            if worst_status is None or status.value > worst_status:
+                setattr(self, status_attr, status.value)
+
+            count_attr = 'notices_%s' % status.name
+            setattr(self, count_attr, (getattr(self, count_attr) or 0) + 1)
+
+        self.status_updated_at = datetime.datetime.now()
+
+    @classmethod
+    def serialization_options(cls):
+        """
+        Loader strategies needed by :meth:`to_dict`.
+
+        Checkpoints and its notices are eagerly loaded, so any number
+        of attempts are serialized with a constant number of queries.
+        Usage::
+
+            >>> session.query(Attempt).options(*Attempt.serialization_options())
+        """
+        return (subqueryload('checkpoint').subqueryload('messages'),)
+
     def __repr__(self):
         return "<Attempt('%s, %s')>" % (self.id, self.package_checksum)
 
@@ -158,6 +256,83 @@ class Attempt(Base):
         """
         return (self.proceed_to_validation == True) & (self.is_valid == True)
 
+    @hybrid_method
+    def is_closed(self):
+        """
+        Returns a bool indicating if the attempt reached the end of its
+        lifecycle, i.e. it is not waiting for validation nor checkout.
+        """
+        return ((self.proceed_to_validation == False) &
+                ((self.validation_ended_at != None) | (self.is_valid == False)) &
+                ((self.proceed_to_checkout == False) | (self.checkout_started_at != None)) &
+                ((self.queued_checkout == None) | (self.queued_checkout == False)))
+
+    @classmethod
+    def claim_for_validation(cls, session, owner, limit, lease_seconds):
+        """
+        Atomically leases up to `limit` attempts ready to be validated to `owner`.
+
+        Attempts leased to other owners are skipped, unless their lease
+        has expired, i.e. they were abandoned by a dead worker. Deferred
+        attempts are skipped until their retry time. On PostgreSQL, the
+        attempts being claimed by concurrent transactions are skipped too.
+        Returns the total of claimed attempts.
+
+        :param session: sqlalchemy db session.
+        :param owner: unique identifier of the claiming worker.
+        :param limit: max number of attempts to claim.
+        :param lease_seconds: lease duration, in seconds.
+        """
+        now = datetime.datetime.now()
+        lease_is_free = ((cls.validation_lease_expires_at == None) |
+                         (cls.validation_lease_expires_at < now)) & (
+                        (cls.validation_retry_at == None) |
+                        (cls.validation_retry_at <= now))
+
+        candidates = session.query(cls.id).filter(
+            cls.ready_to_validate()).filter(lease_is_free).order_by(
+            cls.id).limit(limit)
+
+        if session.bind.dialect.name == 'postgresql':
+            # concurrent claimers get distinct batches, instead of racing
+            # for the same rows. SKIP LOCKED is not supported by sqlalchemy 0.9.
+            statement = candidates.with_for_update().statement.compile(
+                dialect=session.bind.dialect)
+            candidates = [attempt_id for attempt_id, in session.connection().execute(
+                '%s SKIP LOCKED' % statement, statement.params)]
+            if not candidates:
+                return 0
+        else:
+            candidates = candidates.subquery()
+
+        # the conditions are checked again against the row being updated,
+        # so concurrent claims of the same attempt are mutually exclusive.
+        return session.query(cls).filter(cls.id.in_(candidates)).filter(
+            cls.ready_to_validate()).filter(lease_is_free).update({
+                cls.validation_lease_owner: owner,
+                cls.validation_lease_expires_at: now + datetime.timedelta(seconds=lease_seconds),
+            }, synchronize_session=False)
+
+    @classmethod
+    def renew_validation_lease(cls, session, attempt_id, owner, lease_seconds):
+        """
+        Extends the lease of an attempt, if it is still leased to `owner`
+        and ready to be validated. The attempt stays locked until the end
+        of the transaction. Returns a bool indicating if it was renewed.
+
+        :param session: sqlalchemy db session.
+        :param attempt_id: id of the attempt.
+        :param owner: unique identifier of the worker.
+        :param lease_seconds: lease duration, in seconds.
+        """
+        now = datetime.datetime.now()
+        return session.query(cls).filter(cls.id == attempt_id).filter(
+            cls.ready_to_validate()).filter(
+            cls.validation_lease_owner == owner).filter(
+            cls.validation_lease_expires_at > now).update({
+                cls.validation_lease_expires_at: now + datetime.timedelta(seconds=lease_seconds),
+            }, synchronize_session=False) == 1
+
     def start_validation(self):
         """
         Mark the attempt validation as started.
@@ -170,6 +345,53 @@ class Attempt(Base):
         Mark the attempt validation as ended.
         """
         self.validation_ended_at = datetime.datetime.now()
+        self.validation_lease_owner = None
+        self.validation_lease_expires_at = None
+        self.validation_retry_at = None
+        self.validation_retries = 0
+        self.validation_failures = 0
+
+    def defer_validation(self, base_delay, max_delay):
+        """
+        Releases the lease and postpones the validation, with exponential
+        backoff. Returns the retry time.
+
+        The delay is randomized between half and the whole backoff, so
+        the attempts blocked by the same outage are spread over time.
+
+        :param base_delay: delay of the first retry, in seconds.
+        :param max_delay: max delay, in seconds.
+        """
+        retries = self.validation_retries or 0
+        delay = min(max_delay, base_delay * 2 ** retries) * random.uniform(0.5, 1)
+
+        self.validation_retries = retries + 1
+        self.validation_retry_at = datetime.datetime.now() + datetime.timedelta(seconds=delay)
+        self.validation_lease_owner = None
+        self.validation_lease_expires_at = None
+
+        return self.validation_retry_at
+
+    def fail_validation(self, base_delay, max_delay, max_failures):
+        """
+        Records a failed validation, that is deferred as in :meth:`defer_validation`.
+        After `max_failures` failures the attempt is given up and marked
+        as invalid. Returns the retry time, or None if given up.
+
+        :param base_delay: delay of the first retry, in seconds.
+        :param max_delay: max delay, in seconds.
+        :param max_failures: failures before giving up.
+        """
+        self.validation_failures = (self.validation_failures or 0) + 1
+        if self.validation_failures < max_failures:
+            return self.defer_validation(base_delay, max_delay)
+
+        self.is_valid = False
+        self.validation_retry_at = None
+        self.validation_lease_owner = None
+        self.validation_lease_expires_at = None
+
+        return None
 
 
 class ArticlePkg(Base):
@@ -232,9 +454,20 @@ class ArticlePkg(Base):
             issue_number=self.issue_number,
             issue_suppl_volume=self.issue_suppl_volume,
             issue_suppl_number=self.issue_suppl_number,
-            related_resources=[('attempts', 'Attempt', [attempt.id for attempt in self.attempts]),],
+            related_resources=[('attempts', 'Attempt', sorted(
+                [attempt.id for attempt in self.attempts] +
+                [attempt.id for attempt in self.archived_attempts])),],
         )
 
+    @classmethod
+    def serialization_options(cls):
+        """
+        Loader strategies needed by :meth:`to_dict`.
+
+        See :meth:`Attempt.serialization_options`.
+        """
+        return (subqueryload('attempts'), subqueryload('archived_attempts'))
+
     def __repr__(self):
         return "<ArticlePkg('%s, %s')>" % (self.id, self.article_title)
 
@@ -319,9 +552,14 @@ class Checkpoint(Base):
     ended_at = Column(DateTime(timezone=True))
     _point = Column('point', Integer, nullable=False)
     attempt_id = Column(Integer, ForeignKey('attempt.id'))
+    # wall and CPU time of each pipe, in seconds.
+    _timings = Column('timings', Text)
+    # notices are persisted in bulk, see :func:`write_pending_notices`.
     messages = relationship('Notice',
                             order_by='Notice.when',
-                            backref=backref('checkpoint'))
+                            viewonly=True,
+                            cascade='',
+                            backref=backref('checkpoint', viewonly=True))
     attempt = relationship('Attempt',
                            backref=backref('checkpoint'))
 
@@ -342,6 +580,22 @@ class Checkpoint(Base):
 
         self.point = point
         self.started_at = self.ended_at = None
+        self._pending_notices = []
+        # notices sent to Manager when the checkpoint ends, see :class:`notifier.Notifier`.
+        self._unsent_notices = []
+
+    @reconstructor
+    def init_on_load(self):
+        self._pending_notices = []
+        self._unsent_notices = []
+
+    @property
+    def timings(self):
+        return json.loads(self._timings) if self._timings else None
+
+    @timings.setter
+    def timings(self, value):
+        self._timings = json.dumps(value)
 
     def start(self):
         if self.started_at is None:
@@ -368,6 +622,14 @@ class Checkpoint(Base):
         notice = Notice(message=message, status=status, label=label)
         self.messages.append(notice)
 
+        # the notice is buffered until the next flush. `messages` is viewonly,
+        # so the checkpoint is flagged to make sure a flush happens on commit.
+        self._pending_notices.append(notice)
+        flag_modified(self, 'started_at')
+        session = object_session(self)
+        if session is not None:
+            session.info.setdefault('pending_notices', set()).add(self)
+
     @hybrid_property
     def point(self):
         return Point(self._point)
@@ -387,6 +649,202 @@ class Checkpoint(Base):
                         )
 
 
+class Notification(Base):
+    """
+    A notification to SciELO Manager, waiting in the outbox.
+
+    Notifications are written in the same transaction of the changes they
+    report, and delivered later by :mod:`dispatcher`, in order per attempt.
+    """
+    __tablename__ = 'notification'
+    id = Column(Integer, primary_key=True)
+    attempt_id = Column(Integer, ForeignKey('attempt.id'), nullable=False, index=True)
+    # one of `checkin`, `checkout`, `notice` or `notices`.
+    kind = Column(String, nullable=False)
+    _payload = Column('payload', Text)
+    created_at = Column(DateTime, nullable=False)
+    sent_at = Column(DateTime, index=True)
+    # set when Manager rejects the notification, which is not retried.
+    failed_at = Column(DateTime)
+    tries = Column(Integer, nullable=False, default=0)
+    next_try_at = Column(DateTime)
+    last_error = Column(String)
+
+    attempt = relationship('Attempt')
+
+    def __init__(self, *args, **kwargs):
+        super(Notification, self).__init__(*args, **kwargs)
+        self.created_at = datetime.datetime.now()
+
+    @property
+    def payload(self):
+        return json.loads(self._payload) if self._payload else {}
+
+    @payload.setter
+    def payload(self, value):
+        self._payload = json.dumps(value)
+
+    @property
+    def is_pending(self):
+        return self.sent_at is None and self.failed_at is None
+
+    def __repr__(self):
+        return "<Notification('%s, %s, %s')>" % (self.id, self.attempt_id, self.kind)
+
+
+class ArchivedAttempt(Base):
+    """
+    A compressed snapshot of an :class:`Attempt`, its checkpoints and notices.
+
+    Closed attempts are moved to the archive after some time, in order to
+    keep the `attempt`, `checkpoint` and `notice` relations small. The
+    snapshot keeps the same shape of :meth:`Attempt.to_dict`.
+    """
+    __tablename__ = 'attempt_archive'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    package_checksum = Column(String(length=64), index=True)
+    articlepkg_id = Column(Integer, ForeignKey('articlepkg.id'), nullable=True)
+    started_at = Column(DateTime, nullable=False, index=True)
+    archived_at = Column(DateTime, nullable=False)
+    _data = deferred(Column('data', LargeBinary, nullable=False))
+
+    articlepkg = relationship('ArticlePkg',
+                              backref=backref('archived_attempts',
+                              cascade='all, delete-orphan'))
+
+    def __init__(self, *args, **kwargs):
+        super(ArchivedAttempt, self).__init__(*args, **kwargs)
+        self.archived_at = datetime.datetime.now()
+
+    @property
+    def data(self):
+        return json.loads(zlib.decompress(self._data))
+
+    @data.setter
+    def data(self, value):
+        self._data = zlib.compress(json.dumps(value, default=str), 9)
+
+    def to_dict(self):
+        data = self.data
+        data.update(archived_at=str(self.archived_at))
+
+        return data
+
+    def __repr__(self):
+        return "<ArchivedAttempt('%s, %s')>" % (self.id, self.package_checksum)
+
+    @classmethod
+    def from_attempt(cls, attempt):
+        """
+        Produces the archived version of `attempt`.
+
+        :param attempt: instance of :class:`Attempt`.
+        """
+        archived = cls(id=attempt.id,
+                       package_checksum=attempt.package_checksum,
+                       articlepkg_id=attempt.articlepkg_id,
+                       started_at=attempt.started_at)
+        archived.data = attempt.to_dict()
+
+        return archived
+
+
+class DOIStatus(Base):
+    """
+    The latest known registration status of a DOI at doi.org.
+    """
+    __tablename__ = 'doi_status'
+
+    doi = Column(String, primary_key=True)
+    is_registered = Column(Boolean, nullable=False)
+    checked_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return "<DOIStatus('%s, %s')>" % (self.doi, self.is_registered)
+
+
+class ValidationResult(Base):
+    """
+    The outcome of a validation rule for a given XML content.
+
+    Results are reused while the XML, the rule and the SciELO Manager data
+    the rule depends on remain the same.
+    """
+    __tablename__ = 'validation_result'
+    __table_args__ = (
+        UniqueConstraint('xml_hash', 'rule', 'rule_version', 'data_version'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    xml_hash = Column(String(length=64), nullable=False)
+    rule = Column(String, nullable=False)
+    rule_version = Column(Integer, nullable=False)
+    data_version = Column(String(length=64), nullable=False)
+    _status = Column('status', Integer, nullable=False)
+    description = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+
+    def __init__(self, *args, **kwargs):
+        # _status kwarg breaks sqlalchemy's default __init__
+        _status = kwargs.pop('status', None)
+
+        super(ValidationResult, self).__init__(*args, **kwargs)
+        self.created_at = datetime.datetime.now()
+
+        if _status:
+            self.status = _status
+
+    @hybrid_property
+    def status(self):
+        return Status(self._status)
+
+    @status.setter
+    def status(self, value):
+        self._status = value.value
+
+    def __repr__(self):
+        return "<ValidationResult('%s, %s, %s')>" % (self.rule, self.xml_hash, self.status)
+
+
+class ManagerJournal(Base):
+    """
+    Local snapshot of a journal registered at SciELO Manager.
+    """
+    __tablename__ = 'manager_journal'
+
+    resource_uri = Column(String, primary_key=True)
+    print_issn = Column(String, index=True)
+    eletronic_issn = Column(String, index=True)
+    updated = Column(String)
+    data = Column(Text, nullable=False)
+
+    def __repr__(self):
+        return "<ManagerJournal('%s')>" % self.resource_uri
+
+
+class ManagerIssue(Base):
+    """
+    Local snapshot of an issue registered at SciELO Manager. `data` holds
+    the issue with its relations, as returned by `scieloapi.Client.fetch_relations`,
+    except for the journal, that is kept by :class:`ManagerJournal`.
+    """
+    __tablename__ = 'manager_issue'
+
+    resource_uri = Column(String, primary_key=True)
+    journal_uri = Column(String, index=True)
+    volume = Column(String)
+    number = Column(String)
+    suppl_volume = Column(String)
+    suppl_number = Column(String)
+    publication_year = Column(String)
+    updated = Column(String)
+    data = Column(Text, nullable=False)
+
+    def __repr__(self):
+        return "<ManagerIssue('%s')>" % self.resource_uri
+
+
 @event.listens_for(Session, 'before_flush')
 def before_flush(session, flush_context, instances):
     # ArticlePkg.aid must be generated automaticaly while
@@ -411,3 +869,69 @@ def before_flush(session, flush_context, instances):
 
             obj.aid = aid
 
+
+def register_pending_notices(session, flush_context, instances):
+    """
+    Keeps track of new checkpoints that have buffered notices.
+
+    Checkpoints already held by the session are tracked by
+    :meth:`Checkpoint.tell`.
+    """
+    for obj in session.new:
+        if isinstance(obj, Checkpoint) and obj._pending_notices:
+            session.info.setdefault('pending_notices', set()).add(obj)
+
+
+def write_pending_notices(session, flush_context):
+    """
+    Writes all notices buffered by the flushed checkpoints, with a single
+    bulk INSERT.
+    """
+    checkpoints = session.info.pop('pending_notices', None)
+    if not checkpoints:
+        return None
+
+    rows = []
+    for checkpoint in checkpoints:
+        if checkpoint.id is None:
+            # not flushed yet, maybe it was expunged.
+            continue
+
+        rows.extend(dict(when=notice.when,
+                         label=notice.label,
+                         message=notice.message,
+                         status=notice._status,
+                         checkpoint_id=checkpoint.id)
+                    for notice in checkpoint._pending_notices)
+        checkpoint._pending_notices = []
+
+    if rows:
+        session.execute(Notice.__table__.insert(), rows)
+
+
+def discard_pending_notices(session, *args):
+    """
+    Notices buffered during a rolled back transaction must not be written.
+
+    The checkpoints may outlive the transaction in the identity map, so
+    their buffers are emptied too.
+    """
+    for checkpoint in session.info.pop('pending_notices', None) or ():
+        checkpoint._pending_notices = []
+
+
+def discard_pending_notices_on_close(session, transaction):
+    """
+    Closing the session ends the transaction without a rollback event,
+    e.g. when a zope transaction is aborted.
+    """
+    if session.transaction is None:
+        # the outermost transaction ended.
+        discard_pending_notices(session)
+
+
+for session_factory in (Session, ScopedSession):
+    event.listen(session_factory, 'before_flush', register_pending_notices)
+    event.listen(session_factory, 'after_flush_postexec', write_pending_notices)
+    event.listen(session_factory, 'after_rollback', discard_pending_notices)
+    event.listen(session_factory, 'after_transaction_end', discard_pending_notices_on_close)
@@ -14,6 +14,7 @@ import models
 import excepts
 import notifier
 import package
+import wakeup
 
 
 logger = logging.getLogger('balaio.monitor')
@@ -71,8 +72,19 @@ class Monitor(object):
                 checkin_notifier.end()
 
                 attempt.proceed_to_validation = True
+                wakeup.notify(session, self._wakeup_socket())
                 transaction.commit()
 
+    def _wakeup_socket(self):
+        """
+        Configs prior to the wakeup channel have no `[validator]` section,
+        and are limited to NOTIFY on PostgreSQL.
+        """
+        if self.config.has_option('validator', 'wakeup_socket'):
+            return self.config.get('validator', 'wakeup_socket')
+
+        return None
+
     def trigger_event(self, filepath):
         self.job_queue.put(filepath)
 
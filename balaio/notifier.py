@@ -6,10 +6,17 @@ import sqlalchemy
 import transaction
 
 import models
+import manager
 
 
 logger = logging.getLogger(__name__)
 
+# answered by Manager versions that do not accept a list of notices.
+BATCH_UNSUPPORTED_ERRORS = (scieloapi.exceptions.BadRequest,
+                            scieloapi.exceptions.NotFound,
+                            scieloapi.exceptions.MethodNotAllowed,
+                            scieloapi.exceptions.NotAcceptable)
+
 
 def auto_commit_or_rollback(method):
     """
@@ -29,23 +36,91 @@ def auto_commit_or_rollback(method):
     return _method
 
 
+def checkin_article_data(attempt):
+    """
+    Returns the data of the `checkins_articles` entity of `attempt`.
+    """
+    return {
+        'articlepkg_ref': str(attempt.articlepkg.id),
+        'article_title': attempt.articlepkg.article_title,
+        'journal_title': attempt.articlepkg.journal_title,
+        'issue_label': attempt.articlepkg.issue_label,
+        'pissn': attempt.articlepkg.journal_pissn,
+        'eissn': attempt.articlepkg.journal_eissn,
+    }
+
+
+def checkin_data(attempt, article_uri):
+    """
+    Returns the data of the `checkins` entity of `attempt`.
+    """
+    return {
+        'attempt_ref': str(attempt.id),
+        'package_name': attempt.filepath,
+        'uploaded_at': str(attempt.started_at),
+        'article': article_uri,
+    }
+
+
+def post_notices(client, data, notices, progress=None):
+    """
+    Posts `notices` to SciELO Manager in a single request, or one by one
+    if Manager does not accept a list of notices. In the latter case, the
+    client is flagged so the following lists are posted one by one.
+
+    :param client: instance of `scieloapi.Client`.
+    :param data: fields shared by the notices, i.e. `checkin` and `checkpoint`.
+    :param notices: list of dicts with `stage`, `message` and `status`.
+    :param progress: (optional) dict where the number of notices posted one by
+    one is kept, under `posted`, so they are skipped when posting again.
+    """
+    if progress is None:
+        progress = {}
+
+    if ('posted' not in progress and len(notices) > 1 and
+            not getattr(client, '_rejects_notice_lists', False)):
+        try:
+            client.notices.post(dict(data, notices=notices))
+            return None
+        except BATCH_UNSUPPORTED_ERRORS as e:
+            logger.info('Manager does not accept lists of notices (%s). Posting them one by one.' % e)
+            client._rejects_notice_lists = True
+
+    posted = progress.setdefault('posted', 0)
+    for notice in notices[posted:]:
+        client.notices.post(dict(data, **notice))
+        progress['posted'] += 1
+
+
 class Notifier(object):
     """
     Acts as a broker to notifications.
+
+    With `outbox`, notifications are written to the `notification` relation
+    in the current transaction, and delivered to SciELO Manager by
+    :mod:`dispatcher`. Otherwise they are sent immediately.
+
+    With `coalesce`, the notices told during the checkpoint are sent
+    together when it ends. They are buffered by the checkpoint, so every
+    notifier of the checkpoint contributes to the same request.
     """
 
     def __init__(self, checkpoint, scieloapi_client,
-                 db_session, manager_integration=True):
+                 db_session, manager_integration=True, outbox=False, coalesce=False):
         """
         :param checkpoint: is a :class:`models.Checkpoint` instance.
         :param scieloapi_client: instance of `scieloapi.Client`.
         :param db_session: sqlalchemy session.
         :param manager_integration: (optional) if notifications must be sent to manager.
+        :param outbox: (optional) if notifications are delivered by the dispatcher.
+        :param coalesce: (optional) if notices are sent once, at the end of the checkpoint.
         """
         self.scieloapi = scieloapi_client
         self.checkpoint = checkpoint
         self.db_session = db_session
         self.manager_integration = manager_integration
+        self.outbox = outbox
+        self.coalesce = coalesce
 
         # make sure checkpoint is held by the session
         if self.checkpoint not in self.db_session:
@@ -61,18 +136,42 @@ class Notifier(object):
         :param label: (optional)
         """
         self.checkpoint.tell(message, status, label=label)
-        self._send_notice_notification(message, status, label=label)
+        self._update_summary(status)
+        if self.coalesce:
+            self.checkpoint._unsent_notices.append(
+                {'stage': label, 'message': message, 'status': status.name})
+        else:
+            self._send_notice_notification(message, status, label=label)
 
     def start(self):
         self.checkpoint.start()
+        self._update_summary()
         if self.checkpoint.point is models.Point.checkin:
             self._send_checkin_notification()
 
     def end(self):
         self.checkpoint.end()
+        self._update_summary()
+        if self.checkpoint._unsent_notices:
+            self._send_coalesced_notices()
         if self.checkpoint.point is models.Point.checkout:
             self._send_checkout_notification()
 
+    def _update_summary(self, status=None):
+        """
+        Keeps the attempt's status summary in sync with the checkpoint.
+        """
+        if self.checkpoint.attempt is not None:
+            self.checkpoint.attempt.update_summary(self.checkpoint.point, status=status)
+
+    def _enqueue(self, kind, payload=None):
+        """
+        Writes a notification to the outbox.
+        """
+        notification = models.Notification(kind=kind, attempt=self.checkpoint.attempt)
+        notification.payload = payload or {}
+        self.db_session.add(notification)
+
     def _send_checkout_notification(self):
         """
         Sends a checkout notification to SciELO Manager.
@@ -86,13 +185,18 @@ class Notifier(object):
         assert self.checkpoint.point is models.Point.checkout, 'only `checkout` checkpoint can send this notification.'
 
         data = {
-            'checkin': self.checkpoint.attempt.checkin_uri,
             'stage': 'checkout',
             'checkpoint': self.checkpoint.point.name,
             'message': 'checkout finished',
             'status': 'ok',
         }
 
+        if self.outbox:
+            # the checkin uri is known only after the checkin is delivered.
+            return self._enqueue('checkout', data)
+
+        data['checkin'] = self.checkpoint.attempt.checkin_uri
+
         try:
             self.scieloapi.notices.post(data)
         except scieloapi.exceptions.APIError as e:
@@ -113,16 +217,13 @@ class Notifier(object):
 
         assert self.checkpoint.point is models.Point.checkin, 'only `checkin` checkpoint can send this notification.'
 
+        if self.outbox:
+            # the data is read at delivery time, when the ids are known.
+            return self._enqueue('checkin')
+
         # First, a `checkins_articles` entity is created, with some metadata of the article we
         # are talking about.
-        data_article = {
-                 'articlepkg_ref': str(self.checkpoint.attempt.articlepkg.id),
-                 'article_title': self.checkpoint.attempt.articlepkg.article_title,
-                 'journal_title': self.checkpoint.attempt.articlepkg.journal_title,
-                 'issue_label': self.checkpoint.attempt.articlepkg.issue_label,
-                 'pissn': self.checkpoint.attempt.articlepkg.journal_pissn,
-                 'eissn': self.checkpoint.attempt.articlepkg.journal_eissn,
-               }
+        data_article = checkin_article_data(self.checkpoint.attempt)
 
         try:
             resource_id = self.scieloapi.checkins_articles.post(data_article)
@@ -132,12 +233,7 @@ class Notifier(object):
         else:
             # If the former step goes fine, a `checkins` entity is created, with some metadata
             # of the current attempt.
-            data_checkins = {
-                     'attempt_ref': str(self.checkpoint.attempt.id),
-                     'package_name': self.checkpoint.attempt.filepath,
-                     'uploaded_at': str(self.checkpoint.attempt.started_at),
-                     'article': article_uri,
-                   }
+            data_checkins = checkin_data(self.checkpoint.attempt, article_uri)
             try:
                 resource_id = self.scieloapi.checkins.post(data_checkins)
                 checkin_uri = '/api/v1/checkins/%s/' % resource_id
@@ -149,6 +245,28 @@ class Notifier(object):
                 self.checkpoint.attempt.checkin_uri = checkin_uri
 
 
+    def _send_coalesced_notices(self):
+        """
+        Sends the notices told during the checkpoint to SciELO Manager, at once.
+        """
+        notices, self.checkpoint._unsent_notices = self.checkpoint._unsent_notices, []
+
+        if not self.manager_integration:
+            logger.warning('Notifications to Manager are disabled. Skipping.')
+            return None
+
+        data = {'checkpoint': self.checkpoint.point.name}
+
+        if self.outbox:
+            return self._enqueue('notices', dict(data, notices=notices))
+
+        data['checkin'] = self.checkpoint.attempt.checkin_uri
+
+        try:
+            post_notices(self.scieloapi, data, notices)
+        except scieloapi.exceptions.APIError as e:
+            logger.error('Error posting data to Manager. Message: %s' % e)
+
     def _send_notice_notification(self, message, status, label=None):
         """
         Sends notices notifications bound to the active checkin, to SciELO Manager.
@@ -158,25 +276,57 @@ class Notifier(object):
             return None
 
         data = {
-            'checkin': self.checkpoint.attempt.checkin_uri,
             'stage': label,
             'checkpoint': self.checkpoint.point.name,
             'message': message,
             'status': status.name,
         }
 
+        if self.outbox:
+            return self._enqueue('notice', data)
+
+        data['checkin'] = self.checkpoint.attempt.checkin_uri
+
         try:
             self.scieloapi.notices.post(data)
         except scieloapi.exceptions.APIError as e:
             logger.error('Error posting data to Manager. Message: %s' % e)
 
 
+def discard_notifiers(session, transaction):
+    """
+    Checkpoints are looked up again in the next transaction, since the
+    cached ones may be stale or detached.
+    """
+    if session.transaction is None:
+        # the outermost transaction ended.
+        session.info.pop('notifiers', None)
+
+
+for session_factory in (models.Session, models.ScopedSession):
+    sqlalchemy.event.listen(session_factory, 'after_transaction_end', discard_notifiers)
+
+
 def create_checkpoint_notifier(config, point):
-    scieloapi_client = scieloapi.Client(config.get('manager', 'api_username'),
-                                        config.get('manager', 'api_key'),
-                                        api_uri=config.get('manager', 'api_url'))
+    """
+    Returns a factory of :class:`Notifier` bound to `point`.
+
+    The factory looks up the checkpoint once per attempt and transaction,
+    and returns the same notifier to the following calls.
+    """
+    scieloapi_client = manager.client_from_config(config)
+    outbox = (config.has_option('manager', 'outbox') and
+              config.getboolean('manager', 'outbox'))
+    coalesce = (config.has_option('manager', 'coalesce_notices') and
+                config.getboolean('manager', 'coalesce_notices'))
 
     def _checkin_notifier_factory(attempt, session):
+        notifiers = session.info.setdefault('notifiers', {})
+        # the notifier references the attempt, so its id is not reused.
+        key = (id(attempt), point)
+        if key in notifiers:
+            return notifiers[key]
+
         try:
             checkpoint = session.query(models.Checkpoint).filter(
                 models.Checkpoint.attempt == attempt).filter(
@@ -188,10 +338,13 @@ def create_checkpoint_notifier(config, point):
             #logger.error(e.message)
             pass
 
-        return Notifier(checkpoint,
-                        scieloapi_client,
-                        session,
-                        manager_integration=config.getboolean('manager', 'notifications'))
+        notifiers[key] = Notifier(checkpoint,
+                                  scieloapi_client,
+                                  session,
+                                  manager_integration=config.getboolean('manager', 'notifications'),
+                                  outbox=outbox,
+                                  coalesce=coalesce)
+        return notifiers[key]
 
     return _checkin_notifier_factory
 
@@ -0,0 +1,298 @@
+#coding: utf-8
+"""
+Single-pass evaluation of the element paths analyzed by the rules.
+
+Rules register the ``.//``-style paths they look up with :func:`rule` or
+:func:`register`, in a group: `validation` for the validator, the default,
+or `meta` for the meta extraction at checkout. Each group has its own
+engine, so a process does not evaluate the paths of the others. A
+:class:`RuleEngine` selects the anchors of all the
+paths with a single `iter` over the article tree, done in C by lxml, and
+checks them in Python. The anchor of a path is the parent of the matched
+elements if the last step is a child step, e.g. `ref-list` in
+`.//ref-list/ref`, whose children are then collected in C. Otherwise it
+is the matched element itself.
+
+The resulting :class:`Matches` answers `find`, `findall` and `findtext`
+the same way ElementTree does, so existing rules only need to look up
+the paths on it instead of on the tree.
+
+Supported paths are descendant paths made of tag names or `*`, joined by
+`/` or `//`, with optional ``[@attr]`` or ``[@attr="value"]`` predicates.
+Other paths are delegated to the tree.
+"""
+import re
+import logging
+import threading
+import collections
+
+
+logger = logging.getLogger('balaio.rules')
+
+_STEP_REGEX = re.compile(r'''^(?P<tag>\*|[^\W\d][\w.:-]*)
+                              (?:\[@(?P<attr>[^\W\d][\w.:-]*)
+                                 (?:=(?P<quote>["'])(?P<value>.*?)(?P=quote))?\])?$''', re.X)
+
+Step = collections.namedtuple('Step', 'is_child tag attr value')
+
+_registered = collections.defaultdict(set)
+_lock = threading.Lock()
+_matches_lock = threading.Lock()
+_engines = {}
+
+
+def compile_path(path):
+    """
+    Returns the list of :class:`Step` of `path`, or None if it is
+    not supported.
+    """
+    if not path.startswith('.//'):
+        return None
+
+    # ElementTree accepts predicates after a slash, and an implicit
+    # `*` after a trailing slash.
+    path = path[3:].replace('/[', '[')
+    if path.endswith('/'):
+        path += '*'
+
+    steps = []
+    is_child = False
+    for token in re.split(r'(//?)', path):
+        if token == '/':
+            is_child = True
+        elif token == '//':
+            is_child = False
+        else:
+            match = _STEP_REGEX.match(token)
+            if match is None:
+                return None
+            steps.append(Step(is_child, match.group('tag'),
+                              match.group('attr'), match.group('value')))
+
+    return steps
+
+
+def _step_matches(step, elem):
+    if step.tag != '*' and step.tag != elem.tag:
+        return False
+    if step.attr is None:
+        return True
+
+    value = elem.get(step.attr)
+    return value is not None if step.value is None else value == step.value
+
+
+def _path_matches(steps, i, elem, root, parent_of):
+    """
+    Checks if `steps[:i+1]` matches the ancestors of `elem` below `root`,
+    ending at `elem`.
+
+    :param parent_of: function that returns the parent of an element.
+    """
+    if elem is root or not _step_matches(steps[i], elem):
+        return False
+
+    return i == 0 or _prefix_matches(steps, i, parent_of(elem), root, parent_of)
+
+
+def _prefix_matches(steps, i, parent, root, parent_of):
+    """
+    Checks if `steps[:i]` matches `parent`, the parent of an element
+    matched by `steps[i]`, or one of its ancestors if `steps[i]` is
+    a descendant step.
+    """
+    if steps[i].is_child:
+        return parent is not None and _path_matches(steps, i - 1, parent, root, parent_of)
+
+    while parent is not None and parent is not root:
+        if _path_matches(steps, i - 1, parent, root, parent_of):
+            return True
+        parent = parent_of(parent)
+
+    return False
+
+
+def _candidates(root, tags):
+    """
+    Returns the elements of `root` with one of `tags`, in document order,
+    and the function that returns their parents.
+
+    :param tags: set of tags, or None for all the elements.
+    """
+    if hasattr(root, 'getparent'):
+        # lxml selects the elements in C.
+        elements = root.iter(*tags) if tags is not None else root.iter()
+        return elements, lambda elem: elem.getparent()
+
+    # ElementTree elements do not know their parents.
+    parents = dict((child, parent) for parent in root.iter() for child in parent)
+    elements = (elem for elem in root.iter() if tags is None or elem.tag in tags)
+    return elements, parents.get
+
+
+def _children(elem, step):
+    """
+    Returns the children of `elem` matched by `step`.
+    """
+    if step.tag != '*' and hasattr(elem, 'iterchildren'):
+        children = elem.iterchildren(step.tag)
+    else:
+        children = (child for child in elem if isinstance(child.tag, basestring) and
+                                               step.tag in ('*', child.tag))
+
+    if step.attr is None:
+        return list(children)
+
+    return [child for child in children if _step_matches(step, child)]
+
+
+def register(*paths, **kwargs):
+    """
+    Registers paths evaluated by the engine of a group.
+
+    :param group: (optional) name of the group, `validation` by default.
+    """
+    group = kwargs.get('group', 'validation')
+    with _lock:
+        _registered[group].update(paths)
+        _engines.pop(group, None)
+
+
+def rule(*paths, **kwargs):
+    """
+    Class decorator that registers the paths analyzed by a rule.
+
+    :param group: (optional) name of the group, `validation` by default.
+    """
+    def decorator(cls):
+        cls._paths_ = paths
+        register(*paths, **kwargs)
+        return cls
+
+    return decorator
+
+
+def get_engine(group='validation'):
+    """
+    Returns the :class:`RuleEngine` of the paths registered in `group`.
+    """
+    with _lock:
+        if group not in _engines:
+            _engines[group] = RuleEngine(_registered[group])
+        return _engines[group]
+
+
+class RuleEngine(object):
+    """
+    Evaluates a set of paths in a single traversal of the tree.
+    """
+    def __init__(self, paths):
+        self.unsupported = set()
+        self._by_anchor = collections.defaultdict(list)
+
+        for path in paths:
+            steps = compile_path(path)
+            if steps is None:
+                logger.debug('Path %s is delegated to the tree' % path)
+                self.unsupported.add(path)
+            elif steps[-1].is_child:
+                self._by_anchor[steps[-2].tag].append((path, steps))
+            else:
+                self._by_anchor[steps[-1].tag].append((path, steps))
+
+    def run(self, xml):
+        """
+        Returns the :class:`Matches` of the registered paths in `xml`.
+
+        :param xml: an element or an element tree.
+        """
+        root = xml.getroot() if hasattr(xml, 'getroot') else xml
+        found = dict((path, []) for candidates in self._by_anchor.values()
+                                for path, steps in candidates)
+        if not found:
+            return Matches(root, found)
+
+        wildcards = self._by_anchor.get('*', [])
+        elements, parent_of = _candidates(root, None if wildcards else set(self._by_anchor))
+
+        # paths whose elements have more than one parent.
+        scattered = set()
+        for elem in elements:
+            if elem is root or not isinstance(elem.tag, basestring):
+                # comments and processing instructions.
+                continue
+
+            paths = self._by_anchor.get(elem.tag, [])
+            if wildcards:
+                paths = paths + wildcards
+
+            for path, steps in paths:
+                if not steps[-1].is_child:
+                    if _path_matches(steps, len(steps) - 1, elem, root, parent_of):
+                        found[path].append(elem)
+
+                elif _path_matches(steps, len(steps) - 2, elem, root, parent_of):
+                    children = _children(elem, steps[-1])
+                    if children and found[path]:
+                        scattered.add(path)
+                    found[path].extend(children)
+
+        for path in scattered:
+            # the children of nested anchors would be out of document
+            # order, e.g. in `.//sec/p` with a `sec` inside another.
+            found[path] = root.findall(path)
+
+        return Matches(root, found)
+
+
+class Matches(object):
+    """
+    Elements matched by each path, in document order.
+
+    Lookups of paths that were not evaluated are delegated to the tree.
+    """
+    def __init__(self, root, found):
+        self._root = root
+        self._found = found
+
+    def getroot(self):
+        return self._root
+
+    def findall(self, path):
+        try:
+            return list(self._found[path])
+        except KeyError:
+            return self._root.findall(path)
+
+    def find(self, path):
+        try:
+            elements = self._found[path]
+        except KeyError:
+            return self._root.find(path)
+
+        return elements[0] if elements else None
+
+    def findtext(self, path, default=None):
+        elem = self.find(path)
+        if elem is None:
+            return default
+
+        return elem.text or ''
+
+
+def get_matches(pkg_analyzer, group='validation'):
+    """
+    Returns the :class:`Matches` of the paths registered in `group` in the
+    XML of the package, cached on `pkg_analyzer`.
+
+    :param pkg_analyzer: instance of :class:`package.PackageAnalyzer`.
+    :param group: (optional) name of the group, `validation` by default.
+    """
+    with _matches_lock:
+        cached = getattr(pkg_analyzer, '_matches', None)
+        if cached is None:
+            cached = pkg_analyzer._matches = {}
+        if group not in cached:
+            cached[group] = get_engine(group).run(pkg_analyzer.xml)
+
+    return cached[group]
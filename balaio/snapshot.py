@@ -0,0 +1,174 @@
+#coding: utf-8
+"""
+Local snapshot of the journals and issues registered at SciELO Manager.
+
+The snapshot is kept up to date by the `snapshot` activity of balaio.py,
+and lets the lookups for issues be resolved from local indexes. Issues
+missing from the snapshot must be looked up remotely.
+
+Syncs are incremental: only the records modified since the most recent
+`updated` value of each table are listed, with the `updated__gte` filter
+of the SciELO Manager API. Records deleted at SciELO Manager are not
+listed this way, so they are removed only by full syncs
+(`balaio.py snapshot --full`), which list all the records. The first
+sync of an empty table is always full.
+"""
+import json
+import logging
+
+from sqlalchemy import select, and_, func
+
+import models
+
+
+logger = logging.getLogger('balaio.snapshot')
+
+# issue lookup criteria, by the name of the column they refer to.
+ISSUE_CRITERIA = ('volume', 'number', 'suppl_volume', 'suppl_number', 'publication_year')
+
+
+def _as_text(value):
+    return None if value in (None, '') else unicode(value)
+
+
+def _sync_table(conn, table, endpoint, columns, full=False):
+    """
+    Writes the records of `endpoint` that are new or were modified since
+    the last sync. A full sync also removes the ones that are gone.
+    Returns the total written.
+
+    :param conn: sqlalchemy connection.
+    :param endpoint: SciELO Manager endpoint, whose records are dicts with
+    `resource_uri` and `updated`.
+    :param columns: callable that returns the values of a record, by column name.
+    :param full: (optional) list all the records, instead of the modified ones.
+    """
+    last_updated = conn.execute(select([func.max(table.c.updated)])).scalar()
+    full = full or last_updated is None
+    if full:
+        records = endpoint.all()
+    else:
+        # records updated at the same time as the last one are listed again,
+        # and skipped below if they are unchanged.
+        records = endpoint.filter(updated__gte=last_updated)
+
+    known = dict(conn.execute(select([table.c.resource_uri, table.c.updated])).fetchall())
+    seen = set()
+    written = 0
+
+    for record in records:
+        uri = record['resource_uri']
+        seen.add(uri)
+        if uri in known and known[uri] == record.get('updated'):
+            continue
+
+        values = columns(record)
+        values['updated'] = record.get('updated')
+        if uri in known:
+            conn.execute(table.update().where(table.c.resource_uri == uri).values(**values))
+        else:
+            conn.execute(table.insert().values(resource_uri=uri, **values))
+        written += 1
+
+    gone = set(known) - seen
+    if full and gone:
+        conn.execute(table.delete().where(table.c.resource_uri.in_(gone)))
+
+    return written
+
+
+def sync(engine, client, full=False):
+    """
+    Synchronizes the snapshot with SciELO Manager.
+
+    The journals and issues modified since the last sync are written, in
+    a single transaction. Issues are stored with their relations, except
+    for the journal, that is joined from its own row by lookups. So changes
+    to a journal are seen by all its issues.
+
+    Returns a tuple with the total of journals and issues written.
+
+    :param engine: sqlalchemy engine.
+    :param client: instance of `scieloapi.Client`.
+    :param full: (optional) list all the records, and remove the ones that are gone.
+    """
+    with engine.begin() as conn:
+        return _sync(conn, client, full)
+
+
+def _sync(conn, client, full):
+    journals = _sync_table(conn, models.ManagerJournal.__table__,
+        client.journals,
+        lambda journal: {'print_issn': _as_text(journal.get('print_issn')),
+                         'eletronic_issn': _as_text(journal.get('eletronic_issn')),
+                         'data': json.dumps(journal)},
+        full=full)
+
+    def issue_columns(issue):
+        values = dict((criterion, _as_text(issue.get(criterion))) for criterion in ISSUE_CRITERIA)
+        values['journal_uri'] = issue.get('journal')
+        values['data'] = json.dumps(client.fetch_relations(issue,
+            only=[name for name in issue if name != 'journal']))
+        return values
+
+    issues = _sync_table(conn, models.ManagerIssue.__table__,
+                         client.issues, issue_columns, full=full)
+
+    logger.info('Snapshot synchronized: %s journals and %s issues written' % (journals, issues))
+    return journals, issues
+
+
+class ManagerSnapshot(object):
+    """
+    Lookups for issues in the local snapshot.
+    """
+    def __init__(self, engine):
+        """
+        :param engine: sqlalchemy engine.
+        """
+        self.engine = engine
+
+    def find_issue(self, print_issn=None, eletronic_issn=None, **criteria):
+        """
+        Returns the data of the first issue matching the criteria, in the
+        same format as `scieloapi.Client.fetch_relations`, or None.
+
+        Accepts the same criteria as the SciELO Manager issues endpoint.
+        Criteria with empty values are ignored.
+        """
+        journal = models.ManagerJournal.__table__
+        issue = models.ManagerIssue.__table__
+
+        clauses = [issue.c.journal_uri == journal.c.resource_uri]
+        if print_issn:
+            clauses.append(journal.c.print_issn == print_issn)
+        if eletronic_issn:
+            clauses.append(journal.c.eletronic_issn == eletronic_issn)
+
+        for criterion, value in criteria.items():
+            if criterion not in ISSUE_CRITERIA:
+                raise TypeError('unknown criterion %s' % criterion)
+            if value not in (None, ''):
+                clauses.append(issue.c[criterion] == _as_text(value))
+
+        row = self.engine.execute(select([issue.c.data, journal.c.data.label('journal_data')])
+                                  .where(and_(*clauses))
+                                  .order_by(issue.c.resource_uri).limit(1)).first()
+        if row is None:
+            return None
+
+        issue_data = json.loads(row.data)
+        issue_data['journal'] = json.loads(row.journal_data)
+        return issue_data
+
+
+def snapshot_from_config(config, engine):
+    """
+    Returns a :class:`ManagerSnapshot`, or None if `[manager] use_snapshot`
+    is disabled.
+    """
+    if not (config.has_option('manager', 'use_snapshot') and
+            config.getboolean('manager', 'use_snapshot')):
+        return None
+
+    return ManagerSnapshot(engine)
@@ -105,6 +105,9 @@ class PackageAnalyzerStub(object):
     def is_valid_meta(self):
         return True
 
+    def restore_perms(self):
+        return None
+
     def __enter__(self, *args, **kwargs):
         return self
 
@@ -280,10 +283,14 @@ class QueryStub(object):
             o.offset = lambda params: [self.model(), self.model()]
         return o
 
+    def options(self, *args):
+        return self
+
     def filter_by(self, **kwargs):
         o = ObjectStub()
         o.limit = self.limit
         o.scalar = self.scalar
+        o.order_by = lambda *args: o
         return o
 
     def get(self, id):
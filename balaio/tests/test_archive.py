@@ -0,0 +1,95 @@
+import unittest
+import datetime
+
+from sqlalchemy.exc import OperationalError
+import transaction
+
+from balaio import archive, models
+from . import modelfactories
+from .utils import db_bootstrap, DB_READY
+
+
+global_engine = None
+
+
+def setUpModule():
+    """
+    Initialize the database.
+    """
+    global global_engine
+    try:
+        global_engine = db_bootstrap()
+    except OperationalError:
+        # global_engine remains None, all db-bound testcases
+        # need to test for DB_READY before run.
+        pass
+
+
+@unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+class ArchiveAttemptsTests(unittest.TestCase):
+
+    def tearDown(self):
+        transaction.abort()
+        models.ScopedSession.remove()
+
+    def _makeOne(self, days_ago=90, **kwargs):
+        attempt = modelfactories.AttemptFactory.create(**kwargs)
+        attempt.started_at = datetime.datetime.now() - datetime.timedelta(days=days_ago)
+        attempt.validation_ended_at = attempt.started_at
+
+        checkpoint = models.Checkpoint(models.Point.validation)
+        checkpoint.attempt = attempt
+        checkpoint.start()
+        checkpoint.tell('foo', models.Status.ok, label='bar')
+        checkpoint.end()
+
+        models.ScopedSession.flush()
+        return attempt
+
+    def test_old_closed_attempts_are_archived(self):
+        attempt_id = self._makeOne().id
+
+        self.assertEqual(archive.archive_attempts(models.ScopedSession, 30), 1)
+
+        session = models.ScopedSession
+        self.assertIsNone(session.query(models.Attempt).get(attempt_id))
+        self.assertEqual(session.query(models.Checkpoint).filter_by(attempt_id=attempt_id).count(), 0)
+
+        archived = archive.get_archived_attempt(session, attempt_id)
+        self.assertEqual(archived.to_dict()['validation']['notices'][0]['message'], 'foo')
+
+    def test_recent_attempts_are_kept(self):
+        attempt_id = self._makeOne(days_ago=1).id
+
+        self.assertEqual(archive.archive_attempts(models.ScopedSession, 30), 0)
+        self.assertIsNotNone(models.ScopedSession.query(models.Attempt).get(attempt_id))
+
+    def test_attempts_waiting_for_checkout_are_kept(self):
+        attempt_id = self._makeOne(proceed_to_checkout=True).id
+
+        self.assertEqual(archive.archive_attempts(models.ScopedSession, 30), 0)
+        self.assertIsNotNone(models.ScopedSession.query(models.Attempt).get(attempt_id))
+
+    def test_attempts_with_pending_notifications_are_kept(self):
+        attempt = self._makeOne()
+        models.ScopedSession.add(models.Notification(kind='notice', attempt=attempt))
+        models.ScopedSession.flush()
+
+        self.assertEqual(archive.archive_attempts(models.ScopedSession, 30), 0)
+        self.assertIsNotNone(models.ScopedSession.query(models.Attempt).get(attempt.id))
+
+    def test_attempts_with_delivered_notifications_are_archived(self):
+        attempt = self._makeOne()
+        models.ScopedSession.add(models.Notification(kind='notice', attempt=attempt,
+            sent_at=datetime.datetime.now()))
+        models.ScopedSession.add(models.Notification(kind='notice', attempt=attempt,
+            failed_at=datetime.datetime.now()))
+        models.ScopedSession.flush()
+
+        self.assertEqual(archive.archive_attempts(models.ScopedSession, 30), 1)
+
+    def test_archiving_in_batches(self):
+        for i in range(3):
+            self._makeOne()
+
+        self.assertEqual(archive.archive_attempts(models.ScopedSession, 30, batch_size=2), 3)
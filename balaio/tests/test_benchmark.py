@@ -0,0 +1,75 @@
+# coding: utf-8
+import os
+import random
+import shutil
+import zipfile
+import tempfile
+import unittest
+
+from lxml import etree
+
+from balaio import benchmark
+
+
+class CorpusTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_make_article(self):
+        sample_xml, _ = benchmark.load_sample()
+        xml = etree.fromstring(benchmark.make_article(sample_xml, 'foo', references=7,
+                                                      authors=4, images=2))
+
+        self.assertEqual(len(xml.findall('.//ref-list/ref')), 7)
+        self.assertEqual(len(xml.findall('.//contrib-group/contrib[@contrib-type="author"]')), 4)
+        self.assertEqual(len(xml.findall('.//fig/graphic')), 2)
+        self.assertEqual(xml.findtext('.//article-id[@pub-id-type="doi"]'), '10.2471/BLT.13.foo')
+        self.assertTrue(xml.findtext('.//article-meta/permissions/license/license-p'))
+
+    def test_generate_corpus(self):
+        paths = benchmark.generate_corpus(self.directory, 2, seed=1, references=3,
+                                          images=1, image_size=1024)
+
+        self.assertEqual(len(paths), 2)
+        with zipfile.ZipFile(paths[0]) as pkg:
+            sizes = dict((os.path.splitext(info.filename)[1], info.file_size)
+                         for info in pkg.infolist())
+
+        self.assertEqual(sorted(sizes), ['.pdf', '.tif', '.xml'])
+        self.assertEqual(sizes['.tif'], 1024)
+
+    def test_corpus_is_reproducible(self):
+        sample_xml, _ = benchmark.load_sample()
+
+        self.assertEqual(benchmark.make_article(sample_xml, 'foo', rng=random.Random(1)),
+                         benchmark.make_article(sample_xml, 'foo', rng=random.Random(1)))
+
+
+class CompareTests(unittest.TestCase):
+
+    def _report(self, throughput=10, peak_memory=50, setup_time=0.01):
+        hists = {'wall': {'p50': setup_time}, 'cpu': {'p50': setup_time}}
+        return {'throughput': throughput, 'peak_memory': peak_memory,
+                'pipes': {'SetupPipe': hists}}
+
+    def _regressions(self, report, baseline):
+        return [row[0] for row in benchmark.compare(report, baseline, tolerance=0.1) if row[-1]]
+
+    def test_no_regressions(self):
+        self.assertEqual(self._regressions(self._report(), self._report()), [])
+
+    def test_lower_throughput_is_a_regression(self):
+        self.assertEqual(self._regressions(self._report(throughput=8), self._report()),
+                         ['throughput (attempts/s)'])
+
+    def test_slower_pipes_are_regressions(self):
+        self.assertEqual(self._regressions(self._report(setup_time=0.02), self._report()),
+                         ['SetupPipe wall p50 (ms)'])
+
+    def test_changes_below_min_time_are_noise(self):
+        self.assertEqual(self._regressions(self._report(setup_time=0.0002),
+                                           self._report(setup_time=0.0001)), [])
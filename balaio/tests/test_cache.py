@@ -0,0 +1,112 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from balaio import cache
+
+
+class MakeKeyTests(unittest.TestCase):
+
+    def test_criteria_order_is_irrelevant(self):
+        self.assertEqual(cache.make_key('issue', volume='30', number='4'),
+                         cache.make_key('issue', number='4', volume='30'))
+
+    def test_empty_criteria_are_ignored(self):
+        self.assertEqual(cache.make_key('issue', volume='30', number=None),
+                         cache.make_key('issue', volume='30'))
+
+    def test_namespaces_are_kept_apart(self):
+        self.assertNotEqual(cache.make_key('issue', volume='30'),
+                            cache.make_key('journal', volume='30'))
+
+
+class DiskCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _makeOne(self, **kwargs):
+        return cache.DiskCache(os.path.join(self.tmpdir, 'cache.db'), **kwargs)
+
+    def test_set_and_get(self):
+        disk_cache = self._makeOne()
+        disk_cache.set('foo', {'bar': 1})
+        self.assertEqual(disk_cache.get('foo'), {'bar': 1})
+
+    def test_unknown_keys_return_None(self):
+        self.assertIsNone(self._makeOne().get('foo'))
+
+    def test_entries_are_shared_among_instances(self):
+        self._makeOne().set('foo', {'bar': 1})
+        self.assertEqual(self._makeOne().get('foo'), {'bar': 1})
+
+    def test_expired_entries_are_not_returned(self):
+        disk_cache = self._makeOne(ttl=-1)
+        disk_cache.set('foo', {'bar': 1})
+        self.assertIsNone(disk_cache.get('foo'))
+
+    def test_negative_results(self):
+        disk_cache = self._makeOne()
+        disk_cache.set('foo', cache.MISSING)
+        self.assertIs(disk_cache.get('foo'), cache.MISSING)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        disk_cache = self._makeOne(max_entries=2)
+        disk_cache.set('foo', 1)
+        time.sleep(0.01)
+        disk_cache.set('bar', 2)
+        time.sleep(0.01)
+        disk_cache.get('foo')
+        time.sleep(0.01)
+        disk_cache.set('baz', 3)
+
+        self.assertEqual(disk_cache.get('foo'), 1)
+        self.assertIsNone(disk_cache.get('bar'))
+        self.assertEqual(disk_cache.get('baz'), 3)
+
+    def test_invalidate_key(self):
+        disk_cache = self._makeOne()
+        disk_cache.set('foo', 1)
+        disk_cache.set('bar', 2)
+        disk_cache.invalidate('foo')
+
+        self.assertIsNone(disk_cache.get('foo'))
+        self.assertEqual(disk_cache.get('bar'), 2)
+
+    def test_invalidate_issn(self):
+        disk_cache = self._makeOne()
+        disk_cache.set('foo', 1, issn='0100-879X')
+        disk_cache.set('bar', 2, issn='1234-1234')
+        disk_cache.invalidate(issn='0100-879X')
+
+        self.assertIsNone(disk_cache.get('foo'))
+        self.assertEqual(disk_cache.get('bar'), 2)
+
+    def test_get_or_fetch_calls_fetch_once(self):
+        disk_cache = self._makeOne()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return {'bar': 1}
+
+        self.assertEqual(disk_cache.get_or_fetch('foo', fetch), {'bar': 1})
+        self.assertEqual(disk_cache.get_or_fetch('foo', fetch), {'bar': 1})
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_fetch_caches_ValueError(self):
+        disk_cache = self._makeOne()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            raise ValueError()
+
+        self.assertRaises(ValueError, lambda: disk_cache.get_or_fetch('foo', fetch))
+        self.assertRaises(ValueError, lambda: disk_cache.get_or_fetch('foo', fetch))
+        self.assertEqual(len(calls), 1)
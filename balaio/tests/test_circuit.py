@@ -0,0 +1,138 @@
+import os
+import time
+import tempfile
+import unittest
+
+from scieloapi.exceptions import ServiceUnavailable, NotFound
+
+from balaio import circuit, excepts
+
+
+def fail_with(exc):
+    def func():
+        raise exc
+    return func
+
+
+class GuardTests(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.store = circuit.StateStore(self.path)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _makeOne(self, **kwargs):
+        return circuit.Guard('manager', self.store, **kwargs)
+
+    def _fail(self, guard, times, exc=ServiceUnavailable):
+        for i in range(times):
+            self.assertRaises(exc, guard.call, fail_with(exc()))
+
+    def test_results_are_returned(self):
+        self.assertEqual(self._makeOne().call(lambda x: x * 2, 21), 42)
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        guard = self._makeOne(failure_threshold=3)
+        self._fail(guard, 3)
+
+        self.assertRaises(excepts.CircuitOpenError, guard.call, lambda: None)
+        self.assertEqual(self.store.get('manager')['state'], circuit.OPEN)
+
+    def test_successes_reset_the_failures(self):
+        guard = self._makeOne(failure_threshold=3)
+        self._fail(guard, 2)
+        guard.call(lambda: None)
+        self._fail(guard, 2)
+
+        self.assertEqual(guard.call(lambda: 1), 1)
+
+    def test_other_errors_are_not_failures(self):
+        guard = self._makeOne(failure_threshold=1)
+        self._fail(guard, 2, exc=NotFound)
+
+        self.assertEqual(guard.call(lambda: 1), 1)
+
+    def test_open_circuit_is_shared(self):
+        self._fail(self._makeOne(failure_threshold=1), 1)
+        other = circuit.Guard('manager', circuit.StateStore(self.path))
+
+        self.assertRaises(excepts.CircuitOpenError, other.call, lambda: None)
+        self.assertEqual(circuit.Guard('doi', self.store).call(lambda: 1), 1)
+
+    def test_trial_call_closes_the_circuit(self):
+        guard = self._makeOne(failure_threshold=1, reset_timeout=0)
+        self._fail(guard, 1)
+
+        self.assertEqual(guard.call(lambda: 1), 1)
+        self.assertEqual(self.store.get('manager')['state'], circuit.CLOSED)
+
+    def test_failed_trial_call_opens_the_circuit_again(self):
+        guard = self._makeOne(failure_threshold=5, reset_timeout=0)
+        self._fail(guard, 5)
+        self._fail(guard, 1)
+
+        self.assertEqual(self.store.get('manager')['state'], circuit.OPEN)
+
+    def test_only_one_trial_call_at_a_time(self):
+        guard = self._makeOne(failure_threshold=1, reset_timeout=0)
+        self._fail(guard, 1)
+        guard.reset_timeout = 60
+        other = circuit.Guard('manager', circuit.StateStore(self.path))
+
+        def trial():
+            self.assertRaises(excepts.CircuitOpenError, other.call, lambda: None)
+
+        guard.call(trial)
+
+    def test_calls_are_rate_limited(self):
+        guard = self._makeOne(rate=50, burst=2)
+        started = time.time()
+        for i in range(7):
+            guard.call(lambda: None)
+
+        # 2 calls in the burst, then 5 at 50 per second.
+        self.assertTrue(time.time() - started >= 0.09)
+
+    def test_burst_is_not_delayed(self):
+        guard = self._makeOne(rate=1, burst=5)
+        started = time.time()
+        for i in range(5):
+            guard.call(lambda: None)
+
+        self.assertTrue(time.time() - started < 0.5)
+
+
+class ConfigStub(object):
+    def __init__(self, path):
+        self.path = path
+
+    def has_option(self, section, option):
+        return True
+
+    def get(self, section, option):
+        return self.path
+
+    def getint(self, section, option):
+        return 3
+
+    getfloat = getint
+
+
+class GuardFromConfigTests(unittest.TestCase):
+
+    def test_disabled_without_path(self):
+        self.assertIsNone(circuit.guard_from_config(ConfigStub(''), 'manager'))
+
+    def test_stores_are_shared_by_path(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            guard = circuit.guard_from_config(ConfigStub(path), 'manager')
+            self.assertIs(circuit.guard_from_config(ConfigStub(path), 'doi').store, guard.store)
+            self.assertEqual(guard.rate, 3)
+        finally:
+            circuit._stores.pop(path, None)
+            os.remove(path)
@@ -0,0 +1,207 @@
+import unittest
+import datetime
+
+import transaction
+from sqlalchemy.exc import OperationalError
+from scieloapi.exceptions import APIError, ServiceUnavailable
+
+from balaio import models
+from balaio import dispatcher
+from balaio.notifier import Notifier
+from balaio.tests import modelfactories
+from balaio.tests.utils import db_bootstrap, DB_READY
+
+
+def setUpModule():
+    """
+    Initialize the database.
+    """
+    try:
+        db_bootstrap()
+    except OperationalError:
+        pass
+
+
+class EndpointRecorder(object):
+    def __init__(self, name, client):
+        self.name = name
+        self.client = client
+
+    def post(self, data):
+        if (self.client.fail_with is not None and self.client.fail_on in (None, self.name) and
+                len(self.client.posted) >= self.client.fail_after):
+            raise self.client.fail_with
+
+        self.client.posted.append((self.name, data))
+        return len(self.client.posted)
+
+
+class ManagerRecorder(object):
+    """
+    Records the data posted to each endpoint, or raises `fail_with` on
+    the endpoint `fail_on`, or on all of them, once `fail_after` posts
+    were recorded.
+    """
+    def __init__(self, fail_with=None, fail_on=None, fail_after=0):
+        self.posted = []
+        self.fail_with = fail_with
+        self.fail_on = fail_on
+        self.fail_after = fail_after
+        self.checkins_articles = EndpointRecorder('checkins_articles', self)
+        self.checkins = EndpointRecorder('checkins', self)
+        self.notices = EndpointRecorder('notices', self)
+
+
+@unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+class DispatcherTests(unittest.TestCase):
+
+    def tearDown(self):
+        transaction.abort()
+        with transaction.manager:
+            session = models.ScopedSession
+            session.query(models.Notification).delete()
+            session.query(models.Notice).delete()
+            session.query(models.Checkpoint).delete()
+            session.query(models.Attempt).delete()
+            session.query(models.ArticlePkg).delete()
+        models.ScopedSession.remove()
+
+    def _notify(self, point=models.Point.checkin, notices=1, coalesce=False):
+        """
+        Writes the notifications of a checkpoint to the outbox, and
+        returns the attempt id.
+        """
+        with transaction.manager:
+            checkpoint = modelfactories.CheckpointFactory(point=point)
+            notifier = Notifier(checkpoint, ManagerRecorder(), models.ScopedSession,
+                                outbox=True, coalesce=coalesce)
+            notifier.start()
+            for i in range(notices):
+                notifier.tell('foo %s' % i, models.Status.ok, label='bar')
+            if coalesce:
+                notifier.end()
+            attempt_id = checkpoint.attempt.id
+
+        models.ScopedSession.remove()
+        return attempt_id
+
+    def _notifications(self, attempt_id):
+        return models.ScopedSession.query(models.Notification).filter_by(
+            attempt_id=attempt_id).order_by(models.Notification.id).all()
+
+    def test_notifier_writes_to_the_outbox(self):
+        attempt_id = self._notify(notices=2)
+
+        self.assertEqual([n.kind for n in self._notifications(attempt_id)],
+                         ['checkin', 'notice', 'notice'])
+
+    def test_checkin_is_delivered_before_the_notices(self):
+        attempt_id = self._notify(notices=2)
+        client = ManagerRecorder()
+
+        self.assertEqual(dispatcher.Dispatcher(client).run_once(), 3)
+        self.assertEqual([name for name, data in client.posted],
+                         ['checkins_articles', 'checkins', 'notices', 'notices'])
+
+        attempt = models.ScopedSession.query(models.Attempt).get(attempt_id)
+        self.assertEqual(attempt.checkin_uri, '/api/v1/checkins/2/')
+        self.assertEqual(client.posted[2][1]['checkin'], '/api/v1/checkins/2/')
+        self.assertEqual(client.posted[2][1]['message'], 'foo 0')
+        self.assertTrue(all(n.sent_at for n in self._notifications(attempt_id)))
+
+    def test_delivered_notifications_are_not_delivered_again(self):
+        self._notify()
+        client = ManagerRecorder()
+        dispatcher.Dispatcher(client).run_once()
+
+        self.assertEqual(dispatcher.Dispatcher(client).run_once(), 0)
+        self.assertEqual(len(client.posted), 3)
+
+    def test_unavailable_manager_defers_the_attempt(self):
+        attempt_id = self._notify()
+        dispatcher.Dispatcher(ManagerRecorder(fail_with=ServiceUnavailable())).run_once()
+
+        checkin, notice = self._notifications(attempt_id)
+        self.assertIsNone(checkin.sent_at)
+        self.assertEqual(checkin.tries, 1)
+        self.assertTrue(checkin.next_try_at > datetime.datetime.now())
+        # the notice waits for the checkin.
+        self.assertEqual(notice.tries, 0)
+
+        models.ScopedSession.remove()
+        self.assertEqual(dispatcher.Dispatcher(ManagerRecorder()).run_once(), 0)
+
+    def test_rejected_notifications_are_not_retried(self):
+        attempt_id = self._notify(point=models.Point.validation)
+        dispatcher.Dispatcher(ManagerRecorder(fail_with=APIError())).run_once()
+
+        notice, = self._notifications(attempt_id)
+        self.assertIsNone(notice.sent_at)
+        self.assertIsNotNone(notice.failed_at)
+
+        models.ScopedSession.remove()
+        self.assertEqual(dispatcher.Dispatcher(ManagerRecorder()).run_once(), 0)
+
+    def test_rejected_checkin_fails_the_notices_of_the_attempt(self):
+        attempt_id = self._notify(notices=2)
+        other_id = self._notify()
+        client = ManagerRecorder(fail_with=APIError(), fail_on='checkins')
+        dispatcher.Dispatcher(client).run_once()
+
+        self.assertEqual([name for name, data in client.posted],
+                         ['checkins_articles', 'checkins_articles'])
+        self.assertTrue(all(n.failed_at for n in self._notifications(attempt_id)))
+        self.assertTrue(all(n.failed_at for n in self._notifications(other_id)))
+
+        models.ScopedSession.remove()
+        self.assertEqual(dispatcher.Dispatcher(ManagerRecorder()).run_once(), 0)
+
+    def test_notices_of_attempts_without_checkin_are_rejected(self):
+        attempt_id = self._notify(point=models.Point.validation)
+        client = ManagerRecorder()
+        dispatcher.Dispatcher(client).run_once()
+
+        notice, = self._notifications(attempt_id)
+        self.assertIsNotNone(notice.failed_at)
+        self.assertEqual(client.posted, [])
+
+    def test_batches_are_limited_to_batch_size(self):
+        self._notify(notices=4)
+        client = ManagerRecorder()
+
+        self.assertEqual(dispatcher.Dispatcher(client, batch_size=2).run_once(), 2)
+        self.assertEqual(dispatcher.Dispatcher(client, batch_size=2).run_once(), 2)
+        self.assertEqual(dispatcher.Dispatcher(client, batch_size=2).run_once(), 1)
+
+    def test_coalesced_notices_are_delivered_in_a_single_post(self):
+        attempt_id = self._notify(notices=3, coalesce=True)
+        client = ManagerRecorder()
+
+        self.assertEqual([n.kind for n in self._notifications(attempt_id)],
+                         ['checkin', 'notices'])
+        dispatcher.Dispatcher(client).run_once()
+
+        name, data = client.posted[-1]
+        self.assertEqual(name, 'notices')
+        self.assertEqual(data['checkin'], '/api/v1/checkins/2/')
+        self.assertEqual([notice['message'] for notice in data['notices']],
+                         ['foo 0', 'foo 1', 'foo 2'])
+
+    def test_coalesced_notices_posted_one_by_one_are_not_posted_again(self):
+        attempt_id = self._notify(notices=3, coalesce=True)
+        # the checkin and the first notice are posted.
+        client = ManagerRecorder(fail_with=ServiceUnavailable(), fail_on='notices', fail_after=3)
+        client._rejects_notice_lists = True
+        dispatcher.Dispatcher(client).run_once()
+
+        checkin, notices = self._notifications(attempt_id)
+        self.assertIsNone(notices.sent_at)
+        self.assertEqual(notices.payload['posted'], 1)
+
+        notices.next_try_at = None
+        transaction.commit()
+        client = ManagerRecorder()
+        dispatcher.Dispatcher(client).run_once()
+
+        self.assertEqual([data['message'] for name, data in client.posted],
+                         ['foo 1', 'foo 2'])
@@ -0,0 +1,190 @@
+import time
+import datetime
+import threading
+import unittest
+
+from requests.exceptions import ConnectionError
+from sqlalchemy.exc import OperationalError
+
+from balaio import doi, models, excepts
+from .utils import db_bootstrap, DB_READY
+
+
+global_engine = None
+
+
+def setUpModule():
+    """
+    Initialize the database.
+    """
+    global global_engine
+    try:
+        global_engine = db_bootstrap()
+    except OperationalError:
+        # global_engine remains None, all db-bound testcases
+        # need to test for DB_READY before run.
+        pass
+
+
+LANDING_PAGE = 'http://www.scielo.br/scielo.php?script=sci_arttext&pid=S0001-37652013000100008'
+
+
+class ResponseStub(object):
+    def __init__(self, status_code, location=None):
+        self.status_code = status_code
+        self.headers = {'location': location} if location else {}
+
+
+class HTTPSessionStub(object):
+    """
+    Answers HEAD requests with `status_code` and `location` after `delay`
+    seconds, or raises `exc`.
+    """
+    def __init__(self, status_code=302, location=LANDING_PAGE, exc=None, delay=0):
+        self.status_code = status_code
+        self.location = location
+        self.exc = exc
+        self.delay = delay
+        self.requested = []
+        self._lock = threading.Lock()
+
+    def head(self, url, **kwargs):
+        with self._lock:
+            self.requested.append(url)
+        time.sleep(self.delay)
+        if self.exc:
+            raise self.exc
+        return ResponseStub(self.status_code, self.location)
+
+
+class OpenGuardStub(object):
+    def call(self, func, *args, **kwargs):
+        raise excepts.CircuitOpenError('doi is unavailable')
+
+
+class GuardStub(object):
+    def __init__(self):
+        self.calls = 0
+
+    def call(self, func, *args, **kwargs):
+        self.calls += 1
+        return func(*args, **kwargs)
+
+
+@unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+class DOIResolverTests(unittest.TestCase):
+
+    def tearDown(self):
+        global_engine.execute(models.DOIStatus.__table__.delete())
+
+    def _makeOne(self, http=None, **kwargs):
+        resolver = doi.DOIResolver(global_engine, **kwargs)
+        resolver.http = http or HTTPSessionStub()
+        return resolver
+
+    def _wait_prefetch(self, resolver):
+        for i in range(100):
+            if not resolver._pending:
+                break
+            time.sleep(0.01)
+
+    def test_registered_doi(self):
+        resolver = self._makeOne(HTTPSessionStub(302))
+        self.assertTrue(resolver('10.1590/S0001-37652013000100008'))
+
+    def test_doi_is_resolved_over_https(self):
+        http = HTTPSessionStub()
+        self._makeOne(http)('10.1590/S0001-37652013000100008')
+        self.assertEqual(http.requested, ['https://doi.org/10.1590/S0001-37652013000100008'])
+
+    def test_unregistered_doi(self):
+        resolver = self._makeOne(HTTPSessionStub(404, location=None))
+        self.assertFalse(resolver('10.1590/S0001-37652013000100008'))
+
+    def test_redirect_to_https_is_unknown(self):
+        # dx.doi.org answers http requests this way, registered or not.
+        resolver = self._makeOne(HTTPSessionStub(
+            301, location='https://doi.org/10.1590/S0001-37652013000100008'))
+        self.assertIsNone(resolver('10.1590/S0001-37652013000100008'))
+
+    def test_redirect_within_doi_org_is_unknown(self):
+        resolver = self._makeOne(HTTPSessionStub(
+            302, location='https://www.doi.org/notfound.html'))
+        self.assertIsNone(resolver('10.1590/S0001-37652013000100008'))
+
+    def test_server_errors_are_unknown(self):
+        resolver = self._makeOne(HTTPSessionStub(503, location=None))
+        self.assertIsNone(resolver('10.1590/S0001-37652013000100008'))
+
+    def test_status_is_stored(self):
+        http = HTTPSessionStub()
+        self._makeOne(http)('10.1590/S0001-37652013000100008')
+        self.assertTrue(self._makeOne(http)('10.1590/S0001-37652013000100008'))
+        self.assertEqual(len(http.requested), 1)
+
+    def test_expired_status_is_checked_again(self):
+        http = HTTPSessionStub(404, location=None)
+        resolver = self._makeOne(http, negative_ttl=-1)
+        resolver('10.1590/S0001-37652013000100008')
+        resolver('10.1590/S0001-37652013000100008')
+        self.assertEqual(len(http.requested), 2)
+
+    def test_network_failures_return_None(self):
+        resolver = self._makeOne(HTTPSessionStub(exc=ConnectionError()))
+        self.assertIsNone(resolver('10.1590/S0001-37652013000100008'))
+
+    def test_no_requests_during_outage_backoff(self):
+        http = HTTPSessionStub(exc=ConnectionError())
+        resolver = self._makeOne(http)
+        resolver('10.1590/S0001-37652013000100008')
+        self.assertIsNone(resolver('10.1590/S0001-37652013000100002'))
+        self.assertEqual(len(http.requested), 1)
+
+    def test_unknown_status_is_not_stored(self):
+        self._makeOne(HTTPSessionStub(exc=ConnectionError()))('10.1590/S0001-37652013000100008')
+        self.assertEqual(global_engine.execute(
+            models.DOIStatus.__table__.count()).scalar(), 0)
+
+    def test_prefetched_dois_are_not_requested_again(self):
+        http = HTTPSessionStub()
+        resolver = self._makeOne(http)
+        resolver.prefetch(['10.1590/S0001-37652013000100008', '10.1590/S0001-37652013000100002'])
+
+        self.assertTrue(resolver('10.1590/S0001-37652013000100008'))
+        self.assertTrue(resolver('10.1590/S0001-37652013000100002'))
+        self.assertEqual(len(http.requested), 2)
+
+    def test_prefetched_statuses_are_stored_without_lookups(self):
+        resolver = self._makeOne()
+        resolver.prefetch(['10.1590/S0001-37652013000100008', '10.1590/S0001-37652013000100002'])
+        self._wait_prefetch(resolver)
+
+        self.assertEqual(resolver._pending, {})
+        self.assertEqual(global_engine.execute(
+            models.DOIStatus.__table__.count()).scalar(), 2)
+
+    def test_timed_out_prefetch_is_stored(self):
+        http = HTTPSessionStub(delay=0.2)
+        resolver = self._makeOne(http, timeout=0.01)
+        resolver.prefetch(['10.1590/S0001-37652013000100008'])
+
+        self.assertIsNone(resolver('10.1590/S0001-37652013000100008'))
+        self._wait_prefetch(resolver)
+        self.assertTrue(resolver('10.1590/S0001-37652013000100008'))
+        self.assertEqual(len(http.requested), 1)
+
+    def test_requests_go_through_the_guard(self):
+        http = HTTPSessionStub()
+        guard = GuardStub()
+        resolver = self._makeOne(http, guard=guard)
+
+        self.assertTrue(resolver('10.1590/S0001-37652013000100008'))
+        self.assertEqual(guard.calls, 1)
+        self.assertEqual(len(http.requested), 1)
+
+    def test_open_circuit_returns_None_without_requests(self):
+        http = HTTPSessionStub()
+        resolver = self._makeOne(http, guard=OpenGuardStub())
+
+        self.assertIsNone(resolver('10.1590/S0001-37652013000100008'))
+        self.assertEqual(http.requested, [])
@@ -52,6 +52,74 @@ class DBConnectionTests(mocker.MockerTestCase):
              'status': True})
 
 
+class ReplicaLagTests(mocker.MockerTestCase):
+
+    def _mock_engine(self, dialect='postgresql'):
+        mock_engine = self.mocker.mock()
+        mock_engine.dialect.name
+        self.mocker.result(dialect)
+        return mock_engine
+
+    def test_lag_under_the_threshold(self):
+        mock_engine = self._mock_engine()
+        mock_engine.scalar(mocker.ANY)
+        self.mocker.result(2.5)
+        self.mocker.replay()
+
+        replica_lag = health.ReplicaLag(mock_engine, 30)
+        self.assertTrue(replica_lag())
+
+    def test_lag_over_the_threshold(self):
+        mock_engine = self._mock_engine()
+        mock_engine.scalar(mocker.ANY)
+        self.mocker.result(45.0)
+        self.mocker.replay()
+
+        replica_lag = health.ReplicaLag(mock_engine, 30)
+        self.assertFalse(replica_lag())
+
+    def test_replica_in_sync_has_no_lag(self):
+        mock_engine = self._mock_engine()
+        mock_engine.scalar(mocker.MATCH(
+            lambda sql: 'pg_last_xlog_receive_location() = pg_last_xlog_replay_location()' in sql))
+        self.mocker.result(0)
+        self.mocker.replay()
+
+        replica_lag = health.ReplicaLag(mock_engine, 30)
+        self.assertEqual(replica_lag.lag(), 0)
+
+    def test_unknown_lag_is_acceptable(self):
+        mock_engine = self._mock_engine()
+        mock_engine.scalar(mocker.ANY)
+        self.mocker.result(None)
+        self.mocker.replay()
+
+        replica_lag = health.ReplicaLag(mock_engine, 30)
+        self.assertTrue(replica_lag())
+
+    def test_exceptions_return_false(self):
+        from sqlalchemy.exc import OperationalError
+
+        mock_engine = self._mock_engine()
+        mock_engine.scalar(mocker.ANY)
+        self.mocker.throw(OperationalError('foo', None, None))
+        self.mocker.replay()
+
+        replica_lag = health.ReplicaLag(mock_engine, 30)
+        self.assertFalse(replica_lag())
+
+    def test_status_is_cached_during_refresh_rate(self):
+        mock_engine = self._mock_engine()
+        mock_engine.scalar(mocker.ANY)
+        self.mocker.result(2.5)
+        self.mocker.count(1)
+        self.mocker.replay()
+
+        replica_lag = health.ReplicaLag(mock_engine, 30, refresh=60)
+        self.assertTrue(replica_lag())
+        self.assertTrue(replica_lag())
+
+
 class CheckListTests(mocker.MockerTestCase):
 
     def test_refresh_in_minutes(self):
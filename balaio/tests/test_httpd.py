@@ -103,6 +103,8 @@ class AttemptFunctionalAPITest(unittest.TestCase):
                        "proceed_to_checkout": false,
                        "checkout_started_at": null,
                        "queued_checkout": null,
+                       "summary": {"current_point": null, "checkin": null, "validation": null, "checkout": null,
+                                   "notices": {"ok": 0, "warning": 0, "error": 0}, "updated_at": null},
                        "is_valid": true,
                        "started_at": "2013-10-09 16:44:29.865787",
                        "id": %s,
@@ -111,6 +113,20 @@ class AttemptFunctionalAPITest(unittest.TestCase):
 
         self.assertEqual(json.loads(res.body), json.loads(expected))
 
+    def test_GET_to_archived_attempt(self):
+        attempt = self._loaded_fixtures[0]
+        models.ScopedSession.flush()
+
+        archived = models.ArchivedAttempt.from_attempt(attempt)
+        models.ScopedSession.delete(attempt)
+        models.ScopedSession.add(archived)
+        models.ScopedSession.flush()
+
+        res = self.testapp.get('/api/v1/attempts/%s/' % archived.id, status=200)
+
+        self.assertEqual(json.loads(res.body)['package_checksum'], archived.package_checksum)
+        self.assertEqual(json.loads(res.body)['archived_at'], str(archived.archived_at))
+
     def test_GET_to_attempts(self):
         attempt0_id = self._loaded_fixtures[0].id
         attempt0_checksum = self._loaded_fixtures[0].package_checksum
@@ -139,6 +155,8 @@ class AttemptFunctionalAPITest(unittest.TestCase):
                             "proceed_to_checkout": false,
                             "checkout_started_at": null,
                             "queued_checkout": null,
+                            "summary": {"current_point": null, "checkin": null, "validation": null, "checkout": null,
+                                        "notices": {"ok": 0, "warning": 0, "error": 0}, "updated_at": null},
                             "resource_uri": "/api/v1/attempts/%s/"},
                            {"collection_uri": "",
                             "filepath": "/tmp/watch/xxx.zip",
@@ -151,6 +169,8 @@ class AttemptFunctionalAPITest(unittest.TestCase):
                             "proceed_to_checkout": false,
                             "checkout_started_at": null,
                             "queued_checkout": null,
+                            "summary": {"current_point": null, "checkin": null, "validation": null, "checkout": null,
+                                        "notices": {"ok": 0, "warning": 0, "error": 0}, "updated_at": null},
                             "resource_uri": "/api/v1/attempts/%s/"},
                            {"collection_uri": "",
                             "filepath": "/tmp/watch/xxx.zip",
@@ -163,6 +183,8 @@ class AttemptFunctionalAPITest(unittest.TestCase):
                             "proceed_to_checkout": false,
                             "checkout_started_at": null,
                             "queued_checkout": null,
+                            "summary": {"current_point": null, "checkin": null, "validation": null, "checkout": null,
+                                        "notices": {"ok": 0, "warning": 0, "error": 0}, "updated_at": null},
                             "resource_uri": "/api/v1/attempts/%s/"}
                         ]
                     }''' % (articlepkg0_id, attempt0_id, attempt0_checksum, attempt0_id,
@@ -199,6 +221,8 @@ class AttemptFunctionalAPITest(unittest.TestCase):
                             "proceed_to_checkout": false,
                             "checkout_started_at": null,
                             "queued_checkout": null,
+                            "summary": {"current_point": null, "checkin": null, "validation": null, "checkout": null,
+                                        "notices": {"ok": 0, "warning": 0, "error": 0}, "updated_at": null},
                             "resource_uri": "/api/v1/attempts/%s/"},
                            {"collection_uri": "",
                             "filepath": "/tmp/watch/xxx.zip",
@@ -211,6 +235,8 @@ class AttemptFunctionalAPITest(unittest.TestCase):
                             "proceed_to_checkout": false,
                             "checkout_started_at": null,
                             "queued_checkout": null,
+                            "summary": {"current_point": null, "checkin": null, "validation": null, "checkout": null,
+                                        "notices": {"ok": 0, "warning": 0, "error": 0}, "updated_at": null},
                             "resource_uri": "/api/v1/attempts/%s/"},
                            {"collection_uri": "",
                             "filepath": "/tmp/watch/xxx.zip",
@@ -223,6 +249,8 @@ class AttemptFunctionalAPITest(unittest.TestCase):
                             "proceed_to_checkout": false,
                             "checkout_started_at": null,
                             "queued_checkout": null,
+                            "summary": {"current_point": null, "checkin": null, "validation": null, "checkout": null,
+                                        "notices": {"ok": 0, "warning": 0, "error": 0}, "updated_at": null},
                             "resource_uri": "/api/v1/attempts/%s/"}
                     ]}'''% (articlepkg0_id, attempt0_id, attempt0_checksum, attempt0_id,
                             articlepkg1_id, attempt1_id, attempt1_checksum, attempt1_id,
@@ -255,6 +283,8 @@ class AttemptFunctionalAPITest(unittest.TestCase):
                           "proceed_to_checkout": false,
                           "checkout_started_at": null,
                           "queued_checkout": null,
+                          "summary": {"current_point": null, "checkin": null, "validation": null, "checkout": null,
+                                      "notices": {"ok": 0, "warning": 0, "error": 0}, "updated_at": null},
                           "resource_uri": "/api/v1/attempts/%s/"},
                          {"collection_uri": "",
                           "filepath": "/tmp/watch/xxx.zip",
@@ -267,6 +297,8 @@ class AttemptFunctionalAPITest(unittest.TestCase):
                           "proceed_to_checkout": false,
                           "checkout_started_at": null,
                           "queued_checkout": null,
+                          "summary": {"current_point": null, "checkin": null, "validation": null, "checkout": null,
+                                      "notices": {"ok": 0, "warning": 0, "error": 0}, "updated_at": null},
                           "resource_uri": "/api/v1/attempts/%s/"}
                         ]}''' % (articlepkg1_id, attempt1_id, attempt1_checksum, attempt1_id,
                                  articlepkg2_id, attempt2_id, attempt2_checksum, attempt2_id)
@@ -303,6 +335,8 @@ class AttemptFunctionalAPITest(unittest.TestCase):
                           "proceed_to_checkout": false,
                           "checkout_started_at": null,
                           "queued_checkout": null,
+                          "summary": {"current_point": null, "checkin": null, "validation": null, "checkout": null,
+                                      "notices": {"ok": 0, "warning": 0, "error": 0}, "updated_at": null},
                           "resource_uri": "/api/v1/attempts/%s/"},
                          {"collection_uri": "",
                           "filepath": "/tmp/watch/xxx.zip",
@@ -315,6 +349,8 @@ class AttemptFunctionalAPITest(unittest.TestCase):
                           "proceed_to_checkout": false,
                           "checkout_started_at": null,
                           "queued_checkout": null,
+                          "summary": {"current_point": null, "checkin": null, "validation": null, "checkout": null,
+                                      "notices": {"ok": 0, "warning": 0, "error": 0}, "updated_at": null},
                           "resource_uri": "/api/v1/attempts/%s/"}
                         ]}''' % (articlepkg0_id, attempt0_id, attempt0_checksum, attempt0_id,
                                  articlepkg1_id, attempt1_id, attempt1_checksum, attempt1_id)
@@ -345,6 +381,8 @@ class AttemptFunctionalAPITest(unittest.TestCase):
                             "proceed_to_checkout": false,
                             "checkout_started_at": null,
                             "queued_checkout": null,
+                            "summary": {"current_point": null, "checkin": null, "validation": null, "checkout": null,
+                                        "notices": {"ok": 0, "warning": 0, "error": 0}, "updated_at": null},
                             "resource_uri": "/api/v1/attempts/%s/"},
                            {"collection_uri": "",
                             "filepath": "/tmp/watch/xxx.zip",
@@ -357,6 +395,8 @@ class AttemptFunctionalAPITest(unittest.TestCase):
                             "proceed_to_checkout": false,
                             "checkout_started_at": null,
                             "queued_checkout": null,
+                            "summary": {"current_point": null, "checkin": null, "validation": null, "checkout": null,
+                                        "notices": {"ok": 0, "warning": 0, "error": 0}, "updated_at": null},
                             "resource_uri": "/api/v1/attempts/%s/"}
                          ]}'''% (articlepkg1_id, attempt1_id, attempt1_checksum, attempt1_id,
                                  articlepkg2_id, attempt2_id, attempt2_checksum, attempt2_id)
@@ -379,6 +419,8 @@ class AttemptFunctionalAPITest(unittest.TestCase):
                             "proceed_to_checkout": false,
                             "checkout_started_at": null,
                             "queued_checkout": null,
+                            "summary": {"current_point": null, "checkin": null, "validation": null, "checkout": null,
+                                        "notices": {"ok": 0, "warning": 0, "error": 0}, "updated_at": null},
                             "is_valid": true,
                             "started_at": "2013-10-09 16:44:29.865787",
                             "id": %s,
@@ -386,6 +428,8 @@ class AttemptFunctionalAPITest(unittest.TestCase):
                             "proceed_to_checkout": false,
                             "checkout_started_at": null,
                             "queued_checkout": null,
+                            "summary": {"current_point": null, "checkin": null, "validation": null, "checkout": null,
+                                        "notices": {"ok": 0, "warning": 0, "error": 0}, "updated_at": null},
                             "resource_uri": "/api/v1/attempts/%s/"}
                          ]}''' % (articlepkg2_id, attempt2_id, attempt2_checksum, attempt2_id)
 
@@ -710,6 +754,118 @@ class PackageFunctionalAPITest(unittest.TestCase):
         self.assertEqual(json.loads(res.body), json.loads(expected))
 
 
+@unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+class SerializationQueriesFunctionalAPITest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+
+        app = httpd.main(ConfigStub(), global_engine)
+        self.testapp = TestApp(app)
+
+        # the health status is refreshed during the first request.
+        self.testapp.get('/', status=200)
+
+    def tearDown(self):
+        transaction.abort()
+        models.ScopedSession.remove()
+        testing.tearDown()
+
+    def _makeOne(self):
+        checkpoint = modelfactories.CheckpointFactory.create(point=models.Point.validation)
+        checkpoint.start()
+        checkpoint.tell('foo', models.Status.ok, label='bar')
+        checkpoint.tell('bar', models.Status.error, label='baz')
+        models.ScopedSession.flush()
+        return checkpoint.attempt
+
+    def _count_selects(self, url):
+        from sqlalchemy import event
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append(statement)
+
+        event.listen(global_engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            self.testapp.get(url, status=200)
+        finally:
+            event.remove(global_engine, 'before_cursor_execute', before_cursor_execute)
+
+        return len(statements)
+
+    def test_list_attempts_queries_do_not_grow_with_limit(self):
+        [self._makeOne() for i in range(2)]
+        expected = self._count_selects('/api/v1/attempts/?limit=2')
+
+        [self._makeOne() for i in range(4)]
+        self.assertEqual(self._count_selects('/api/v1/attempts/?limit=6'), expected)
+
+    def test_list_packages_queries_do_not_grow_with_limit(self):
+        [self._makeOne() for i in range(2)]
+        expected = self._count_selects('/api/v1/packages/?limit=2')
+
+        [self._makeOne() for i in range(4)]
+        self.assertEqual(self._count_selects('/api/v1/packages/?limit=6'), expected)
+
+    def test_attempt_notices_are_serialized(self):
+        attempt = self._makeOne()
+        res = self.testapp.get('/api/v1/attempts/%s/' % attempt.id)
+
+        notices = json.loads(res.body)['validation']['notices']
+        self.assertEqual([n['message'] for n in notices], ['foo', 'bar'])
+
+
+@unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+class ReplicaFunctionalAPITest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = testing.setUp()
+        self.replica_engine = create_engine(global_engine.url)
+        self.replica_engine.connect().close()
+
+        app = httpd.main(ConfigStub(), global_engine,
+                         replica_engine=self.replica_engine)
+        self.testapp = TestApp(app)
+
+    def tearDown(self):
+        transaction.abort()
+        models.ScopedSession.remove()
+        models.ReplicaScopedSession.remove()
+        self.replica_engine.dispose()
+        testing.tearDown()
+
+    def _count_selects(self, engine, url):
+        from sqlalchemy import event
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append(statement)
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            self.testapp.get(url, status=200)
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+        return len(statements)
+
+    def test_GET_requests_are_served_by_the_replica(self):
+        self.assertGreater(
+            self._count_selects(self.replica_engine, '/api/v1/attempts/'), 0)
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        import datetime
+        replica_lag = self.testapp.app.registry.replica_lag
+        replica_lag._refreshed_at = datetime.datetime.now()
+        replica_lag._status = False
+
+        self.assertEqual(
+            self._count_selects(self.replica_engine, '/api/v1/attempts/'), 0)
+
+
 class AttemptsAPITest(unittest.TestCase):
 
     def setUp(self):
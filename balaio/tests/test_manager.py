@@ -0,0 +1,168 @@
+import unittest
+
+import requests
+from scieloapi import exceptions
+
+from balaio import manager, excepts
+
+
+class ResponseStub(object):
+    def __init__(self, status_code, data=None, location=None):
+        self.status_code = status_code
+        self.data = data
+        self.headers = {'location': location}
+
+    def json(self):
+        return self.data
+
+
+class HTTPSessionStub(object):
+    """
+    Answers every request with `response`, or raises `exc`.
+    """
+    def __init__(self, response=None, exc=None):
+        self.response = response
+        self.exc = exc
+        self.requested = []
+
+    def _request(self, url, **kwargs):
+        self.requested.append((url, kwargs))
+        if self.exc:
+            raise self.exc
+        return self.response
+
+    get = post = _request
+
+
+class HTTPBrokerTests(unittest.TestCase):
+
+    def _makeOne(self, session, **kwargs):
+        broker = manager.HTTPBroker(**kwargs)
+        broker.session = session
+        return broker
+
+    def test_connections_are_pooled(self):
+        broker = manager.HTTPBroker(pool_size=4)
+        adapter = broker.session.get_adapter('http://manager.scielo.org/api/')
+
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertTrue(adapter._pool_block)
+        self.assertIs(adapter, broker.session.get_adapter('https://manager.scielo.org/api/'))
+
+    def test_get_returns_the_json_data(self):
+        session = HTTPSessionStub(ResponseStub(200, data={'foo': 'bar'}))
+        broker = self._makeOne(session, timeout=3)
+
+        self.assertEqual(broker.get('http://manager.scielo.org/api/v1/', endpoint='journals',
+                                    resource_id=1, auth=('user', 'key')), {'foo': 'bar'})
+
+        url, kwargs = session.requested[0]
+        self.assertEqual(url, 'http://manager.scielo.org/api/v1/journals/1/')
+        self.assertEqual(kwargs['timeout'], 3)
+        self.assertIn('auth', kwargs)
+
+    def test_get_raises_on_error_status(self):
+        broker = self._makeOne(HTTPSessionStub(ResponseStub(503)))
+
+        self.assertRaises(exceptions.ServiceUnavailable, broker.get,
+                          'http://manager.scielo.org/api/v1/', endpoint='journals')
+
+    def test_post_returns_the_location(self):
+        session = HTTPSessionStub(ResponseStub(201, location='/api/v1/notices/1/'))
+        broker = self._makeOne(session)
+
+        self.assertEqual(broker.post('http://manager.scielo.org/api/v1/', {'foo': 'bar'},
+                                     endpoint='notices'), '/api/v1/notices/1/')
+        self.assertEqual(session.requested[0][1]['data'], '{"foo": "bar"}')
+
+    def test_post_raises_on_unexpected_status(self):
+        broker = self._makeOne(HTTPSessionStub(ResponseStub(200)))
+
+        self.assertRaises(exceptions.APIError, broker.post,
+                          'http://manager.scielo.org/api/v1/', {}, endpoint='notices')
+
+    def test_network_errors_are_translated(self):
+        broker = self._makeOne(HTTPSessionStub(exc=requests.exceptions.Timeout()))
+
+        self.assertRaises(exceptions.Timeout, broker.get,
+                          'http://manager.scielo.org/api/v1/', endpoint='journals')
+
+
+class ConfigStub(object):
+    def __init__(self, **options):
+        self.options = options
+
+    def has_option(self, section, option):
+        return option in self.options
+
+    def get(self, section, option):
+        return ''
+
+    def getint(self, section, option):
+        return int(self.options[option])
+
+    def getfloat(self, section, option):
+        return float(self.options[option])
+
+
+class ClientFromConfigTests(unittest.TestCase):
+
+    def setUp(self):
+        self._create_client = manager.create_client
+        self.options = []
+
+        def create_client(*args, **kwargs):
+            self.options.append(kwargs)
+            return object()
+        manager.create_client = create_client
+
+    def tearDown(self):
+        manager.create_client = self._create_client
+        manager._client = None
+
+    def test_client_is_shared_by_the_process(self):
+        client = manager.client_from_config(ConfigStub())
+        self.assertIs(manager.client_from_config(ConfigStub()), client)
+
+    def test_pool_size_and_timeout_are_optional(self):
+        manager.client_from_config(ConfigStub())
+
+        self.assertNotIn('pool_size', self.options[0])
+        self.assertNotIn('timeout', self.options[0])
+
+    def test_pool_size_and_timeout_are_read_from_config(self):
+        manager.client_from_config(ConfigStub(pool_size='4', timeout='2.5'))
+
+        self.assertEqual(self.options[0]['pool_size'], 4)
+        self.assertEqual(self.options[0]['timeout'], 2.5)
+
+
+class GuardStub(object):
+    def __init__(self, is_open=False):
+        self.is_open = is_open
+        self.calls = 0
+
+    def call(self, func, *args, **kwargs):
+        if self.is_open:
+            raise excepts.CircuitOpenError('manager is unavailable')
+        self.calls += 1
+        return func(*args, **kwargs)
+
+
+class GuardedHTTPBrokerTests(unittest.TestCase):
+
+    def test_requests_go_through_the_guard(self):
+        guard = GuardStub()
+        broker = manager.HTTPBroker(guard=guard)
+        broker.session = HTTPSessionStub(ResponseStub(200, data={}))
+        broker.get('http://manager.scielo.org/api/v1/', endpoint='journals')
+
+        self.assertEqual(guard.calls, 1)
+
+    def test_open_circuit_means_unavailable(self):
+        broker = manager.HTTPBroker(guard=GuardStub(is_open=True))
+        broker.session = HTTPSessionStub(ResponseStub(201))
+
+        self.assertRaises(exceptions.ServiceUnavailable, broker.post,
+                          'http://manager.scielo.org/api/v1/', {}, endpoint='notices')
+        self.assertEqual(broker.session.requested, [])
@@ -11,6 +11,8 @@ from balaio.models import (
     Notice,
     Attempt,
     ArticlePkg,
+    ArchivedAttempt,
+    discard_pending_notices,
 )
 from . import doubles
 
@@ -101,6 +103,25 @@ class CheckpointTests(unittest.TestCase):
         self.assertEqual(chk_point.messages[0].message, 'Foo')
         self.assertEqual(chk_point.messages[0].status, Status.ok)
 
+    def test_tell_buffers_notices_until_flush(self):
+        chk_point = Checkpoint(Point.checkin)
+        chk_point.start()
+        chk_point.tell('Foo', Status.ok)
+        chk_point.tell('Bar', Status.ok)
+
+        self.assertEqual([n.message for n in chk_point._pending_notices], ['Foo', 'Bar'])
+
+    def test_rollback_discards_buffered_notices(self):
+        chk_point = Checkpoint(Point.checkin)
+        chk_point.start()
+        chk_point.tell('Foo', Status.ok)
+        session = doubles.SessionStub()
+        session.info = {'pending_notices': set([chk_point])}
+
+        discard_pending_notices(session)
+        self.assertEqual(chk_point._pending_notices, [])
+        self.assertNotIn('pending_notices', session.info)
+
     def test_tell_raises_RuntimeError_on_inactive_objects(self):
         chk_point = Checkpoint(Point.checkin)
         chk_point.start()
@@ -167,6 +188,69 @@ class AttemptTests(mocker.MockerTestCase):
         attempt = Attempt.get_from_package(pkg_analyzer)
         self.assertFalse(attempt.is_valid)
 
+    def test_is_closed_after_validation(self):
+        attempt = Attempt()
+        attempt.validation_ended_at = datetime.now()
+        self.assertTrue(attempt.is_closed())
+
+    def test_is_not_closed_while_waiting_for_validation(self):
+        attempt = Attempt(proceed_to_validation=True)
+        self.assertFalse(attempt.is_closed())
+
+    def test_is_not_closed_while_waiting_for_checkout(self):
+        attempt = Attempt(proceed_to_checkout=True)
+        attempt.validation_ended_at = datetime.now()
+        self.assertFalse(attempt.is_closed())
+
+    def test_invalid_attempts_are_closed(self):
+        attempt = Attempt(is_valid=False)
+        self.assertTrue(attempt.is_closed())
+
+    def test_update_summary_sets_current_point(self):
+        attempt = Attempt()
+        attempt.update_summary(Point.validation)
+
+        self.assertEqual(attempt.summary()['current_point'], 'validation')
+        self.assertIsNotNone(attempt.status_updated_at)
+
+    def test_update_summary_keeps_the_worst_status(self):
+        attempt = Attempt()
+        attempt.update_summary(Point.validation, status=Status.warning)
+        attempt.update_summary(Point.validation, status=Status.ok)
+
+        self.assertEqual(attempt.summary()['validation'], 'warning')
+        self.assertIsNone(attempt.summary()['checkin'])
+
+    def test_update_summary_counts_notices_by_status(self):
+        attempt = Attempt()
+        attempt.update_summary(Point.checkin, status=Status.ok)
+        attempt.update_summary(Point.validation, status=Status.error)
+        attempt.update_summary(Point.validation, status=Status.error)
+
+        self.assertEqual(attempt.summary()['notices'],
+                         {'ok': 1, 'warning': 0, 'error': 2})
+
+
+class ArchivedAttemptTests(unittest.TestCase):
+
+    def test_data_is_compressed(self):
+        archived = ArchivedAttempt()
+        archived.data = {'id': 1, 'notices': ['foo'] * 100}
+
+        self.assertLess(len(archived._data), len(str(archived.data)))
+        self.assertEqual(archived.data, {'id': 1, 'notices': ['foo'] * 100})
+
+    def test_from_attempt_keeps_the_serialized_form(self):
+        attempt = Attempt(id=1, package_checksum='foo')
+        archived = ArchivedAttempt.from_attempt(attempt)
+
+        self.assertEqual(archived.id, 1)
+        self.assertEqual(archived.data['package_checksum'], 'foo')
+        self.assertEqual(archived.data['started_at'], str(attempt.started_at))
+
+    def test_to_dict_includes_archived_at(self):
+        archived = ArchivedAttempt.from_attempt(Attempt(id=1))
+        self.assertEqual(archived.to_dict()['archived_at'], str(archived.archived_at))
 
 
 class ArticlePkgTests(mocker.MockerTestCase):
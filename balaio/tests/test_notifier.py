@@ -2,9 +2,12 @@ import unittest
 
 import mocker
 from sqlalchemy.exc import OperationalError
+import transaction
 
-from balaio.notifier import Notifier
+from balaio.notifier import Notifier, create_checkpoint_notifier
 from balaio import models
+from balaio import manager
+from balaio import validator, vpipes
 from . import doubles, modelfactories
 from .utils import db_bootstrap, DB_READY
 
@@ -27,6 +30,9 @@ def setUpModule():
 
 class NotifierTests(mocker.MockerTestCase):
 
+    def tearDown(self):
+        transaction.abort()
+
     def _makeOne(self, **kwargs):
         checkpoint = kwargs.get('checkpoint', modelfactories.CheckpointFactory())
         scieloapi = kwargs.get('scieloapi', doubles.ScieloAPIClientStub())
@@ -59,6 +65,74 @@ class NotifierTests(mocker.MockerTestCase):
 
         notifier.start()
 
+    @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+    def test_tell_updates_the_attempt_summary(self):
+        checkpoint = modelfactories.CheckpointFactory(point=models.Point.validation)
+        notifier = self._makeOne(checkpoint=checkpoint)
+
+        mock_notifier = self.mocker.patch(notifier)
+        mock_notifier._send_notice_notification('foo', models.Status.error, label='bar')
+        self.mocker.result(None)
+        self.mocker.replay()
+
+        notifier.start()
+        notifier.tell('foo', models.Status.error, label='bar')
+
+        summary = checkpoint.attempt.summary()
+        self.assertEqual(summary['current_point'], 'validation')
+        self.assertEqual(summary['validation'], 'error')
+        self.assertEqual(summary['notices']['error'], 1)
+
+    @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+    def test_notices_are_written_in_bulk(self):
+        from sqlalchemy import event
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('INSERT INTO notice'):
+                statements.append(parameters)
+
+        checkpoint = modelfactories.CheckpointFactory(point=models.Point.validation)
+        notifier = Notifier(checkpoint, doubles.ScieloAPIClientStub(),
+                            models.ScopedSession, manager_integration=False)
+        notifier.start()
+        for i in range(3):
+            notifier.tell('foo', models.Status.ok, label='bar')
+
+        event.listen(global_engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            models.ScopedSession.flush()
+        finally:
+            event.remove(global_engine, 'before_cursor_execute', before_cursor_execute)
+            transaction.abort()
+
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(len(statements[0]), 3)
+
+    @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+    def test_notices_of_persisted_checkpoints_are_committed(self):
+        session = models.ScopedSession
+        with transaction.manager:
+            checkpoint = modelfactories.CheckpointFactory(point=models.Point.validation)
+            checkpoint.start()
+            checkpoint_id = checkpoint.id
+        session.remove()
+
+        try:
+            # no other change is pending in the session.
+            with transaction.manager:
+                session.query(models.Checkpoint).get(checkpoint_id).tell('foo', models.Status.ok)
+            session.remove()
+
+            self.assertEqual(session.query(models.Notice).filter_by(
+                checkpoint_id=checkpoint_id).count(), 1)
+        finally:
+            transaction.abort()
+            with transaction.manager:
+                session.query(models.Notice).filter_by(checkpoint_id=checkpoint_id).delete()
+                session.query(models.Checkpoint).filter_by(id=checkpoint_id).delete()
+            session.remove()
+
     @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
     def test_send_checkout_notification_payload(self):
         checkpoint = modelfactories.CheckpointFactory(point=models.Point.checkout)
@@ -179,3 +253,174 @@ class NotifierTests(mocker.MockerTestCase):
         self.assertIsNone(notifier._send_notice_notification(
             'foo', models.Status.ok, label='bar'))
 
+
+    @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+    def test_coalesced_notices_are_sent_at_once_on_end(self):
+        checkpoint = modelfactories.CheckpointFactory(point=models.Point.validation)
+        checkpoint.attempt.checkin_uri = '/api/v1/checkins/1/'
+
+        expected = {
+            'checkin': '/api/v1/checkins/1/',
+            'checkpoint': 'validation',
+            'notices': [
+                {'stage': 'bar', 'message': 'foo', 'status': 'ok'},
+                {'stage': 'baz', 'message': 'qux', 'status': 'error'},
+            ],
+        }
+
+        mock_scieloapi = self.mocker.mock()
+        mock_scieloapi._rejects_notice_lists
+        self.mocker.result(False)
+        mock_scieloapi.notices.post(expected)
+        self.mocker.result(1)
+        self.mocker.replay()
+
+        notifier = Notifier(checkpoint, mock_scieloapi, doubles.SessionStub(), coalesce=True)
+        notifier.start()
+        notifier.tell('foo', models.Status.ok, label='bar')
+        notifier.tell('qux', models.Status.error, label='baz')
+        notifier.end()
+
+    @unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+    def test_coalesced_notices_fall_back_to_one_by_one(self):
+        from scieloapi.exceptions import BadRequest
+
+        checkpoint = modelfactories.CheckpointFactory(point=models.Point.validation)
+
+        mock_scieloapi = self.mocker.mock()
+        mock_scieloapi._rejects_notice_lists
+        self.mocker.result(False)
+        mock_scieloapi.notices.post(mocker.ANY)
+        self.mocker.throw(BadRequest)
+        mock_scieloapi._rejects_notice_lists = True
+        mock_scieloapi.notices.post({'checkin': None, 'checkpoint': 'validation',
+                                     'stage': 'bar', 'message': 'foo', 'status': 'ok'})
+        self.mocker.result(1)
+        mock_scieloapi.notices.post({'checkin': None, 'checkpoint': 'validation',
+                                     'stage': 'baz', 'message': 'qux', 'status': 'ok'})
+        self.mocker.result(2)
+        self.mocker.replay()
+
+        notifier = Notifier(checkpoint, mock_scieloapi, doubles.SessionStub(), coalesce=True)
+        notifier.start()
+        notifier.tell('foo', models.Status.ok, label='bar')
+        notifier.tell('qux', models.Status.ok, label='baz')
+        notifier.end()
+
+
+class ConfigStub(object):
+    def has_option(self, section, option):
+        return False
+
+    def getboolean(self, section, option):
+        return False
+
+
+class CoalescingConfigStub(ConfigStub):
+    def has_option(self, section, option):
+        return option in ('outbox', 'coalesce_notices')
+
+    def getboolean(self, section, option):
+        return option in ('outbox', 'coalesce_notices', 'notifications')
+
+
+class StageStub(vpipes.ValidationPipe):
+    def __init__(self, notifier, stage):
+        self._notifier = notifier
+        self._stage_ = stage
+
+    def validate(self, item):
+        return models.Status.ok, 'foo'
+
+
+@unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+class CheckpointNotifierFactoryTests(unittest.TestCase):
+
+    def setUp(self):
+        manager._client = doubles.ScieloAPIClientStub()
+        self.factory = create_checkpoint_notifier(ConfigStub(), models.Point.validation)
+
+    def tearDown(self):
+        manager._client = None
+        transaction.abort()
+
+    def _count_checkpoint_queries(self, func):
+        from sqlalchemy import event
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('SELECT checkpoint'):
+                statements.append(statement)
+
+        event.listen(global_engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            func()
+        finally:
+            event.remove(global_engine, 'before_cursor_execute', before_cursor_execute)
+
+        return len(statements)
+
+    def test_checkpoint_is_looked_up_once_per_transaction(self):
+        attempt = modelfactories.AttemptFactory()
+        session = models.ScopedSession
+
+        def notify():
+            notifier = self.factory(attempt, session)
+            self.assertIs(self.factory(attempt, session), notifier)
+
+        self.assertEqual(self._count_checkpoint_queries(notify), 1)
+
+    def test_notifiers_are_discarded_when_the_transaction_ends(self):
+        attempt = modelfactories.AttemptFactory()
+        session = models.ScopedSession
+        notifier = self.factory(attempt, session)
+
+        transaction.abort()
+        self.assertIsNot(self.factory(attempt, session), notifier)
+
+    def test_notifiers_are_bound_to_the_session(self):
+        attempt = modelfactories.AttemptFactory()
+        other_session = models.Session()
+        try:
+            notifier = self.factory(attempt, models.ScopedSession)
+            self.assertIn(notifier, models.ScopedSession.info['notifiers'].values())
+            self.assertNotIn('notifiers', other_session.info)
+        finally:
+            other_session.close()
+
+    def _validate(self, factory):
+        """
+        Tells a notice per stage and ends the checkpoint, as the validation
+        pipeline does. Returns the notices written to the outbox.
+        """
+        attempt = modelfactories.AttemptFactory()
+        attempt.is_valid = True
+        session = models.ScopedSession
+        item = (attempt, doubles.PackageAnalyzerStub(), {}, session)
+
+        factory(attempt, session).start()
+        for stage in ('Journal', 'Issue', 'References'):
+            StageStub(factory, stage).transform(item)
+        validator.TearDownPipe(factory).transform(item)
+
+        notification, = session.query(models.Notification).filter_by(attempt=attempt).all()
+        self.assertEqual(notification.kind, 'notices')
+        return notification.payload['notices']
+
+    def test_coalesced_notices_are_sent_when_the_checkpoint_ends(self):
+        factory = create_checkpoint_notifier(CoalescingConfigStub(), models.Point.validation)
+
+        notices = self._validate(factory)
+        self.assertEqual([notice['stage'] for notice in notices],
+                         ['Journal', 'Issue', 'References'])
+
+    def test_coalesced_notices_are_shared_by_the_notifiers_of_the_checkpoint(self):
+        factory = create_checkpoint_notifier(CoalescingConfigStub(), models.Point.validation)
+
+        def uncached_factory(attempt, session):
+            session.info.pop('notifiers', None)
+            return factory(attempt, session)
+
+        notices = self._validate(uncached_factory)
+        self.assertEqual([notice['stage'] for notice in notices],
+                         ['Journal', 'Issue', 'References'])
@@ -0,0 +1,141 @@
+# coding: utf-8
+import unittest
+from StringIO import StringIO
+import xml.etree.ElementTree as ElementTree
+
+from lxml import etree
+
+from balaio import rules, validator, meta_extractor
+from .doubles import PackageAnalyzerStub
+
+
+SAMPLE_XML = '''<article xml:lang="en">
+  <front>
+    <journal-meta>
+      <journal-id journal-id-type="nlm-ta">Rev Saude Publica</journal-id>
+      <journal-title-group>
+        <journal-title>Revista de Saude Publica</journal-title>
+        <abbrev-journal-title abbrev-type="publisher">Rev. Saude Publica</abbrev-journal-title>
+      </journal-title-group>
+      <issn pub-type="ppub">0034-8910</issn>
+      <issn pub-type="epub">1518-8787</issn>
+      <publisher><publisher-name>Faculdade de Saude Publica</publisher-name></publisher>
+    </journal-meta>
+    <article-meta>
+      <article-id pub-id-type="publisher-id">S0034-89102014000100001</article-id>
+      <article-id pub-id-type="doi">10.1590/S0034-8910.2014048004965</article-id>
+      <article-categories>
+        <subj-group subj-group-type="heading"><subject>Original Articles</subject></subj-group>
+      </article-categories>
+      <title-group><article-title xml:lang="en">Foo</article-title></title-group>
+      <pub-date pub-type="epub"><day>27</day><month>02</month><year>2014</year></pub-date>
+      <pub-date pub-type="ppub"><season>Jan-Feb</season><year>2014</year></pub-date>
+      <volume>48</volume>
+      <issue>1</issue>
+      <fpage>1</fpage>
+      <lpage>10</lpage>
+      <permissions><license><license-p>CC-BY</license-p></license></permissions>
+    </article-meta>
+  </front>
+  <back>
+    <ack><p>Grant 123</p></ack>
+    <ref-list>
+      <ref id="B1"><element-citation publication-type="journal"><source>Foo</source></element-citation></ref>
+      <ref id="B2"><element-citation publication-type="book"><source>Bar</source></element-citation></ref>
+    </ref-list>
+  </back>
+</article>'''
+
+
+class CompilePathTests(unittest.TestCase):
+
+    def test_steps(self):
+        steps = rules.compile_path('.//article-meta//pub-date/year[@a="b"]')
+
+        self.assertEqual(steps, [rules.Step(False, 'article-meta', None, None),
+                                 rules.Step(False, 'pub-date', None, None),
+                                 rules.Step(True, 'year', 'a', 'b')])
+
+    def test_predicate_after_slash(self):
+        self.assertEqual(rules.compile_path('.//article-id/[@pub-id-type="doi"]'),
+                         [rules.Step(False, 'article-id', 'pub-id-type', 'doi')])
+
+    def test_trailing_slash(self):
+        self.assertEqual(rules.compile_path('.//pub-date/'),
+                         [rules.Step(False, 'pub-date', None, None),
+                          rules.Step(True, '*', None, None)])
+
+    def test_unsupported_paths(self):
+        for path in ['article-meta', './/ref[1]', './/ref/..', './/{urn:foo}ref']:
+            self.assertIsNone(rules.compile_path(path))
+
+
+class RuleEngineTests(unittest.TestCase):
+
+    def _assertSameAsTree(self, tree):
+        for group, paths in rules._registered.items():
+            matches = rules.get_engine(group).run(tree)
+            for path in paths:
+                self.assertEqual(matches.findall(path), tree.findall(path), path)
+                self.assertEqual(matches.findtext(path), tree.findtext(path), path)
+
+    def test_registered_paths_with_lxml(self):
+        self._assertSameAsTree(etree.parse(StringIO(SAMPLE_XML)))
+
+    def test_registered_paths_with_elementtree(self):
+        self._assertSameAsTree(ElementTree.parse(StringIO(SAMPLE_XML)))
+
+    def test_all_rule_paths_are_supported(self):
+        for group in rules._registered:
+            self.assertEqual(rules.get_engine(group).unsupported, set(), group)
+
+    def test_groups_are_evaluated_apart(self):
+        self.assertIn('.//title-group', rules._registered['meta'])
+        self.assertNotIn('.//title-group', rules._registered['validation'])
+
+    def test_paths_anchored_at_parents(self):
+        tree = etree.fromstring('<a><sec><p/><sec><p x="1"/><!-- c --><q/></sec><p x="1"/></sec>'
+                                '<sec><p/></sec><b><p/></b></a>')
+        paths = ['.//sec/p', './/sec/p[@x="1"]', './/sec/', './/a//sec/p', './/b/p']
+        matches = rules.RuleEngine(paths).run(tree)
+
+        for path in paths:
+            self.assertEqual(matches.findall(path), tree.findall(path), path)
+
+    def test_root_is_not_matched(self):
+        matches = rules.RuleEngine(['.//article']).run(etree.fromstring(SAMPLE_XML))
+        self.assertEqual(matches.findall('.//article'), [])
+
+    def test_unregistered_paths_are_delegated_to_the_tree(self):
+        tree = etree.parse(StringIO(SAMPLE_XML))
+        matches = rules.RuleEngine([]).run(tree)
+
+        self.assertEqual(matches.findtext('.//volume'), '48')
+        self.assertEqual(matches.getroot(), tree.getroot())
+
+    def test_rule_decorator(self):
+        @rules.rule('.//volume')
+        class FooRule(object):
+            pass
+
+        self.assertEqual(FooRule._paths_, ('.//volume',))
+        self.assertIn('.//volume', rules._registered['validation'])
+
+
+class GetMatchesTests(unittest.TestCase):
+
+    def test_matches_are_cached_on_the_analyzer(self):
+        pkg_analyzer = PackageAnalyzerStub()
+        pkg_analyzer._xml_string = SAMPLE_XML
+
+        self.assertIs(rules.get_matches(pkg_analyzer), rules.get_matches(pkg_analyzer))
+        self.assertEqual(rules.get_matches(pkg_analyzer).findtext('.//article-meta/volume'), '48')
+
+    def test_matches_are_cached_per_group(self):
+        pkg_analyzer = PackageAnalyzerStub()
+        pkg_analyzer._xml_string = SAMPLE_XML
+
+        self.assertIsNot(rules.get_matches(pkg_analyzer),
+                         rules.get_matches(pkg_analyzer, group='meta'))
+        self.assertIs(rules.get_matches(pkg_analyzer, group='meta'),
+                      rules.get_matches(pkg_analyzer, group='meta'))
@@ -0,0 +1,182 @@
+import unittest
+
+from sqlalchemy.exc import OperationalError
+
+from balaio import snapshot, models
+from .utils import db_bootstrap, DB_READY
+
+
+global_engine = None
+
+
+def setUpModule():
+    """
+    Initialize the database.
+    """
+    global global_engine
+    try:
+        global_engine = db_bootstrap()
+    except OperationalError:
+        # global_engine remains None, all db-bound testcases
+        # need to test for DB_READY before run.
+        pass
+
+
+class EndpointStub(object):
+    def __init__(self, records, fail_with=None):
+        self.records = records
+        self.fail_with = fail_with
+        self.filters = []
+
+    def all(self):
+        for record in self.records:
+            yield record
+        if self.fail_with is not None:
+            raise self.fail_with
+
+    def filter(self, updated__gte):
+        self.filters.append(updated__gte)
+        return (record for record in self.all() if record['updated'] >= updated__gte)
+
+
+class ClientStub(object):
+    def __init__(self, journals, issues):
+        self.journals = EndpointStub(journals)
+        self.issues = EndpointStub(issues)
+        self.fetched = []
+
+    def fetch_relations(self, dataset, only=None):
+        self.fetched.append(dataset['resource_uri'])
+        new_dataset = dict(dataset)
+        if only is None or 'journal' in only:
+            new_dataset['journal'] = {'resource_uri': dataset['journal']}
+        return new_dataset
+
+
+def make_journal(uri='/api/v1/journals/1/', updated='2014-01-01', **kwargs):
+    journal = {'resource_uri': uri, 'updated': updated,
+               'print_issn': '0100-879X', 'eletronic_issn': '1414-431X'}
+    journal.update(kwargs)
+    return journal
+
+
+def make_issue(uri='/api/v1/issues/1/', updated='2014-01-01', **kwargs):
+    issue = {'resource_uri': uri, 'updated': updated, 'journal': '/api/v1/journals/1/',
+             'volume': '30', 'number': '4', 'suppl_volume': '', 'suppl_number': '',
+             'publication_year': 2014}
+    issue.update(kwargs)
+    return issue
+
+
+@unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+class SyncTests(unittest.TestCase):
+
+    def tearDown(self):
+        global_engine.execute(models.ManagerIssue.__table__.delete())
+        global_engine.execute(models.ManagerJournal.__table__.delete())
+
+    def test_sync_writes_all_records(self):
+        client = ClientStub([make_journal()], [make_issue(), make_issue('/api/v1/issues/2/')])
+
+        self.assertEqual(snapshot.sync(global_engine, client), (1, 2))
+        self.assertEqual(sorted(client.fetched), ['/api/v1/issues/1/', '/api/v1/issues/2/'])
+
+    def test_sync_is_incremental(self):
+        snapshot.sync(global_engine, ClientStub([make_journal()],
+                                                [make_issue(), make_issue('/api/v1/issues/2/')]))
+
+        client = ClientStub([make_journal()],
+                            [make_issue(number='5', updated='2014-02-01'),
+                             make_issue('/api/v1/issues/2/')])
+
+        self.assertEqual(snapshot.sync(global_engine, client), (0, 1))
+        self.assertEqual(client.fetched, ['/api/v1/issues/1/'])
+        self.assertEqual(client.issues.filters, ['2014-01-01'])
+        self.assertEqual(snapshot.ManagerSnapshot(global_engine).find_issue(
+            print_issn='0100-879X', number='5')['resource_uri'], '/api/v1/issues/1/')
+
+    def test_only_modified_records_are_listed(self):
+        snapshot.sync(global_engine, ClientStub([make_journal()], [make_issue()]))
+
+        client = ClientStub([make_journal()],
+                            [make_issue(), make_issue('/api/v1/issues/2/', updated='2013-12-01')])
+        self.assertEqual(snapshot.sync(global_engine, client), (0, 0))
+        self.assertEqual(client.fetched, [])
+
+    def test_full_sync_removes_records_that_are_gone(self):
+        snapshot.sync(global_engine, ClientStub([make_journal()],
+                                                [make_issue(), make_issue('/api/v1/issues/2/')]))
+        client = ClientStub([make_journal()], [make_issue()])
+        snapshot.sync(global_engine, client, full=True)
+
+        count = global_engine.execute(models.ManagerIssue.__table__.count()).scalar()
+        self.assertEqual(count, 1)
+        self.assertEqual(client.issues.filters, [])
+
+    def test_incremental_sync_keeps_the_records_not_listed(self):
+        snapshot.sync(global_engine, ClientStub([make_journal()],
+                                                [make_issue(), make_issue('/api/v1/issues/2/')]))
+        snapshot.sync(global_engine, ClientStub([make_journal()], [make_issue()]))
+
+        count = global_engine.execute(models.ManagerIssue.__table__.count()).scalar()
+        self.assertEqual(count, 2)
+
+    def test_changes_to_journals_are_seen_by_their_issues(self):
+        snapshot.sync(global_engine, ClientStub([make_journal(title='Foo')], [make_issue()]))
+        snapshot.sync(global_engine, ClientStub([make_journal(title='Bar', updated='2014-02-01')],
+                                                [make_issue()]))
+
+        issue = snapshot.ManagerSnapshot(global_engine).find_issue(print_issn='0100-879X')
+        self.assertEqual(issue['journal']['title'], 'Bar')
+
+    def test_failed_sync_is_rolled_back(self):
+        snapshot.sync(global_engine, ClientStub([make_journal(title='Foo')], [make_issue()]))
+
+        client = ClientStub([make_journal(title='Bar', updated='2014-02-01')], [])
+        client.issues.fail_with = IOError('manager is gone')
+        self.assertRaises(IOError, snapshot.sync, global_engine, client)
+
+        issue = snapshot.ManagerSnapshot(global_engine).find_issue(print_issn='0100-879X')
+        self.assertEqual(issue['journal']['title'], 'Foo')
+
+
+@unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+class ManagerSnapshotTests(unittest.TestCase):
+
+    def setUp(self):
+        snapshot.sync(global_engine, ClientStub(
+            [make_journal(), make_journal('/api/v1/journals/2/', print_issn='0034-8910',
+                                          eletronic_issn=None)],
+            [make_issue(),
+             make_issue('/api/v1/issues/2/', number='5'),
+             make_issue('/api/v1/issues/3/', journal='/api/v1/journals/2/')]))
+        self.snapshot = snapshot.ManagerSnapshot(global_engine)
+
+    def tearDown(self):
+        global_engine.execute(models.ManagerIssue.__table__.delete())
+        global_engine.execute(models.ManagerJournal.__table__.delete())
+
+    def test_find_issue_by_print_issn(self):
+        issue = self.snapshot.find_issue(print_issn='0100-879X', volume='30', number='4')
+
+        self.assertEqual(issue['resource_uri'], '/api/v1/issues/1/')
+        self.assertEqual(issue['journal'], make_journal())
+
+    def test_find_issue_by_eletronic_issn(self):
+        issue = self.snapshot.find_issue(eletronic_issn='1414-431X', volume='30', number='5')
+        self.assertEqual(issue['resource_uri'], '/api/v1/issues/2/')
+
+    def test_empty_criteria_are_ignored(self):
+        issue = self.snapshot.find_issue(print_issn='0034-8910', volume='30',
+                                         number=None, suppl_volume='')
+        self.assertEqual(issue['resource_uri'], '/api/v1/issues/3/')
+
+    def test_criteria_are_compared_as_text(self):
+        issue = self.snapshot.find_issue(print_issn='0034-8910', publication_year=2014)
+        self.assertEqual(issue['resource_uri'], '/api/v1/issues/3/')
+
+    def test_missing_issues(self):
+        self.assertIsNone(self.snapshot.find_issue(print_issn='0100-879X', number='6'))
+
+    def test_unknown_criteria(self):
+        self.assertRaises(TypeError, self.snapshot.find_issue, foo='bar')
@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import threading
+import tempfile
+import unittest
+
+from balaio import timing
+
+
+class AttemptStub(object):
+    pass
+
+
+class RollingHistogramTests(unittest.TestCase):
+
+    def test_empty_summary(self):
+        self.assertEqual(timing.RollingHistogram().summary(), {'count': 0})
+
+    def test_summary(self):
+        hist = timing.RollingHistogram(window=10, buckets=(1, 10))
+        for value in [0.5, 2, 3, 20]:
+            hist.add(value)
+
+        summary = hist.summary()
+        self.assertEqual(summary['count'], 4)
+        self.assertEqual(summary['max'], 20)
+        self.assertEqual(summary['p50'], 3)
+        self.assertEqual(summary['buckets'], {'1': 1, '10': 2, '+inf': 1})
+
+    def test_only_the_latest_samples_are_kept(self):
+        hist = timing.RollingHistogram(window=2)
+        for value in [100, 1, 2]:
+            hist.add(value)
+
+        summary = hist.summary()
+        self.assertEqual(summary['count'], 2)
+        self.assertEqual(summary['max'], 2)
+
+
+class TimingRegistryTests(unittest.TestCase):
+
+    def test_snapshot_by_name(self):
+        registry = timing.TimingRegistry()
+        registry.record('FooPipe', 0.2, 0.1)
+        registry.record('FooPipe', 0.4, 0.1)
+
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot.keys(), ['FooPipe'])
+        self.assertEqual(snapshot['FooPipe']['wall']['count'], 2)
+        self.assertEqual(snapshot['FooPipe']['cpu']['max'], 0.1)
+
+    def test_dump(self):
+        registry = timing.TimingRegistry()
+        registry.record('FooPipe', 0.2, 0.1)
+        path = tempfile.mktemp(suffix='.json')
+
+        try:
+            registry.dump(path)
+            with open(path) as f:
+                self.assertIn('FooPipe', json.load(f))
+        finally:
+            os.remove(path)
+
+
+class TimedTests(unittest.TestCase):
+
+    def test_timings_are_kept_by_attempt(self):
+        class FooPipe(object):
+            @timing.timed
+            def transform(self, item):
+                return item
+
+        attempt = AttemptStub()
+        item = (attempt, None)
+
+        self.assertEqual(FooPipe().transform(item), item)
+        self.assertEqual(attempt._timings.keys(), ['FooPipe'])
+        self.assertEqual(sorted(attempt._timings['FooPipe']), ['cpu', 'wall'])
+        self.assertIn('FooPipe', timing.registry.snapshot())
+
+    def test_call_timed(self):
+        result, wall, cpu = timing.call_timed(sum, [1, 2])
+
+        self.assertEqual(result, 3)
+        self.assertTrue(wall >= 0)
+
+    @unittest.skipIf(timing.thread_time is None, 'no CPU clock per thread')
+    def test_cpu_time_excludes_other_threads(self):
+        def spin():
+            started_at = time.time()
+            while time.time() - started_at < 0.2:
+                pass
+
+        busy = threading.Thread(target=spin)
+        busy.start()
+        try:
+            result, wall, cpu = timing.call_timed(time.sleep, 0.1)
+        finally:
+            busy.join()
+
+        self.assertTrue(cpu < 0.05)
+
+    def test_unknown_cpu_time_is_not_recorded(self):
+        registry = timing.TimingRegistry()
+        registry.record('FooPipe', 0.2, None)
+
+        self.assertEqual(registry.snapshot()['FooPipe']['cpu'], {'count': 0})
@@ -1,4 +1,7 @@
+import errno
+import socket
 import unittest
+import threading
 
 import mocker
 
@@ -86,3 +89,167 @@ class StaticScieloBackendTests(mocker.MockerTestCase):
         self.assertEqual(st._get_resource_uri(u'/journals/art1/foo.pdf'),
             u'http://static.scielo.org/journals/art1/foo.pdf')
 
+
+    def test_is_alive_when_not_connected(self):
+        st = uploader.StaticScieloBackend(u'some.user', u'some.pass',
+            u'/var/www/')
+
+        self.assertFalse(st.is_alive())
+
+    def test_is_alive_probes_the_server(self):
+        st = uploader.StaticScieloBackend(u'some.user', u'some.pass',
+            u'/var/www/')
+
+        mock_st = self.mocker.patch(st, spec=False)
+        mock_st.transport.is_active()
+        self.mocker.result(True)
+        mock_st.sftp.stat('.')
+        self.mocker.throw(IOError)
+        self.mocker.replay()
+
+        self.assertFalse(st.is_alive(probe=True))
+
+
+class BackendStub(uploader.BlobBackend):
+    """
+    Records the connections made by all instances.
+    """
+    connections = []
+
+    def __init__(self, alive=True, fail_with=None):
+        self.alive = alive
+        self.fail_with = fail_with
+        self.connected = False
+        self.cleaned_up = False
+
+    def connect(self):
+        if self.fail_with is not None:
+            raise self.fail_with
+        self.connected = True
+        self.connections.append(self)
+
+    def cleanup(self):
+        self.connected = False
+        self.cleaned_up = True
+
+    def is_alive(self, probe=False):
+        return self.connected and self.alive
+
+
+class BackendPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        BackendStub.connections = []
+
+    def test_connections_are_reused(self):
+        pool = uploader.BackendPool(BackendStub)
+        with pool as first:
+            pass
+        with pool as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(len(BackendStub.connections), 1)
+
+    def test_concurrent_uses_get_their_own_connections(self):
+        pool = uploader.BackendPool(BackendStub)
+        with pool as first:
+            with pool as second:
+                self.assertIsNot(first, second)
+
+        self.assertEqual(len(BackendStub.connections), 2)
+
+    def test_broken_connections_are_replaced(self):
+        pool = uploader.BackendPool(BackendStub)
+        with pool as first:
+            first.alive = False
+
+        with pool as second:
+            self.assertIsNot(first, second)
+        self.assertFalse(first.connected)
+
+    def test_connections_of_failed_uploads_are_discarded(self):
+        pool = uploader.BackendPool(BackendStub)
+        try:
+            with pool as first:
+                raise IOError('connection reset')
+        except IOError:
+            pass
+
+        self.assertFalse(first.connected)
+        with pool as second:
+            self.assertIsNot(first, second)
+
+    def test_connections_are_kept_on_remote_file_errors(self):
+        pool = uploader.BackendPool(BackendStub)
+        try:
+            with pool as first:
+                raise IOError(errno.ENOENT, 'No such file')
+        except IOError:
+            pass
+
+        self.assertTrue(first.connected)
+        with pool as second:
+            self.assertIs(first, second)
+
+    def test_connections_of_reset_sockets_are_discarded(self):
+        pool = uploader.BackendPool(BackendStub)
+        try:
+            with pool as first:
+                raise socket.error(errno.ECONNRESET, 'Connection reset by peer')
+        except socket.error:
+            pass
+
+        self.assertFalse(first.connected)
+
+    def test_connections_are_kept_on_other_errors(self):
+        pool = uploader.BackendPool(BackendStub)
+        try:
+            with pool as first:
+                raise ValueError('invalid package')
+        except ValueError:
+            pass
+
+        self.assertTrue(first.connected)
+        with pool as second:
+            self.assertIs(first, second)
+
+    def test_failed_connections_are_cleaned_up(self):
+        backends = []
+
+        def factory():
+            backends.append(BackendStub(fail_with=IOError('connection refused')))
+            return backends[-1]
+
+        pool = uploader.BackendPool(factory, size=1)
+        self.assertRaises(IOError, pool.acquire)
+        self.assertTrue(backends[0].cleaned_up)
+
+        # the slot is given back.
+        self.assertRaises(IOError, pool.acquire)
+
+    def test_size_bounds_the_connections(self):
+        pool = uploader.BackendPool(BackendStub, size=1)
+        backend = pool.acquire()
+        acquired = threading.Event()
+
+        def acquire():
+            pool.release(pool.acquire())
+            acquired.set()
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+
+        pool.release(backend)
+        thread.join(1)
+        self.assertTrue(acquired.is_set())
+        self.assertEqual(len(BackendStub.connections), 1)
+
+    def test_close_cleans_up_idle_connections(self):
+        pool = uploader.BackendPool(BackendStub)
+        with pool as backend:
+            pass
+        pool.close()
+
+        self.assertFalse(backend.connected)
@@ -1,11 +1,34 @@
 # coding: utf-8
 import unittest
+import datetime
+
 import mocker
+import transaction
+from sqlalchemy import orm
+from sqlalchemy.exc import OperationalError
 
 from balaio import models
 from balaio import validator
 from balaio import utils
+from balaio import excepts
 from balaio.tests.doubles import *
+from balaio.tests import modelfactories
+from balaio.tests.utils import db_bootstrap, DB_READY
+
+
+global_engine = None
+
+
+def setUpModule():
+    """
+    Initialize the database.
+    """
+    global global_engine
+    try:
+        global_engine = db_bootstrap()
+    except OperationalError:
+        # all db-bound testcases need to test for DB_READY before run.
+        pass
 
 
 #
@@ -20,12 +43,16 @@ class SetupPipeTests(mocker.MockerTestCase):
         _sapi_tools = kwargs.get('_sapi_tools', get_ScieloAPIToolbeltStubModule())
         _pkg_analyzer = kwargs.get('_pkg_analyzer', PackageAnalyzerStub)
         _issn_validator = kwargs.get('_issn_validator', utils.is_valid_issn)
+        _cache = kwargs.get('_cache', None)
+        _snapshot = kwargs.get('_snapshot', None)
 
         vpipe = validator.SetupPipe(scieloapi=_scieloapi,
                                     notifier=_notifier,
                                     sapi_tools=_sapi_tools,
                                     pkg_analyzer=_pkg_analyzer,
-                                    issn_validator=_issn_validator)
+                                    issn_validator=_issn_validator,
+                                    cache=_cache,
+                                    snapshot=_snapshot)
         vpipe.feed(data)
         return vpipe
 
@@ -132,6 +159,42 @@ class SetupPipeTests(mocker.MockerTestCase):
         self.assertRaises(ValueError,
                           lambda: vpipe._fetch_journal_and_issue_data(**{'print_issn': '1234-1234', 'volume': '30', 'number': '4'}))
 
+    def test_fetch_journal_issue_data_uses_the_cache(self):
+        import os, shutil, tempfile
+        from balaio import cache
+
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+
+        calls = []
+        data = "<root><issn pub-type='epub'>0102-6720</issn></root>"
+        scieloapi = ScieloAPIClientStub()
+        scieloapi.issues.filter = lambda **kwargs: calls.append(kwargs) or [{'foo': 'bar'}]
+
+        vpipe = self._makeOne(data, _scieloapi=scieloapi,
+                              _cache=cache.DiskCache(os.path.join(tmpdir, 'cache.db')))
+        for i in range(2):
+            self.assertEqual(vpipe._fetch_journal_and_issue_data(print_issn='0100-879X', volume='30'),
+                             {'foo': 'bar'})
+
+        self.assertEqual(len(calls), 1)
+
+    def test_fetch_journal_issue_data_uses_the_snapshot(self):
+        class SnapshotStub(object):
+            def find_issue(self, **criteria):
+                return {'foo': 'local'} if criteria.get('volume') == '30' else None
+
+        scieloapi = ScieloAPIClientStub()
+        scieloapi.issues.filter = lambda **kwargs: [{'foo': 'remote'}]
+
+        vpipe = self._makeOne(None, _scieloapi=scieloapi, _snapshot=SnapshotStub())
+
+        self.assertEqual(vpipe._fetch_journal_and_issue_data(print_issn='0100-879X', volume='30'),
+                         {'foo': 'local'})
+        # missing from the snapshot
+        self.assertEqual(vpipe._fetch_journal_and_issue_data(print_issn='0100-879X', volume='31'),
+                         {'foo': 'remote'})
+
     def test_transform_grants_valid_issn_before_fetching(self):
         #FIXME verificar
         stub_attempt = AttemptStub()
@@ -277,6 +340,39 @@ class ReferenceSourceValidationTests(unittest.TestCase):
             vpipe.validate([None, pkg_analyzer_stub, None]), expected)
 
 
+class ReferenceIndexTests(unittest.TestCase):
+
+    def _makePkgAnalyzerWithData(self, data):
+        pkg_analyzer_stub = PackageAnalyzerStub()
+        pkg_analyzer_stub._xml_string = data
+        return pkg_analyzer_stub
+
+    def test_references_are_indexed(self):
+        xml = """<root><ref-list>
+                   <ref id="B1"><element-citation publication-type="journal">
+                     <source>Foo</source><year>2009</year><article-title>Bar</article-title>
+                   </element-citation></ref>
+                   <ref id="B2"><element-citation publication-type="book">
+                     <source></source><article-title>Baz</article-title>
+                   </element-citation></ref>
+                 </ref-list></root>"""
+
+        refs = validator.get_reference_index(self._makePkgAnalyzerWithData(xml))
+
+        self.assertEqual(refs, [
+            validator.Reference('B1', 'Foo', '2009', 'journal', 'Bar'),
+            validator.Reference('B2', None, None, 'book', None),
+        ])
+
+    def test_index_is_built_once(self):
+        pkg_analyzer = self._makePkgAnalyzerWithData(
+            '<root><ref-list><ref id="B1"></ref></ref-list></root>')
+        refs = validator.get_reference_index(pkg_analyzer)
+
+        pkg_analyzer._xml_string = '<root></root>'
+        self.assertIs(validator.get_reference_index(pkg_analyzer), refs)
+
+
 class ReferenceValidationPipeTests(unittest.TestCase):
 
     def _makeOne(self, data, **kwargs):
@@ -1014,6 +1110,26 @@ class DOIVAlidationPipeTests(mocker.MockerTestCase):
         self.assertEqual(expected,
                          vpipe.validate(data))
 
+    def test_unverified_DOI(self):
+        expected = [models.Status.warning, 'DOI could not be verified: 10.1590/S0001-37652013000100002']
+        xml = '<root><article-id pub-id-type="doi">10.1590/S0001-37652013000100002</article-id></root>'
+
+        stub_attempt = AttemptStub()
+        stub_package_analyzer = self._makePkgAnalyzerWithData(xml)
+
+        mock_doi_validator = self.mocker.mock()
+        mock_doi_validator('10.1590/S0001-37652013000100002')
+        self.mocker.result(None)
+
+        self.mocker.replay()
+
+        data = (stub_attempt, stub_package_analyzer, {})
+
+        vpipe = self._makeOne(data, _doi_validator=mock_doi_validator)
+
+        self.assertEqual(expected,
+                         vpipe.validate(data))
+
     def test_missing_DOI(self):
         expected = [models.Status.warning, 'Missing data: DOI']
         xml = '<root></root>'
@@ -1059,6 +1175,9 @@ class ArticleSectionValidationPipeTests(mocker.MockerTestCase):
         ]}
         return {u'sections': [dict_item1, dict_item2], u'label': '1(1)'}
 
+    def _section_titles(self):
+        return frozenset([u'ARTÍCULOS ORIGINALES', u'ORIGINAL ARTICLES', u'EDITORIAL'])
+
     def test_article_section_matched(self):
         expected = [models.Status.ok, u'Valid article section: Original Articles']
         #article-categories/subj-group[@subj-group-type=”heading”]
@@ -1068,7 +1187,7 @@ class ArticleSectionValidationPipeTests(mocker.MockerTestCase):
         stub_package_analyzer = self._makePkgAnalyzerWithData(xml)
 
         mock_is_a_registered_section_title = self.mocker.mock()
-        mock_is_a_registered_section_title(self._issue_data()['sections'], u'Original Articles')
+        mock_is_a_registered_section_title(self._section_titles(), u'Original Articles')
         self.mocker.result(True)
 
         self.mocker.replay()
@@ -1088,7 +1207,7 @@ class ArticleSectionValidationPipeTests(mocker.MockerTestCase):
         stub_package_analyzer = self._makePkgAnalyzerWithData(xml)
 
         mock_is_a_registered_section_title = self.mocker.mock()
-        mock_is_a_registered_section_title(self._issue_data()['sections'], u'Articles')
+        mock_is_a_registered_section_title(self._section_titles(), u'Articles')
         self.mocker.result(False)
 
         self.mocker.replay()
@@ -1115,6 +1234,46 @@ class ArticleSectionValidationPipeTests(mocker.MockerTestCase):
                          vpipe.validate(data))
 
 
+class IssueLookupsTests(unittest.TestCase):
+
+    def _issue_data(self, **kwargs):
+        issue_data = {'sections': [{'titles': [['en', u'Original  Articles'],
+                                               ['es', u'Artículos Originales']]}],
+                      'publication_year': 1999,
+                      'publication_start_month': 1,
+                      'publication_end_month': 3}
+        issue_data.update(kwargs)
+        return issue_data
+
+    def test_compiled_lookups(self):
+        lookups = validator.compile_issue_lookups(self._issue_data())
+
+        self.assertEqual(lookups.section_titles,
+                         frozenset([u'ORIGINAL ARTICLES', u'ARTÍCULOS ORIGINALES']))
+        self.assertEqual(lookups.section_labels, u'Original  Articles | Artículos Originales')
+        self.assertEqual(lookups.pub_dates, frozenset(['Jan-Mar/1999', '1-Mar/1999']))
+        self.assertEqual(lookups.pub_date_labels, 'Jan-Mar/1999 | 1-Mar/1999')
+
+    def test_lookups_are_cached_by_issue(self):
+        issue_data = self._issue_data(resource_uri='/api/v1/issues/1/',
+                                      updated='2014-01-01T10:00:00')
+
+        self.assertIs(validator.get_issue_lookups(issue_data),
+                      validator.get_issue_lookups(dict(issue_data)))
+
+    def test_lookups_are_compiled_again_after_updates(self):
+        issue_data = self._issue_data(resource_uri='/api/v1/issues/2/',
+                                      updated='2014-01-01T10:00:00')
+        lookups = validator.get_issue_lookups(issue_data)
+
+        issue_data.update(publication_year=2000, updated='2014-01-02T10:00:00')
+        self.assertNotEqual(validator.get_issue_lookups(issue_data), lookups)
+
+    def test_lookups_without_issue_identity_are_not_cached(self):
+        self.assertIsNot(validator.get_issue_lookups(self._issue_data()),
+                         validator.get_issue_lookups(self._issue_data()))
+
+
 class ArticleMetaPubDateValidationPipeTests(mocker.MockerTestCase):
     """
     Tests of ArticleSectionValidationPipe
@@ -1294,3 +1453,293 @@ class LicenseValidationPipeTests(mocker.MockerTestCase):
         vpipe = self._makeOne(data)
         self.assertEqual(expected,
                          vpipe.validate([None, pkg_analyzer_stub, None]))
+
+
+#
+# Worker
+#
+class PipelineStub(object):
+    """
+    Validates the attempts doing nothing but recording their ids.
+    """
+    def __init__(self, fail_on=(), error=ValueError('validation failed')):
+        self.validated = []
+        self.fail_on = fail_on
+        self.error = error
+
+    def run(self, messages):
+        for attempt, session in messages:
+            attempt.start_validation()
+            if attempt.id in self.fail_on:
+                raise self.error
+            self.validated.append(attempt.id)
+            attempt.end_validation()
+            yield attempt
+
+
+@unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+class WorkerTests(unittest.TestCase):
+
+    def tearDown(self):
+        transaction.abort()
+        with transaction.manager:
+            session = models.ScopedSession
+            session.query(models.Attempt).delete()
+            session.query(models.ArticlePkg).delete()
+        models.ScopedSession.remove()
+
+    def _makeOne(self, total=1, **kwargs):
+        with transaction.manager:
+            attempts = [modelfactories.AttemptFactory.create(
+                proceed_to_validation=True, **kwargs) for i in range(total)]
+            ids = [attempt.id for attempt in attempts]
+
+        return ids
+
+    def test_claim_is_limited_to_batch_size(self):
+        self._makeOne(total=3)
+        session = models.ScopedSession
+
+        self.assertEqual(models.Attempt.claim_for_validation(session, 'foo', 2, 60), 2)
+        self.assertEqual(session.query(models.Attempt).filter_by(
+            validation_lease_owner='foo').count(), 2)
+
+    def test_attempts_leased_to_others_are_skipped(self):
+        self._makeOne(total=2)
+        session = models.ScopedSession
+
+        self.assertEqual(models.Attempt.claim_for_validation(session, 'foo', 1, 60), 1)
+        self.assertEqual(models.Attempt.claim_for_validation(session, 'bar', 2, 60), 1)
+        self.assertEqual(models.Attempt.claim_for_validation(session, 'baz', 2, 60), 0)
+
+    def test_expired_leases_are_claimed_again(self):
+        self._makeOne(validation_lease_owner='dead-worker',
+            validation_lease_expires_at=datetime.datetime.now() - datetime.timedelta(seconds=1))
+
+        self.assertEqual(models.Attempt.claim_for_validation(
+            models.ScopedSession, 'foo', 1, 60), 1)
+
+    def test_workers_do_not_validate_the_same_attempts(self):
+        ids = self._makeOne(total=3)
+        pipeline = PipelineStub()
+        worker1 = validator.Worker(pipeline, batch_size=2)
+        worker2 = validator.Worker(pipeline, batch_size=2)
+
+        self.assertEqual(worker1.run_once(), 2)
+        self.assertEqual(worker2.run_once(), 1)
+        self.assertIsNone(worker1.run_once())
+        self.assertEqual(sorted(pipeline.validated), sorted(ids))
+
+    def test_lease_is_released_at_the_end_of_validation(self):
+        attempt_id = self._makeOne()[0]
+        validator.Worker(PipelineStub()).run_once()
+
+        attempt = models.ScopedSession.query(models.Attempt).get(attempt_id)
+        self.assertIsNone(attempt.validation_lease_owner)
+        self.assertFalse(attempt.proceed_to_validation)
+
+    def test_failures_are_isolated_per_attempt(self):
+        ids = self._makeOne(total=3)
+        pipeline = PipelineStub(fail_on=[ids[1]])
+
+        self.assertEqual(validator.Worker(pipeline).run_once(), 3)
+        self.assertEqual(pipeline.validated, [ids[0], ids[2]])
+
+        session = models.ScopedSession
+        self.assertFalse(session.query(models.Attempt).get(ids[0]).proceed_to_validation)
+        self.assertTrue(session.query(models.Attempt).get(ids[1]).proceed_to_validation)
+        self.assertFalse(session.query(models.Attempt).get(ids[2]).proceed_to_validation)
+
+    def test_each_attempt_is_committed(self):
+        ids = self._makeOne(total=2)
+        committed = []
+
+        class CommitSpyPipeline(PipelineStub):
+            def run(self, messages):
+                for attempt, session in messages:
+                    # the previous attempt must be visible to other sessions.
+                    committed.extend(attempt_id for attempt_id, in
+                        models.ScopedSession.query(models.Attempt.id).filter_by(
+                            proceed_to_validation=False))
+                    models.ScopedSession.remove()
+                    for item in super(CommitSpyPipeline, self).run([(attempt, session)]):
+                        yield item
+
+        validator.Worker(CommitSpyPipeline()).run_once()
+        self.assertEqual(committed, [ids[0]])
+
+    def test_transient_failures_defer_the_attempt(self):
+        attempt_id = self._makeOne()[0]
+        pipeline = PipelineStub(fail_on=[attempt_id],
+                                error=excepts.TransientError('manager is down'))
+        validator.Worker(pipeline, retry_base_delay=60).run_once()
+
+        attempt = models.ScopedSession.query(models.Attempt).get(attempt_id)
+        self.assertTrue(attempt.proceed_to_validation)
+        self.assertIsNone(attempt.validation_lease_owner)
+        self.assertEqual(attempt.validation_retries, 1)
+        self.assertTrue(attempt.validation_retry_at > datetime.datetime.now())
+
+    def test_other_failures_defer_the_attempt(self):
+        attempt_id = self._makeOne()[0]
+        validator.Worker(PipelineStub(fail_on=[attempt_id])).run_once()
+
+        attempt = models.ScopedSession.query(models.Attempt).get(attempt_id)
+        self.assertTrue(attempt.validation_retry_at > datetime.datetime.now())
+        self.assertIsNone(attempt.validation_lease_owner)
+        self.assertEqual(attempt.validation_failures, 1)
+        self.assertTrue(attempt.is_valid)
+
+    def test_attempts_that_keep_failing_are_given_up(self):
+        attempt_id = self._makeOne(validation_failures=2)[0]
+        validator.Worker(PipelineStub(fail_on=[attempt_id]), max_failures=3).run_once()
+
+        attempt = models.ScopedSession.query(models.Attempt).get(attempt_id)
+        self.assertFalse(attempt.is_valid)
+        self.assertIsNone(attempt.validation_retry_at)
+        self.assertIsNone(attempt.validation_lease_owner)
+        self.assertEqual(models.Attempt.claim_for_validation(
+            models.ScopedSession, 'foo', 1, 60), 0)
+
+    def test_concurrent_claims_skip_the_attempts_being_claimed(self):
+        self._makeOne(total=2)
+        first = orm.Session(bind=global_engine)
+        second = orm.Session(bind=global_engine)
+        try:
+            self.assertEqual(models.Attempt.claim_for_validation(first, 'foo', 1, 60), 1)
+            # the claim of `first` is not committed yet.
+            second.execute("SET LOCAL lock_timeout = '2s'")
+            self.assertEqual(models.Attempt.claim_for_validation(second, 'bar', 2, 60), 1)
+        finally:
+            first.close()
+            second.close()
+
+    def test_attempts_leased_to_others_meanwhile_are_not_validated(self):
+        attempt_id = self._makeOne()[0]
+        pipeline = PipelineStub()
+        worker = validator.Worker(pipeline)
+        session = models.Session()
+        worker._claim_messages(session)
+
+        with transaction.manager:
+            models.ScopedSession.query(models.Attempt).get(
+                attempt_id).validation_lease_owner = 'other-worker'
+        models.ScopedSession.remove()
+
+        self.assertFalse(worker._validate(session, attempt_id))
+        self.assertEqual(pipeline.validated, [])
+        self.assertEqual(models.ScopedSession.query(models.Attempt).get(
+            attempt_id).validation_lease_owner, 'other-worker')
+
+    def test_attempts_whose_lease_expired_are_not_validated(self):
+        attempt_id = self._makeOne()[0]
+        pipeline = PipelineStub()
+        worker = validator.Worker(pipeline)
+        session = models.Session()
+        worker._claim_messages(session)
+
+        with transaction.manager:
+            models.ScopedSession.query(models.Attempt).get(
+                attempt_id).validation_lease_expires_at = datetime.datetime.now()
+        models.ScopedSession.remove()
+
+        self.assertFalse(worker._validate(session, attempt_id))
+        self.assertEqual(pipeline.validated, [])
+
+    def test_lease_is_renewed_when_the_validation_starts(self):
+        attempt_id = self._makeOne()[0]
+        leases = []
+
+        class LeaseSpyPipeline(PipelineStub):
+            def run(self, messages):
+                for attempt, session in messages:
+                    leases.append(attempt.validation_lease_expires_at)
+                    for item in super(LeaseSpyPipeline, self).run([(attempt, session)]):
+                        yield item
+
+        worker = validator.Worker(LeaseSpyPipeline(), lease_seconds=600)
+        session = models.Session()
+        worker._claim_messages(session)
+        with transaction.manager:
+            models.ScopedSession.query(models.Attempt).get(
+                attempt_id).validation_lease_expires_at = (
+                datetime.datetime.now() + datetime.timedelta(seconds=1))
+        models.ScopedSession.remove()
+
+        self.assertTrue(worker._validate(session, attempt_id))
+        self.assertTrue(leases[0] > datetime.datetime.now() + datetime.timedelta(seconds=500))
+
+    def test_deferred_attempts_are_claimed_after_retry_time(self):
+        now = datetime.datetime.now()
+        self._makeOne(validation_retry_at=now + datetime.timedelta(seconds=60))
+        self._makeOne(validation_retry_at=now - datetime.timedelta(seconds=1))
+
+        self.assertEqual(models.Attempt.claim_for_validation(
+            models.ScopedSession, 'foo', 2, 60), 1)
+
+
+class DeferValidationTests(unittest.TestCase):
+
+    def test_backoff_is_exponential_and_bounded(self):
+        attempt = models.Attempt(validation_retries=0)
+        delays = []
+        for i in range(5):
+            before = datetime.datetime.now()
+            retry_at = attempt.defer_validation(10, 40)
+            delays.append((retry_at - before).total_seconds())
+
+        self.assertEqual(attempt.validation_retries, 5)
+        for delay, backoff in zip(delays, [10, 20, 40, 40, 40]):
+            self.assertTrue(backoff * 0.5 - 1 <= delay <= backoff + 1)
+
+    def test_lease_is_released(self):
+        attempt = models.Attempt(validation_lease_owner='foo',
+                                 validation_lease_expires_at=datetime.datetime.now())
+        attempt.defer_validation(10, 40)
+
+        self.assertIsNone(attempt.validation_lease_owner)
+        self.assertIsNone(attempt.validation_lease_expires_at)
+
+    def test_end_validation_resets_the_retries(self):
+        attempt = models.Attempt(validation_retries=0, validation_failures=0)
+        attempt.fail_validation(10, 40, 5)
+        attempt.end_validation()
+
+        self.assertIsNone(attempt.validation_retry_at)
+        self.assertEqual(attempt.validation_retries, 0)
+        self.assertEqual(attempt.validation_failures, 0)
+
+    def test_failures_are_deferred_until_max_failures(self):
+        attempt = models.Attempt(validation_retries=0, validation_failures=0)
+
+        self.assertIsNotNone(attempt.fail_validation(10, 40, 2))
+        self.assertTrue(attempt.is_valid)
+        self.assertIsNone(attempt.fail_validation(10, 40, 2))
+        self.assertFalse(attempt.is_valid)
+
+
+class OptionsFromConfigTests(unittest.TestCase):
+
+    def _makeConfig(self, text):
+        import ConfigParser
+        from StringIO import StringIO
+        config = ConfigParser.SafeConfigParser()
+        config.readfp(StringIO(text))
+        return config
+
+    def test_options_are_converted(self):
+        config = self._makeConfig('[validator]\nbatch_size=10\nreuse_results=True\n')
+
+        self.assertEqual(validator.options_from_config(config,
+            {'batch_size': 'getint', 'reuse_results': 'getboolean'}),
+            {'batch_size': 10, 'reuse_results': True})
+
+    def test_missing_options_are_left_out(self):
+        config = self._makeConfig('[validator]\nbatch_size=10\n')
+
+        self.assertEqual(validator.options_from_config(config,
+            {'batch_size': 'getint', 'poll_interval': 'getint'}), {'batch_size': 10})
+
+    def test_missing_section(self):
+        self.assertEqual(validator.options_from_config(self._makeConfig('[app]\n'),
+            {'batch_size': 'getint'}), {})
@@ -1,11 +1,26 @@
+import time
 import unittest
 
 import mocker
+import transaction
+from sqlalchemy.exc import OperationalError
 
 from balaio import vpipes
 from balaio.tests.doubles import *
+from balaio.tests.utils import db_bootstrap, DB_READY
 from balaio import models
 
+
+def setUpModule():
+    """
+    Initialize the database.
+    """
+    try:
+        db_bootstrap()
+    except OperationalError:
+        # all db-bound testcases need to test for DB_READY before run.
+        pass
+
 class ValidationPipeTests(mocker.MockerTestCase):
 
     def _makeOne(self, data, **kwargs):
@@ -53,3 +68,168 @@ class ValidationPipeTests(mocker.MockerTestCase):
         vpipe = self._makeOne([{'name': 'foo'}])
         self.assertRaises(NotImplementedError, lambda: vpipe.validate('foo'))
 
+
+
+class ConcurrentValidationPipeTests(unittest.TestCase):
+
+    def _makeRule(self, told, result, delay=0, timeout=None):
+        class RecordingNotifier(object):
+            def tell(self, message, status, label=None):
+                told.append((message, status, label))
+
+        class Rule(vpipes.ValidationPipe):
+            _stage_ = 'Foo'
+
+            def validate(self, item):
+                time.sleep(delay)
+                return result
+
+        rule = Rule(lambda attempt, session: RecordingNotifier())
+        if timeout is not None:
+            rule._timeout_ = timeout
+        return rule
+
+    def test_notices_follow_the_declared_order(self):
+        told = []
+        vpipe = vpipes.ConcurrentValidationPipe([
+            self._makeRule(told, [models.Status.ok, 'first'], delay=0.05),
+            self._makeRule(told, [models.Status.error, 'second']),
+        ])
+        item = (AttemptStub(), None, {}, SessionStub())
+
+        self.assertEqual(vpipe.transform(item), item)
+        self.assertEqual(told, [('first', models.Status.ok, 'Foo'),
+                                ('second', models.Status.error, 'Foo')])
+
+    def test_rules_run_concurrently(self):
+        told = []
+        vpipe = vpipes.ConcurrentValidationPipe(
+            [self._makeRule(told, [models.Status.ok, 'foo'], delay=0.1) for i in range(4)],
+            workers=4)
+
+        started_at = time.time()
+        vpipe.transform((AttemptStub(), None, {}, SessionStub()))
+        self.assertLess(time.time() - started_at, 0.3)
+
+    def test_timed_out_rules_are_notified_as_warnings(self):
+        told = []
+        vpipe = vpipes.ConcurrentValidationPipe([
+            self._makeRule(told, [models.Status.ok, 'foo'], delay=0.5, timeout=0.01),
+        ])
+        vpipe.transform((AttemptStub(), None, {}, SessionStub()))
+
+        self.assertEqual(told[0][1], models.Status.warning)
+
+    def test_hung_rules_do_not_hold_the_threads(self):
+        told = []
+        vpipe = vpipes.ConcurrentValidationPipe([
+            self._makeRule(told, [models.Status.ok, 'foo'], delay=0.5, timeout=0.01),
+        ], workers=1)
+        vpipe.transform((AttemptStub(), None, {}, SessionStub()))
+        vpipe._pipes = [self._makeRule(told, [models.Status.ok, 'bar'], timeout=0.2)]
+        vpipe.transform((AttemptStub(), None, {}, SessionStub()))
+
+        self.assertEqual(told[1], ('bar', models.Status.ok, 'Foo'))
+        self.assertEqual(len(vpipe._hung), 1)
+
+    def test_timeouts_count_from_the_start_of_each_rule(self):
+        told = []
+        vpipe = vpipes.ConcurrentValidationPipe(
+            [self._makeRule(told, [models.Status.ok, 'foo'], delay=0.1, timeout=0.3)
+             for i in range(4)], workers=1)
+        vpipe.transform((AttemptStub(), None, {}, SessionStub()))
+
+        self.assertEqual([status for message, status, label in told], [models.Status.ok] * 4)
+
+    def test_queued_rules_run_after_a_timeout(self):
+        told = []
+        vpipe = vpipes.ConcurrentValidationPipe([
+            self._makeRule(told, [models.Status.ok, 'foo'], delay=0.5, timeout=0.01),
+            self._makeRule(told, [models.Status.ok, 'bar'], timeout=0.2),
+        ], workers=1)
+        vpipe.transform((AttemptStub(), None, {}, SessionStub()))
+
+        self.assertEqual(told[1], ('bar', models.Status.ok, 'Foo'))
+
+    def test_invalid_attempts_are_bypassed(self):
+        told = []
+        vpipe = vpipes.ConcurrentValidationPipe([
+            self._makeRule(told, [models.Status.ok, 'foo']),
+        ])
+        attempt = AttemptStub()
+        attempt.is_valid = False
+        vpipe.transform((attempt, None, {}, SessionStub()))
+
+        self.assertEqual(told, [])
+
+
+@unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+class ValidationResultReuseTests(unittest.TestCase):
+
+    def tearDown(self):
+        transaction.abort()
+        models.ScopedSession.remove()
+
+    def _makeRule(self, calls, manager_data=True):
+        class Rule(vpipes.ValidationPipe):
+            _stage_ = 'Foo'
+            _manager_data_ = manager_data
+
+            def validate(self, item):
+                calls.append(self)
+                return [models.Status.warning, 'foo']
+
+        return Rule(lambda attempt, session: NotifierStub())
+
+    def _makeItem(self, xml='<root><foo/></root>', data=None):
+        pkg_analyzer = PackageAnalyzerStub()
+        pkg_analyzer._xml_string = xml
+        return (AttemptStub(), pkg_analyzer, data or {'journal': {'title': 'foo'}},
+                models.ScopedSession())
+
+    def test_results_are_reused_for_the_same_xml(self):
+        calls = []
+        vpipe = vpipes.ConcurrentValidationPipe([self._makeRule(calls)], reuse_results=True)
+
+        vpipe.transform(self._makeItem())
+        vpipe.transform(self._makeItem())
+
+        self.assertEqual(len(calls), 1)
+
+    def test_changed_xml_is_validated_again(self):
+        calls = []
+        vpipe = vpipes.ConcurrentValidationPipe([self._makeRule(calls)], reuse_results=True)
+
+        vpipe.transform(self._makeItem())
+        vpipe.transform(self._makeItem(xml='<root><bar/></root>'))
+
+        self.assertEqual(len(calls), 2)
+
+    def test_changed_manager_data_reruns_dependent_rules_only(self):
+        calls = []
+        dependent = self._makeRule(calls)
+        independent = self._makeRule(calls, manager_data=False)
+        # a single thread runs the rules in the declared order.
+        vpipe = vpipes.ConcurrentValidationPipe([dependent, independent], workers=1,
+                                                reuse_results=True)
+
+        vpipe.transform(self._makeItem())
+        vpipe.transform(self._makeItem(data={'journal': {'title': 'bar'}}))
+
+        self.assertEqual(calls, [dependent, independent, dependent])
+
+    def test_reused_results_are_notified(self):
+        told = []
+
+        class RecordingNotifier(object):
+            def tell(self, message, status, label=None):
+                told.append((message, status))
+
+        rule = self._makeRule([])
+        rule._notifier = lambda attempt, session: RecordingNotifier()
+        vpipe = vpipes.ConcurrentValidationPipe([rule], reuse_results=True)
+
+        vpipe.transform(self._makeItem())
+        vpipe.transform(self._makeItem())
+
+        self.assertEqual(told, [('foo', models.Status.warning)] * 2)
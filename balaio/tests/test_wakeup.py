@@ -0,0 +1,124 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy.exc import OperationalError
+import transaction
+
+from balaio import wakeup, models
+from .utils import db_bootstrap, DB_READY
+
+
+global_engine = None
+
+
+def setUpModule():
+    """
+    Initialize the database.
+    """
+    global global_engine
+    try:
+        global_engine = db_bootstrap()
+    except OperationalError:
+        # global_engine remains None, all db-bound testcases
+        # need to test for DB_READY before run.
+        pass
+
+
+class EngineStub(object):
+    class dialect(object):
+        name = 'sqlite'
+
+
+class SessionStub(object):
+    bind = EngineStub()
+
+
+class SocketListenerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.socket_path = os.path.join(tempfile.mkdtemp(), 'wakeup.sock')
+        self.listener = wakeup.Listener(EngineStub(), self.socket_path)
+        self.listener.listen()
+
+    def tearDown(self):
+        transaction.abort()
+        self.listener.close()
+        os.rmdir(os.path.dirname(self.socket_path))
+
+    def test_wait_times_out_without_notifications(self):
+        self.assertFalse(self.listener.wait(0.01))
+
+    def test_notifications_are_sent_on_commit(self):
+        wakeup.notify(SessionStub(), self.socket_path)
+        self.assertFalse(self.listener.wait(0.01))
+
+        transaction.commit()
+        self.assertTrue(self.listener.wait(1))
+
+    def test_notifications_are_discarded_on_abort(self):
+        wakeup.notify(SessionStub(), self.socket_path)
+        transaction.abort()
+
+        self.assertFalse(self.listener.wait(0.01))
+
+    def test_pending_notifications_are_coalesced(self):
+        for i in range(3):
+            wakeup.notify(SessionStub(), self.socket_path)
+            transaction.commit()
+
+        self.assertTrue(self.listener.wait(1))
+        self.assertFalse(self.listener.wait(0.01))
+
+    def test_notify_without_listeners(self):
+        self.listener.close()
+        wakeup.notify(SessionStub(), self.socket_path)
+        transaction.commit()
+
+    def test_all_listeners_are_woken_up(self):
+        other = wakeup.Listener(EngineStub(), self.socket_path)
+        other.listen()
+        try:
+            wakeup.notify(SessionStub(), self.socket_path)
+            transaction.commit()
+
+            self.assertTrue(self.listener.wait(1))
+            self.assertTrue(other.wait(1))
+        finally:
+            other.close()
+
+    def test_sockets_of_dead_listeners_are_removed(self):
+        import socket
+        stale_path = '%s.0.0' % self.socket_path
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(stale_path)
+        sock.close()
+
+        wakeup.notify(SessionStub(), self.socket_path)
+        transaction.commit()
+
+        self.assertTrue(self.listener.wait(1))
+        self.assertFalse(os.path.exists(stale_path))
+
+
+@unittest.skipUnless(DB_READY, u'DB must be set. Make sure `app_balaio_tests` is properly configured.')
+class PostgresListenerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.listener = wakeup.Listener(global_engine)
+        self.listener.listen()
+
+    def tearDown(self):
+        transaction.abort()
+        models.ScopedSession.remove()
+        self.listener.close()
+
+    def test_notifications_are_sent_on_commit(self):
+        wakeup.notify(models.ScopedSession())
+        self.assertFalse(self.listener.wait(0.01))
+
+        transaction.commit()
+        self.assertTrue(self.listener.wait(1))
+
+    def test_wait_times_out_without_notifications(self):
+        self.assertFalse(self.listener.wait(0.01))
@@ -0,0 +1,191 @@
+#coding: utf-8
+"""
+Wall and CPU time instrumentation of the validation pipes.
+
+Timings are aggregated by pipe in rolling histograms, kept by the
+module-level :data:`registry`, and also collected per attempt.
+
+CPU time is measured per thread, so the pipes running concurrently do
+not count each other's work. It is not recorded on platforms without a
+per-thread CPU clock.
+"""
+import os
+import sys
+import time
+import ctypes
+import ctypes.util
+import json
+import bisect
+import logging
+import threading
+import functools
+import collections
+
+
+logger = logging.getLogger('balaio.timing')
+
+# upper bounds of the histogram buckets, in seconds.
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+# see clock_gettime(2).
+CLOCK_THREAD_CPUTIME_ID = 3
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def _get_thread_clock():
+    """
+    Returns a function that reads the CPU time of the calling thread,
+    in seconds, or None if the platform has no such clock.
+    """
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'),
+                           use_errno=True)
+        clock_gettime = libc.clock_gettime
+    except (OSError, AttributeError) as e:
+        logger.warning('CPU time of threads is not available: %s' % e)
+        return None
+
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_timespec)]
+
+    def thread_time():
+        ts = _timespec()
+        if clock_gettime(CLOCK_THREAD_CPUTIME_ID, ctypes.byref(ts)) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+
+    return thread_time
+
+
+thread_time = _get_thread_clock()
+
+
+class RollingHistogram(object):
+    """
+    Distribution of the latest `window` samples.
+    """
+    def __init__(self, window=1000, buckets=BUCKETS):
+        self.buckets = buckets
+        self._samples = collections.deque(maxlen=window)
+
+    def add(self, value):
+        self._samples.append(value)
+
+    def summary(self):
+        """
+        Returns a dict with the count, mean, percentiles and the
+        histogram of the samples.
+        """
+        samples = sorted(self._samples)
+        if not samples:
+            return {'count': 0}
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+        histogram = [0] * (len(self.buckets) + 1)
+        for value in samples:
+            histogram[bisect.bisect_left(self.buckets, value)] += 1
+
+        return {
+            'count': len(samples),
+            'mean': sum(samples) / len(samples),
+            'p50': percentile(0.50),
+            'p95': percentile(0.95),
+            'max': samples[-1],
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+inf'], histogram)),
+        }
+
+
+class TimingRegistry(object):
+    """
+    Thread-safe rolling histograms of wall and CPU times, by pipe.
+    """
+    def __init__(self, window=1000):
+        self.window = window
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, wall, cpu):
+        """
+        :param cpu: CPU time, or None if unknown.
+        """
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = (RollingHistogram(self.window),
+                                          RollingHistogram(self.window))
+            wall_hist, cpu_hist = self._histograms[name]
+            wall_hist.add(wall)
+            if cpu is not None:
+                cpu_hist.add(cpu)
+
+    def snapshot(self):
+        with self._lock:
+            return dict((name, {'wall': wall_hist.summary(), 'cpu': cpu_hist.summary()})
+                        for name, (wall_hist, cpu_hist) in self._histograms.items())
+
+    def dump(self, path):
+        """
+        Writes the snapshot as JSON to `path`, atomically.
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, sort_keys=True)
+        os.rename(tmp_path, path)
+
+
+registry = TimingRegistry()
+
+
+def call_timed(func, *args):
+    """
+    Returns `func(*args)`, its wall time and the CPU time of the calling
+    thread, in seconds. CPU time is None if unknown.
+    """
+    if thread_time is None:
+        wall = time.time()
+        result = func(*args)
+        return result, time.time() - wall, None
+
+    wall, cpu = time.time(), thread_time()
+    result = func(*args)
+    return result, time.time() - wall, thread_time() - cpu
+
+
+def record(attempt, name, wall, cpu):
+    """
+    Records the timing of the pipe `name` in the registry, and in the
+    `_timings` dict of `attempt`.
+    """
+    registry.record(name, wall, cpu)
+
+    timings = getattr(attempt, '_timings', None)
+    if timings is None:
+        timings = {}
+        try:
+            attempt._timings = timings
+        except AttributeError:
+            return None
+
+    timings[name] = {'wall': round(wall, 6),
+                     'cpu': round(cpu, 6) if cpu is not None else None}
+
+
+def timed(transform):
+    """
+    Decorates `Pipe.transform` to record its wall and CPU time.
+    The first element of the transformed item must be the attempt.
+    """
+    @functools.wraps(transform)
+    def wrapper(self, item):
+        result, wall, cpu = call_timed(transform, self, item)
+        record(item[0], type(self).__name__, wall, cpu)
+        return result
+
+    return wrapper
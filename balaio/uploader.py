@@ -1,10 +1,18 @@
 # coding:utf-8
 import imp
 import sys
+import errno
+import time
+import socket
+import logging
+import threading
 
 from balaio import utils
 
 
+logger = logging.getLogger(__name__)
+
+
 def load_module(name):
     """
     Try to load the module known by `name`.
@@ -29,6 +37,27 @@ def load_module(name):
         if file: file.close()
 
 
+# errors that leave a connection unusable.
+CONNECTION_ERRORS = (IOError, socket.error)
+_paramiko = load_module('paramiko')
+if _paramiko:
+    CONNECTION_ERRORS += (_paramiko.SSHException,)
+
+# errno of the IOErrors raised by paramiko for SFTP statuses, such as
+# missing or forbidden remote files, on connections that are still usable.
+SFTP_STATUS_ERRNOS = (errno.ENOENT, errno.EACCES)
+
+
+def is_connection_error(exc):
+    """
+    If `exc` leaves the connection that raised it unusable.
+    """
+    if not isinstance(exc, socket.error) and getattr(exc, 'errno', None) in SFTP_STATUS_ERRNOS:
+        return False
+
+    return isinstance(exc, CONNECTION_ERRORS)
+
+
 class BlobBackend(object):
     """
     Base class for remote backends.
@@ -77,6 +106,14 @@ class BlobBackend(object):
         """
         raise NotImplementedError()
 
+    def is_alive(self, probe=False):
+        """
+        If the connection is usable.
+
+        :param probe: (optional) if a request must be sent to the remote host.
+        """
+        raise NotImplementedError()
+
     def __enter__(self):
         self.connect()
         return self
@@ -92,6 +129,106 @@ class BlobBackend(object):
         return all(cls._modules.values())
 
 
+class BackendPool(object):
+    """
+    Thread-safe pool of connected backends, reused across uploads.
+
+    Connections are checked before being lent, and the broken ones are
+    replaced. Connections idle for more than `check_after` seconds are
+    probed at the remote host. Connections used by an upload that failed
+    with a connection error (see :func:`is_connection_error`) are discarded.
+    At most `size` connections are open at once, and other threads wait for
+    a free one.
+
+    Like backends, pools implement the context manager interface, lending
+    a connected backend to the calling thread::
+
+        >>> with pool as backend:
+        ...     backend.send(fp, path)
+    """
+    def __init__(self, factory, size=4, check_after=30):
+        """
+        :param factory: callable that returns a new, not connected, :class:`BlobBackend`.
+        :param size: (optional) max number of connections.
+        :param check_after: (optional) idle seconds before a connection is probed.
+        """
+        self.factory = factory
+        self.check_after = check_after
+
+        # the most recently released connections are lent first.
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._local = threading.local()
+
+    def _close(self, backend):
+        try:
+            backend.cleanup()
+        except Exception as e:
+            logger.debug('Error while closing a connection: %s' % e)
+
+    def acquire(self):
+        """
+        Returns a connected backend, that must be given back with :meth:`release`.
+        """
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    if not self._idle:
+                        break
+                    backend, released_at = self._idle.pop()
+
+                if backend.is_alive(probe=time.time() - released_at > self.check_after):
+                    return backend
+
+                logger.info('Replacing a broken connection')
+                self._close(backend)
+
+            backend = self.factory()
+            try:
+                backend.connect()
+            except:
+                self._close(backend)
+                raise
+            return backend
+        except:
+            self._slots.release()
+            raise
+
+    def release(self, backend, broken=False):
+        """
+        Gives `backend` back to the pool, or closes it if `broken`.
+        """
+        try:
+            if broken:
+                self._close(backend)
+            else:
+                with self._lock:
+                    self._idle.append((backend, time.time()))
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """
+        Closes the idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for backend, __ in idle:
+            self._close(backend)
+
+    def __enter__(self):
+        backend = self.acquire()
+        self._local.__dict__.setdefault('lent', []).append(backend)
+        return backend
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        broken = exc_type is not None and is_connection_error(exc_value)
+        self.release(self._local.lent.pop(), broken=broken)
+
+
 ####
 # Custom backends
 ####
@@ -129,6 +266,21 @@ class StaticScieloBackend(BlobBackend):
         self.transport.close()
         self.sftp = None
 
+    def is_alive(self, probe=False):
+        """
+        If the transport is active. With `probe`, the basepath is stat'ed.
+        """
+        if self.sftp is None or not self.transport.is_active():
+            return False
+
+        if probe:
+            try:
+                self.sftp.stat('.')
+            except (IOError, self._modules['paramiko'].SSHException):
+                return False
+
+        return True
+
     def send(self, fp, path):
         """
         :param fp:
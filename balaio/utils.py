@@ -1,4 +1,5 @@
 import os
+import socket
 import weakref
 import requests
 import zipfile
@@ -7,6 +8,9 @@ import logging, logging.handlers
 from ConfigParser import SafeConfigParser
 
 from requests.exceptions import Timeout, RequestException
+from scieloapi import exceptions as scieloapi_exceptions
+
+import excepts
 
 
 logger = logging.getLogger('balaio.utils')
@@ -125,6 +129,28 @@ def setup_logging():
         has_logger = True
 
 
+# errors raised while a dependency, e.g. SciELO Manager, is unavailable.
+TRANSIENT_ERRORS = (
+    excepts.TransientError,
+    scieloapi_exceptions.ConnectionError,
+    scieloapi_exceptions.Timeout,
+    scieloapi_exceptions.InternalServerError,
+    scieloapi_exceptions.BadGateway,
+    scieloapi_exceptions.ServiceUnavailable,
+    requests.exceptions.ConnectionError,
+    Timeout,
+    socket.error,
+)
+
+
+def is_transient_error(exc):
+    """
+    Returns a bool indicating if `exc` was caused by a temporarily
+    unavailable dependency, so the operation may be retried later.
+    """
+    return isinstance(exc, TRANSIENT_ERRORS)
+
+
 def normalize_data(data):
     """
     Normalize the ``data`` param converting to uppercase and clean spaces
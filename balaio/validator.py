@@ -1,10 +1,15 @@
 # coding: utf-8
 import re
+import os
 import sys
+import uuid
+import socket
 import logging
 import xml.etree.ElementTree as etree
 import calendar
 import time
+import threading
+import collections
 
 import scieloapi
 import transaction
@@ -15,6 +20,13 @@ import package
 import notifier
 import scieloapitoolbelt
 import models
+import wakeup
+import cache
+import doi
+import timing
+import rules
+import snapshot
+import manager
 
 
 logger = logging.getLogger('balaio.validator')
@@ -22,12 +34,15 @@ logger = logging.getLogger('balaio.validator')
 
 class SetupPipe(vpipes.Pipe):
 
-    def __init__(self, notifier, scieloapi, sapi_tools, pkg_analyzer, issn_validator):
+    def __init__(self, notifier, scieloapi, sapi_tools, pkg_analyzer, issn_validator,
+                 cache=None, snapshot=None):
         self._notifier = notifier
         self._scieloapi = scieloapi
         self._sapi_tools = sapi_tools
         self._pkg_analyzer = pkg_analyzer
         self._issn_validator = issn_validator
+        self._cache = cache
+        self._snapshot = snapshot
 
     def _fetch_journal_data(self, criteria):
         """
@@ -46,13 +61,29 @@ class SetupPipe(vpipes.Pipe):
         Encapsulates the two-phase process of retrieving
         data from one issue matching the criteria.
 
+        The local snapshot is looked up first, if available.
+
         :param criteria: valid criteria to retrieve issue data
         :returns: data of one issue
         """
-        found_journal_issues = self._scieloapi.issues.filter(
-            limit=1, **criteria)
-        return self._scieloapi.fetch_relations(self._sapi_tools.get_one(found_journal_issues))
+        if self._snapshot is not None:
+            issue_data = self._snapshot.find_issue(**criteria)
+            if issue_data is not None:
+                return issue_data
+
+        def fetch():
+            found_journal_issues = self._scieloapi.issues.filter(
+                limit=1, **criteria)
+            return self._scieloapi.fetch_relations(self._sapi_tools.get_one(found_journal_issues))
+
+        if self._cache is None:
+            return fetch()
+
+        issn = criteria.get('print_issn') or criteria.get('eletronic_issn')
+        return self._cache.get_or_fetch(cache.make_key('issue', **criteria),
+                                        fetch, issn=issn)
 
+    @timing.timed
     def transform(self, message):
         """
         Adds some data that will be needed during validation
@@ -116,9 +147,15 @@ class SetupPipe(vpipes.Pipe):
 
 
 class TearDownPipe(vpipes.Pipe):
-    def __init__(self, notifier):
+    def __init__(self, notifier, store_timings=False):
+        """
+        :param notifier: notifier factory.
+        :param store_timings: (optional) store the pipe timings with the checkpoint.
+        """
         self._notifier = notifier
+        self._store_timings = store_timings
 
+    @timing.timed
     def transform(self, item):
         """
         :param item:
@@ -127,8 +164,12 @@ class TearDownPipe(vpipes.Pipe):
 
         logger.debug('%s started processing %s' % (self.__class__.__name__, item))
 
+        notifier = self._notifier(attempt, db_session)
+        if self._store_timings and getattr(attempt, '_timings', None):
+            notifier.checkpoint.timings = attempt._timings
+
         try:
-            self._notifier(attempt, db_session).end()
+            notifier.end()
         except RuntimeError:
             pass
 
@@ -143,6 +184,7 @@ class TearDownPipe(vpipes.Pipe):
         logger.info('Finished validating %s' % attempt)
 
 
+@rules.rule('.//journal-meta/publisher/publisher-name')
 class PublisherNameValidationPipe(vpipes.ValidationPipe):
     """
     Validate the publisher name in article `.//journal-meta/publisher/publisher-name`,
@@ -164,7 +206,7 @@ class PublisherNameValidationPipe(vpipes.ValidationPipe):
         attempt, pkg_analyzer, journal_and_issue_data = item[:3]
         j_publisher_name = journal_and_issue_data.get('journal', {}).get('publisher_name', None)
         if j_publisher_name:
-            data = pkg_analyzer.xml
+            data = rules.get_matches(pkg_analyzer)
             xml_publisher_name = data.findtext('.//journal-meta/publisher/publisher-name')
 
             if xml_publisher_name:
@@ -179,12 +221,130 @@ class PublisherNameValidationPipe(vpipes.ValidationPipe):
         return r
 
 
+Reference = collections.namedtuple('Reference',
+    'id source year publication_type article_title')
+
+
+rules.register('.//ref-list/ref')
+
+
+def get_reference_index(pkg_analyzer):
+    """
+    Returns the list of :class:`Reference` of the article.
+
+    The references are extracted in a single pass over ``.//ref-list/ref``
+    and cached on `pkg_analyzer`, so all reference pipes share them.
+    Missing elements and elements without text are both set as None.
+
+    :param pkg_analyzer: instance of :class:`package.PackageAnalyzer`.
+    """
+    index = getattr(pkg_analyzer, '_reference_index', None)
+    if index is not None:
+        return index
+
+    index = []
+    for ref in rules.get_matches(pkg_analyzer).findall('.//ref-list/ref'):
+        found = {}
+        for elem in ref.iter():
+            if elem.tag in ('source', 'year'):
+                found.setdefault(elem.tag, elem)
+            elif (elem.tag == 'element-citation' and
+                    elem.get('publication-type') == 'journal' and
+                    'article_title' not in found):
+                article_title = elem.find('article-title')
+                if article_title is not None:
+                    found['article_title'] = article_title
+
+        citation = ref.find('.//element-citation')
+        index.append(Reference(
+            id=ref.get('id', ''),
+            source=getattr(found.get('source'), 'text', None),
+            year=getattr(found.get('year'), 'text', None),
+            publication_type=citation.get('publication-type') if citation is not None else None,
+            article_title=getattr(found.get('article_title'), 'text', None)))
+
+    pkg_analyzer._reference_index = index
+    return index
+
+
+IssueLookups = collections.namedtuple('IssueLookups',
+    'section_titles section_labels pub_dates pub_date_labels')
+
+# compiled lookups of the latest issues, by issue.
+ISSUE_LOOKUPS_MAX = 256
+_issue_lookups = collections.OrderedDict()
+_issue_lookups_lock = threading.Lock()
+
+_month_abbrev_name = dict(enumerate(calendar.month_abbr))
+
+
+def compile_issue_lookups(issue_data, normalize_data=utils.normalize_data):
+    """
+    Returns the :class:`IssueLookups` of `issue_data`: the set of normalized
+    section titles and the set of expected publication dates, along
+    with their labels used on notices.
+
+    :param issue_data: dict of issue data.
+    :param normalize_data: callable used to normalize the section titles.
+    """
+    titles = [sectitle for section in issue_data.get('sections', [])
+                       for lang, sectitle in section['titles']]
+
+    issue_year = str(issue_data.get('publication_year'))
+    issue_start_month_name = _month_abbrev_name.get(issue_data.get('publication_start_month'))
+    issue_end_month_name = _month_abbrev_name.get(issue_data.get('publication_end_month'))
+    issue_start_month_num = str(issue_data.get('publication_start_month'))
+    issue_end_month_num = str(issue_data.get('publication_end_month'))
+
+    if issue_end_month_num == '0':
+        pub_dates = ('%s/%s' % (issue_start_month_name, issue_year),
+                     '%s/%s' % (issue_start_month_num, issue_year))
+    else:
+        pub_dates = ('%s-%s/%s' % (issue_start_month_name, issue_end_month_name, issue_year),
+                     '%s-%s/%s' % (issue_start_month_num, issue_end_month_name, issue_year))
+
+    return IssueLookups(
+        section_titles=frozenset(normalize_data(title) for title in titles),
+        section_labels=' | '.join(titles),
+        pub_dates=frozenset(pub_dates),
+        pub_date_labels=' | '.join(pub_dates))
+
+
+def get_issue_lookups(issue_data, normalize_data=utils.normalize_data):
+    """
+    Returns the :class:`IssueLookups` of `issue_data`, compiled once per
+    issue and kept while the issue is not updated at SciELO Manager.
+
+    Issue data lacking `resource_uri` or `updated` is compiled on every call.
+    """
+    resource_uri = issue_data.get('resource_uri')
+    updated = issue_data.get('updated')
+    if not (resource_uri and updated):
+        return compile_issue_lookups(issue_data, normalize_data)
+
+    key = (resource_uri, updated, normalize_data)
+    with _issue_lookups_lock:
+        lookups = _issue_lookups.pop(key, None)
+        if lookups is not None:
+            _issue_lookups[key] = lookups
+            return lookups
+
+    lookups = compile_issue_lookups(issue_data, normalize_data)
+    with _issue_lookups_lock:
+        _issue_lookups[key] = lookups
+        while len(_issue_lookups) > ISSUE_LOOKUPS_MAX:
+            _issue_lookups.popitem(last=False)
+
+    return lookups
+
+
 class ReferenceValidationPipe(vpipes.ValidationPipe):
     """
     Validate if exist the tag ref-list.
     Analyzed tag: ``.//ref-list/ref``
     """
     _stage_ = 'References'
+    _manager_data_ = False
 
     def __init__(self, notifier):
         self._notifier = notifier
@@ -194,7 +354,7 @@ class ReferenceValidationPipe(vpipes.ValidationPipe):
         The article may be a editorial why return a warning if no references
         """
         attempt, pkg_analyzer, journal_and_issue_data = item[:3]
-        refs = pkg_analyzer.xml.findall(".//ref-list/ref")
+        refs = get_reference_index(pkg_analyzer)
 
         if refs:
             return [models.Status.ok, 'Found ' + str(len(refs)) + ' references']
@@ -210,6 +370,7 @@ class ReferenceSourceValidationPipe(vpipes.ValidationPipe):
     Analized tag: ``.//ref-list/ref/element-citation/source``
     """
     _stage_ = 'References'
+    _manager_data_ = False
 
     def __init__(self, notifier):
         self._notifier = notifier
@@ -217,17 +378,10 @@ class ReferenceSourceValidationPipe(vpipes.ValidationPipe):
     def validate(self, item):
         lst_errors = []
         attempt, pkg_analyzer, journal_and_issue_data = item[:3]
-        refs = pkg_analyzer.xml.findall(".//ref-list/ref")
 
-        if refs:
-            for ref in refs:
-                source = ref.find(".//source")
-
-                if source is not None:
-                    if source.text is None:
-                        lst_errors.append(ref.attrib['id'])
-                else:
-                    lst_errors.append(ref.attrib['id'])
+        for ref in get_reference_index(pkg_analyzer):
+            if ref.source is None:
+                lst_errors.append(ref.id)
 
         if lst_errors:
             msg_error = 'Missing data: source. (%s)' % ', '.join(lst_errors)
@@ -244,6 +398,7 @@ class ReferenceYearValidationPipe(vpipes.ValidationPipe):
     Analized tag: ``.//ref-list/ref/element-citation/year``
     """
     _stage_ = 'References'
+    _manager_data_ = False
 
     def __init__(self, notifier):
         self._notifier = notifier
@@ -254,20 +409,12 @@ class ReferenceYearValidationPipe(vpipes.ValidationPipe):
         bad_data = []
 
         attempt, pkg_analyzer, journal_and_issue_data = item[:3]
-        refs = pkg_analyzer.xml.findall(".//ref-list/ref")
 
-        if refs:
-            for ref in refs:
-                year = ref.find(".//year")
-
-                if year is not None:
-                    if year.text is None:
-                        missing_data_ref_id_list.append(ref.attrib['id'])
-                    else:
-                        if not re.search(r'\d{4}', year.text):
-                            bad_data.append((ref.attrib['id'], year.text))
-                else:
-                    missing_data_ref_id_list.append(ref.attrib['id'])
+        for ref in get_reference_index(pkg_analyzer):
+            if ref.year is None:
+                missing_data_ref_id_list.append(ref.id)
+            elif not re.search(r'\d{4}', ref.year):
+                bad_data.append((ref.id, ref.year))
 
         msg_error = ''
         if missing_data_ref_id_list:
@@ -287,6 +434,7 @@ class ReferenceJournalTypeArticleTitleValidationPipe(vpipes.ValidationPipe):
     Analized tag: ``.//ref-list/ref/element-citation[@publication-type='journal']/article-title``
     """
     _stage_ = 'References'
+    _manager_data_ = False
 
     def __init__(self, notifier):
         self._notifier = notifier
@@ -296,21 +444,15 @@ class ReferenceJournalTypeArticleTitleValidationPipe(vpipes.ValidationPipe):
         lst_errors = []
 
         attempt, pkg_analyzer, journal_and_issue_data = item[:3]
-        refs = pkg_analyzer.xml.findall(".//ref-list/ref")
-
-        if refs:
-            for ref in refs:
-                article_title = ref.find(".//element-citation[@publication-type='journal']/article-title")
 
-                if article_title is not None:
-                    if article_title.text is None:
-                        lst_errors.append(ref.attrib['id'])
-                else:
-                    lst_errors.append(ref.attrib['id'])
+        for ref in get_reference_index(pkg_analyzer):
+            if ref.article_title is None:
+                lst_errors.append(ref.id)
 
         return [models.Status.error, 'Missing data: article-title. (%s)' % ', '.join(lst_errors) ] if lst_errors else [models.Status.ok, 'Valid data: article-title']
 
 
+@rules.rule('.//journal-meta/abbrev-journal-title[@abbrev-type="publisher"]')
 class JournalAbbreviatedTitleValidationPipe(vpipes.ValidationPipe):
     """
     Checks exist abbreviated title on source and xml
@@ -328,7 +470,7 @@ class JournalAbbreviatedTitleValidationPipe(vpipes.ValidationPipe):
         abbrev_title = journal_and_issue_data.get('journal').get('short_title')
 
         if abbrev_title:
-            abbrev_title_xml = pkg_analyzer.xml.find('.//journal-meta/abbrev-journal-title[@abbrev-type="publisher"]')
+            abbrev_title_xml = rules.get_matches(pkg_analyzer).find('.//journal-meta/abbrev-journal-title[@abbrev-type="publisher"]')
             if abbrev_title_xml is not None:
                 if self._normalize_data(abbrev_title) == self._normalize_data(abbrev_title_xml.text):
                     return [models.Status.ok, 'Valid abbrev-journal-title: %s' % abbrev_title_xml.text ]
@@ -340,6 +482,7 @@ class JournalAbbreviatedTitleValidationPipe(vpipes.ValidationPipe):
             return [models.Status.error, 'Missing data: short_title, in scieloapi']
 
 
+@rules.rule('.//funding-group', './/ack')
 class FundingGroupValidationPipe(vpipes.ValidationPipe):
     """
     Validate Funding Group according to the following rules:
@@ -347,6 +490,7 @@ class FundingGroupValidationPipe(vpipes.ValidationPipe):
     and this data is usually in acknowledge
     """
     _stage_ = 'Article'
+    _manager_data_ = False
 
     def __init__(self, notifier):
         self._notifier = notifier
@@ -372,7 +516,7 @@ class FundingGroupValidationPipe(vpipes.ValidationPipe):
 
         attempt, pkg_analyzer, journal_and_issue_data = item[:3]
 
-        xml_tree = pkg_analyzer.xml
+        xml_tree = rules.get_matches(pkg_analyzer)
 
         funding_nodes = xml_tree.findall('.//funding-group')
 
@@ -392,6 +536,7 @@ class FundingGroupValidationPipe(vpipes.ValidationPipe):
         return [status, description]
 
 
+@rules.rule('.//journal-meta/journal-id[@journal-id-type="nlm-ta"]')
 class NLMJournalTitleValidationPipe(vpipes.ValidationPipe):
     """
     Validate NLM journal title
@@ -416,7 +561,7 @@ class NLMJournalTitleValidationPipe(vpipes.ValidationPipe):
         #The value returned from get('medline_title') when do not have title is None
         j_nlm_title = journal_and_issue_data.get('journal').get('medline_title')
 
-        xml_tree = pkg_analyzer.xml
+        xml_tree = rules.get_matches(pkg_analyzer)
         xml_nlm_title = xml_tree.findtext('.//journal-meta/journal-id[@journal-id-type="nlm-ta"]')
 
         if not xml_nlm_title:
@@ -433,12 +578,15 @@ class NLMJournalTitleValidationPipe(vpipes.ValidationPipe):
         return [status, description]
 
 
+@rules.rule(doi.DOI_XPATH)
 class DOIVAlidationPipe(vpipes.ValidationPipe):
     """
     Verify if exists DOI in XML and if it`s validated before the CrossRef
     """
 
     _stage_ = 'Article'
+    # DOI statuses are cached by the resolver, with their own TTL.
+    _reusable_ = False
 
     def __init__(self, notifier, doi_validator):
         self._notifier = notifier
@@ -448,17 +596,21 @@ class DOIVAlidationPipe(vpipes.ValidationPipe):
 
         attempt, pkg_analyzer, journal_data = item[:3]
 
-        doi_xml = pkg_analyzer.xml.findtext('.//article-id/[@pub-id-type="doi"]')
+        doi_xml = rules.get_matches(pkg_analyzer).findtext(doi.DOI_XPATH)
 
         if doi_xml:
-            if self._doi_validator(doi_xml):
+            is_registered = self._doi_validator(doi_xml)
+            if is_registered:
                 return [models.Status.ok, 'Valid DOI: %s' % doi_xml]
+            elif is_registered is None:
+                return [models.Status.warning, 'DOI could not be verified: %s' % doi_xml]
             else:
                 return [models.Status.warning, 'DOI is not registered: %s' % doi_xml]
         else:
             return [models.Status.warning, 'Missing data: DOI']
 
 
+@rules.rule('.//article-meta/permissions')
 class LicenseValidationPipe(vpipes.ValidationPipe):
     """
     Verify if exists license in XML
@@ -466,6 +618,7 @@ class LicenseValidationPipe(vpipes.ValidationPipe):
     """
 
     _stage_ = 'Article'
+    _manager_data_ = False
 
     def __init__(self, notifier):
         self._notifier = notifier
@@ -474,7 +627,7 @@ class LicenseValidationPipe(vpipes.ValidationPipe):
 
         attempt, pkg_analyzer, journal_data = item[:3]
 
-        license_xml = pkg_analyzer.xml.find('.//article-meta/permissions')
+        license_xml = rules.get_matches(pkg_analyzer).find('.//article-meta/permissions')
 
         if license_xml is not None:
             if license_xml.findtext('.//license-p'):
@@ -485,6 +638,7 @@ class LicenseValidationPipe(vpipes.ValidationPipe):
             return [models.Status.error, 'Missing data: permissions']
 
 
+@rules.rule('.//article-categories/subj-group[@subj-group-type="heading"]/subject')
 class ArticleSectionValidationPipe(vpipes.ValidationPipe):
     """
     Validate the article section
@@ -506,57 +660,30 @@ class ArticleSectionValidationPipe(vpipes.ValidationPipe):
         """
         attempt, pkg_analyzer, issue_data = item[:3]
 
-        xml_tree = pkg_analyzer.xml
+        xml_tree = rules.get_matches(pkg_analyzer)
         xml_section = xml_tree.findtext('.//article-categories/subj-group[@subj-group-type="heading"]/subject')
 
         if xml_section:
-            if self._is_a_registered_section_title(issue_data['sections'], xml_section):
+            lookups = get_issue_lookups(issue_data, self._normalize_data)
+            if self._is_a_registered_section_title(lookups.section_titles, xml_section):
                 r = [models.Status.ok, 'Valid article section: %s' % xml_section]
             else:
-                r = [models.Status.error, 'Mismatched data: %s. Expected one of %s' % (xml_section, self.list_sections(issue_data['sections']))]
+                r = [models.Status.error, 'Mismatched data: %s. Expected one of %s' % (xml_section, lookups.section_labels)]
         else:
             r = [models.Status.warning, 'Missing data: article section']
         return r
 
-    def _is_a_registered_section_title(self, sections, section_title):
-        """
-        Return section titles of an issue
-
-        :param sections: has the structure:
-                [ {'titles':
-                    ['pt', 'Artigos Originais'],
-                    ['es', 'Articulos Originales'],
-                    ['en', 'Original Articles'],
-                  },
-                  {'titles':
-                    ['pt', 'Editorial'],
-                    ['es', 'Editorial'],
-                    ['en', 'Editorial'],
-                  },
-                ]
-        """
-        section_title = self._normalize_data(section_title)
-        r = False
-        for section in sections:
-            r = any([True for lang, sectitle in section['titles'] if self._normalize_data(sectitle) == section_title])
-            if r:
-                break
-        return r
-
-    def list_sections(self, sections):
+    def _is_a_registered_section_title(self, section_titles, section_title):
         """
-        Return section titles of an issue
+        Checks if `section_title` is one of the section titles of an issue
+
+        :param section_titles: set of normalized section titles, as compiled
+          by :func:`compile_issue_lookups`.
         """
-        # issue_data['sections'][0]['titles'][0][0=idioma, 1=titulo]
-        # no entanto, deveria ser
-        # issue_data['sections'][0]['titles'][0][idioma] = titulo
-        titles = []
-        for section in sections:
-            for lang, sectitle in section['titles']:
-                titles.append(sectitle)
-        return ' | '.join(titles)
+        return self._normalize_data(section_title) in section_titles
 
 
+@rules.rule('.//article-meta//pub-date')
 class ArticleMetaPubDateValidationPipe(vpipes.ValidationPipe):
     """
     Validate the article section
@@ -575,27 +702,12 @@ class ArticleMetaPubDateValidationPipe(vpipes.ValidationPipe):
         `item` is a tuple comprised of instances of models.Attempt, a
         package.PackageAnalyzer, a dict of journal data and a dict of issue.
         """
-        _months_by_name = {v: k for k, v in enumerate(calendar.month_abbr)}
-        _month_abbrev_name = {k: v for k, v in enumerate(calendar.month_abbr)}
-
         attempt, pkg_analyzer, issue_data = item[:3]
 
-        xml_tree = pkg_analyzer.xml
+        xml_tree = rules.get_matches(pkg_analyzer)
         xml_data = xml_tree.findall('.//article-meta//pub-date')
 
-        issue_year = str(issue_data.get('publication_year'))
-        issue_start_month_name = _month_abbrev_name.get(issue_data.get('publication_start_month'))
-        issue_end_month_name = _month_abbrev_name.get(issue_data.get('publication_end_month'))
-        issue_start_month_num = str(issue_data.get('publication_start_month'))
-        issue_end_month_num = str(issue_data.get('publication_end_month'))
-
-        expected = []
-        if issue_end_month_num == '0':
-            expected.append('%s/%s' % (issue_start_month_name, issue_year))
-            expected.append('%s/%s' % (issue_start_month_num, issue_year))
-        else:
-            expected.append('%s-%s/%s' % (issue_start_month_name, issue_end_month_name, issue_year))
-            expected.append('%s-%s/%s' % (issue_start_month_num, issue_end_month_name, issue_year))
+        lookups = get_issue_lookups(issue_data)
 
         unmatched = []
         r = None
@@ -608,61 +720,266 @@ class ArticleMetaPubDateValidationPipe(vpipes.ValidationPipe):
             else:
                 xml_date = '%s/%s' % ((str(int(month)), year) if month.isdigit() else (month, year))
 
-            if xml_date in expected:
+            if xml_date in lookups.pub_dates:
                 return [models.Status.ok, 'Valid publication date: %s' % xml_date]
             else:
                 unmatched.append(xml_date)
 
-        return [models.Status.error, 'Mismatched data: %s. Expected one of %s' % (' | '.join(unmatched), ' | '.join(expected))]
+        return [models.Status.error, 'Mismatched data: %s. Expected one of %s' % (' | '.join(unmatched), lookups.pub_date_labels)]
+
+
+def get_pipeline(notifier_dep, scieloapi, doi_validator, manager_cache=None,
+                 manager_snapshot=None, rule_workers=4, rule_timeout=30,
+                 reuse_results=False, store_timings=False):
+    """
+    Returns the validation :class:`vpipes.Pipeline`.
+
+    :param notifier_dep: notifier factory.
+    :param scieloapi: SciELO Manager API client.
+    :param doi_validator: callable that checks if a DOI is registered.
+    :param manager_cache: (optional) instance of :class:`cache.DiskCache`.
+    :param manager_snapshot: (optional) instance of :class:`snapshot.ManagerSnapshot`.
+    """
+    return vpipes.Pipeline(
+        SetupPipe(notifier_dep, scieloapi, scieloapitoolbelt,
+                  package.PackageAnalyzer, utils.is_valid_issn,
+                  cache=manager_cache, snapshot=manager_snapshot),
+        # independent rules, run concurrently.
+        vpipes.ConcurrentValidationPipe([
+            PublisherNameValidationPipe(notifier_dep, utils.normalize_data),
+            JournalAbbreviatedTitleValidationPipe(notifier_dep, utils.normalize_data),
+            NLMJournalTitleValidationPipe(notifier_dep, utils.normalize_data),
+            ArticleSectionValidationPipe(notifier_dep, utils.normalize_data),
+            FundingGroupValidationPipe(notifier_dep),
+            DOIVAlidationPipe(notifier_dep, doi_validator),
+            ArticleMetaPubDateValidationPipe(notifier_dep),
+            ReferenceValidationPipe(notifier_dep),
+            ReferenceSourceValidationPipe(notifier_dep),
+            ReferenceJournalTypeArticleTitleValidationPipe(notifier_dep),
+            ReferenceYearValidationPipe(notifier_dep),
+            LicenseValidationPipe(notifier_dep),
+        ], workers=rule_workers, timeout=rule_timeout, reuse_results=reuse_results),
+        TearDownPipe(notifier_dep, store_timings=store_timings)
+    )
 
 
 ####
 # Validation worker
 ####
 class Worker(object):
-
-    def __init__(self, pipeline):
+    """
+    Validates the attempts ready to be validated.
+
+    Any number of workers may run concurrently: each one leases a batch
+    of attempts before validating them, so the same attempt is never
+    validated twice. The lease of each attempt is renewed when its
+    validation starts, and the attempts whose lease was lost meanwhile
+    are skipped. Leases of dead workers expire after `lease_seconds`
+    and their attempts are claimed again.
+
+    Attempts that fail are deferred with exponential backoff instead of
+    being claimed again as soon as their lease expires. Failures caused
+    by unavailable dependencies, e.g. SciELO Manager, are retried until
+    they succeed. Attempts failing for other reasons, e.g. corrupt
+    packages, are marked as invalid after `max_failures` failures.
+    """
+    def __init__(self, pipeline, batch_size=50, lease_seconds=600, doi_resolver=None,
+                 timings_path=None, retry_base_delay=60, retry_max_delay=3600,
+                 max_failures=5):
+        """
+        :param pipeline: instance of :class:`vpipes.Pipeline`.
+        :param batch_size: (optional) max number of attempts claimed at once.
+        :param lease_seconds: (optional) max time to wait for, or to validate, an attempt, in seconds.
+        :param doi_resolver: (optional) instance of :class:`doi.DOIResolver`.
+        :param timings_path: (optional) file the pipe timings are written to, as JSON.
+        :param retry_base_delay: (optional) seconds before the first retry of a deferred attempt.
+        :param retry_max_delay: (optional) max seconds between retries of a deferred attempt.
+        :param max_failures: (optional) failures before an attempt is given up.
+        """
         self.pipeline = pipeline
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.doi_resolver = doi_resolver
+        self.timings_path = timings_path
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.max_failures = max_failures
+        self.worker_id = '%s:%s:%s' % (socket.gethostname(), os.getpid(),
+                                       uuid.uuid4().hex[:8])
+
+    def _claim_messages(self, session):
+        """
+        Leases a batch of attempts to this worker, in its own transaction.
+        """
+        try:
+            total = models.Attempt.claim_for_validation(session, self.worker_id,
+                self.batch_size, self.lease_seconds)
+            transaction.commit()
+        except Exception as e:
+            logger.error('Could not claim attempts: %s' % e)
+            transaction.abort()
+            total = 0
+
+        return total
 
     def _load_messages(self, session):
-        messages = session.query(models.Attempt).filter(
-            models.Attempt.ready_to_validate())
+        """
+        Returns the ids of the attempts leased to this worker.
+        """
+        messages = session.query(models.Attempt.id).filter(
+            models.Attempt.ready_to_validate()).filter_by(
+            validation_lease_owner=self.worker_id).order_by(models.Attempt.id)
 
-        return messages
+        return [attempt_id for attempt_id, in messages]
+
+    def _prefetch_dois(self, session, attempt_ids):
+        """
+        Starts resolving the DOIs of the batch, so the remote checks run
+        concurrently with the validation of the preceding attempts.
+        """
+        dois = []
+        for attempt_id in attempt_ids:
+            try:
+                attempt = session.query(models.Attempt).get(attempt_id)
+                attempt_doi = attempt.analyzer.xml.findtext(doi.DOI_XPATH)
+            except Exception as e:
+                logger.debug('Could not read the DOI of attempt %s: %s' % (attempt_id, e))
+                continue
+
+            if attempt_doi:
+                dois.append(attempt_doi)
+
+        self.doi_resolver.prefetch(dois)
+
+    def _validate(self, session, attempt_id):
+        """
+        Validates one attempt in its own transaction, if it is still
+        leased to this worker.
+
+        Failures are isolated: the transaction is aborted and the attempt
+        is deferred, see :meth:`_defer`.
+        Returns a bool indicating if the validation was committed.
+        """
+        try:
+            if not models.Attempt.renew_validation_lease(session, attempt_id,
+                    self.worker_id, self.lease_seconds):
+                logger.warning('Lease of attempt %s was lost. Skipping.' % attempt_id)
+                transaction.abort()
+                return False
+
+            attempt = session.query(models.Attempt).get(attempt_id)
+
+            for _ in self.pipeline.run([(attempt, session)]):
+                # nothing to do here.
+                pass
+
+            transaction.commit()
+        except Exception as e:
+            transaction.abort()
+            self._defer(session, attempt_id, e)
+            return False
+        finally:
+            # the identity map is discarded after each attempt.
+            session.close()
+
+        return True
+
+    def _defer(self, session, attempt_id, error):
+        """
+        Postpones the validation of an attempt, in its own transaction,
+        or gives it up if it keeps failing for reasons other than
+        unavailable dependencies.
+        """
+        is_transient = utils.is_transient_error(error)
+        try:
+            attempt = session.query(models.Attempt).get(attempt_id)
+            if is_transient:
+                retry_at = attempt.defer_validation(self.retry_base_delay, self.retry_max_delay)
+            else:
+                retry_at = attempt.fail_validation(self.retry_base_delay, self.retry_max_delay,
+                                                   self.max_failures)
+            transaction.commit()
+        except Exception as e:
+            logger.error('Could not defer attempt %s: %s' % (attempt_id, e))
+            transaction.abort()
+        else:
+            if retry_at is None:
+                logger.error('Validation of attempt %s given up after %s failures: %s' % (
+                    attempt_id, self.max_failures, error))
+            elif is_transient:
+                logger.warning('Validation of attempt %s deferred until %s: %s' % (
+                    attempt_id, retry_at, error))
+            else:
+                logger.error('Could not validate attempt %s, retrying at %s: %s' % (
+                    attempt_id, retry_at, error))
 
     def run_once(self):
+        """
+        Validates a batch of at most `batch_size` attempts, committing
+        each one independently. Returns the total of claimed attempts,
+        or None if there was nothing to do.
+        """
         session = models.Session()
 
-        raw_messages = self._load_messages(session)
-
         # check if there is something to do.
         # if not, close the session and return.
-        if not raw_messages.first():
-            transaction.abort()
+        claimed = self._claim_messages(session)
+        if not claimed:
             session.close()
             return None
 
-        try:
-            # enrich each message with the current session.
-            messages = ((msg, session) for msg in raw_messages)
+        attempt_ids = self._load_messages(session)
+        if self.doi_resolver is not None:
+            self._prefetch_dois(session, attempt_ids)
 
-            for _ in self.pipeline.run(messages):
-                # nothing to do here.
-                pass
-        finally:
+        transaction.abort()
+        session.close()
 
+        for attempt_id in attempt_ids:
+            self._validate(session, attempt_id)
+
+        if self.timings_path:
             try:
-                transaction.commit()
-            except Exception as e:
-                logger.error(e.message)
-                transaction.abort()
-            finally:
-                session.close()
+                timing.registry.dump(self.timings_path)
+            except IOError as e:
+                logger.error('Could not write the pipe timings: %s' % e)
+
+        return claimed
+
+    def start(self, listener=None, poll_interval=10):
+        """
+        Runs forever, waking up as soon as new attempts are enqueued.
+
+        :param listener: (optional) instance of :class:`wakeup.Listener`.
+        :param poll_interval: max seconds between lookups for pending attempts.
+        """
+        if listener is None:
+            while True:
+                while self.run_once():
+                    pass
+                time.sleep(poll_interval)
+
+        listener.listen()
+        try:
+            while True:
+                while self.run_once():
+                    pass
+                listener.wait(poll_interval)
+        finally:
+            listener.close()
+
+
+def options_from_config(config, getters):
+    """
+    Returns a dict of the `[validator]` options set in `config`. The
+    options left out keep the defaults of the callable they are passed to,
+    so configs written before an option existed keep working.
 
-    def start(self):
-        while True:
-            self.run_once()
-            time.sleep(10)
+    :param getters: dict of option names and the config method that reads them, e.g. `getint`.
+    """
+    return dict((name, getattr(config, getter)('validator', name))
+                for name, getter in getters.items()
+                if config.has_option('validator', name))
 
 
 if __name__ == '__main__':
@@ -670,37 +987,41 @@ if __name__ == '__main__':
     # Setting up the app configuration, logging and SqlAlchemy Session.
     config = utils.balaio_config_from_env()
     utils.setup_logging()
-    models.Session.configure(bind=models.create_engine_from_config(config))
+    engine = models.create_engine_from_config(config)
+    models.Session.configure(bind=engine)
 
     # Setting up some pipe dependencies.
-    scieloapi = scieloapi.Client(config.get('manager', 'api_username'),
-                                 config.get('manager', 'api_key'),
-                                 api_uri=config.get('manager', 'api_url'))
+    scieloapi = manager.client_from_config(config)
 
     notifier_dep = notifier.validation_notifier_factory(config)
-
-    ppl = vpipes.Pipeline(
-        SetupPipe(notifier_dep, scieloapi, scieloapitoolbelt,
-                  package.PackageAnalyzer, utils.is_valid_issn),
-        PublisherNameValidationPipe(notifier_dep, utils.normalize_data),
-        JournalAbbreviatedTitleValidationPipe(notifier_dep, utils.normalize_data),
-        NLMJournalTitleValidationPipe(notifier_dep, utils.normalize_data),
-        ArticleSectionValidationPipe(notifier_dep, utils.normalize_data),
-        FundingGroupValidationPipe(notifier_dep),
-        DOIVAlidationPipe(notifier_dep, utils.is_valid_doi),
-        ArticleMetaPubDateValidationPipe(notifier_dep),
-        ReferenceValidationPipe(notifier_dep),
-        ReferenceSourceValidationPipe(notifier_dep),
-        ReferenceJournalTypeArticleTitleValidationPipe(notifier_dep),
-        ReferenceYearValidationPipe(notifier_dep),
-        LicenseValidationPipe(notifier_dep),
-        TearDownPipe(notifier_dep)
-    )
+    doi_resolver = doi.resolver_from_config(config, engine)
+
+    ppl = get_pipeline(notifier_dep, scieloapi, doi_resolver,
+                       manager_cache=cache.cache_from_config(config),
+                       manager_snapshot=snapshot.snapshot_from_config(config, engine),
+                       **options_from_config(config, {
+                           'rule_workers': 'getint',
+                           'rule_timeout': 'getint',
+                           'reuse_results': 'getboolean',
+                           'store_timings': 'getboolean',
+                       }))
+
+    worker_options = options_from_config(config, {
+        'batch_size': 'getint',
+        'lease_seconds': 'getint',
+        'timings_path': 'get',
+        'retry_base_delay': 'getint',
+        'retry_max_delay': 'getint',
+        'max_failures': 'getint',
+    })
+    listener_options = options_from_config(config, {'wakeup_socket': 'get'})
+    start_options = options_from_config(config, {'poll_interval': 'getint'})
 
     while True:
         try:
-            app = Worker(ppl)
-            app.start()
+            app = Worker(ppl, doi_resolver=doi_resolver, **worker_options)
+            app.start(listener=wakeup.Listener(engine, listener_options.get('wakeup_socket')),
+                      **start_options)
         except KeyboardInterrupt:
             sys.exit(0)
         except Exception as e:
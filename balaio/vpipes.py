@@ -1,9 +1,19 @@
+import time
+import json
+import hashlib
 import logging
+import threading
+from multiprocessing import TimeoutError
+from xml.etree import ElementTree
+from multiprocessing.dummy import Pool as ThreadPool
 
+from lxml import etree
 from plumber import Pipe, Pipeline, precondition, UnmetPrecondition
-import transaction
+from sqlalchemy.exc import IntegrityError
 
 import scieloapitoolbelt
+import models
+import timing
 
 
 logger = logging.getLogger(__name__)
@@ -20,15 +30,52 @@ def attempt_is_valid(data):
         raise UnmetPrecondition()
 
 
+def get_xml_hash(pkg_analyzer):
+    """
+    Returns the SHA-256 digest of the XML of the package, cached on
+    `pkg_analyzer`.
+    """
+    xml_hash = getattr(pkg_analyzer, '_xml_hash', None)
+    if xml_hash is None:
+        xml = pkg_analyzer.xml
+        root = xml.getroot() if hasattr(xml, 'getroot') else xml
+        try:
+            data = etree.tostring(root)
+        except TypeError:
+            # not a lxml element
+            data = ElementTree.tostring(root)
+
+        xml_hash = pkg_analyzer._xml_hash = hashlib.sha256(data).hexdigest()
+
+    return xml_hash
+
+
+def get_data_version(journal_and_issue_data):
+    """
+    Returns the SHA-256 digest of the data retrieved from SciELO Manager.
+    """
+    return hashlib.sha256(json.dumps(journal_and_issue_data,
+        sort_keys=True, default=str)).hexdigest()
+
+
 class ValidationPipe(Pipe):
 
     """
     Specialized Pipe which validates the data and notifies the result.
+
+    Subclasses must increment `_version_` whenever the rule changes, and
+    set `_manager_data_` to False if it does not depend on SciELO Manager
+    data, or `_reusable_` to False if its results must not be reused.
     """
+    _version_ = 1
+    _manager_data_ = True
+    _reusable_ = True
+
     def __init__(self, notifier):
         self._notifier = notifier
 
     @precondition(attempt_is_valid)
+    @timing.timed
     def transform(self, item):
         """
         Performs a transformation to one `item` of data iterator.
@@ -42,11 +89,11 @@ class ValidationPipe(Pipe):
 
         result_status, result_description = self.validate(item)
 
-        savepoint = transaction.savepoint()
+        # notices are buffered by the checkpoint and written in bulk
+        # during the next flush, so there is nothing to rollback here.
         try:
             self._notifier(attempt, db_session).tell(result_description, result_status, label=self._stage_)
         except Exception as e:
-            savepoint.rollback()
             logger.error('An exception was raised during %s stage: %s' % (self._stage_, e))
             raise
 
@@ -61,3 +108,192 @@ class ValidationPipe(Pipe):
         """
         raise NotImplementedError()
 
+
+class _Task(object):
+    """
+    The validation of a pipe, submitted to a thread pool.
+
+    Records when it starts running, so its timeout is not spent waiting
+    for a thread. A task that did not start yet can be cancelled.
+    """
+    def __init__(self, pipe, item):
+        self.pipe = pipe
+        self.item = item
+        self.started_at = None
+        self.result = None
+        self._started = threading.Event()
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            if self._cancelled:
+                return None
+            self.started_at = time.time()
+            self._started.set()
+
+        return timing.call_timed(self.pipe.validate, self.item)
+
+    def cancel(self):
+        """
+        Returns a bool indicating if the task was cancelled before starting.
+        """
+        with self._lock:
+            if self.started_at is None:
+                self._cancelled = True
+            return self._cancelled
+
+    def get(self, timeout):
+        """
+        Returns the result of the task, waiting at most `timeout` seconds
+        since it started.
+        """
+        self._started.wait()
+        return self.result.get(max(0, self.started_at + timeout - time.time()))
+
+
+class ConcurrentValidationPipe(Pipe):
+    """
+    Runs a group of independent validation pipes concurrently.
+
+    The pipes in the group must only read the item. Their `validate`
+    methods run on a thread pool, while the notices are told by the
+    calling thread, in the order the pipes were declared.
+
+    A pipe may define `_timeout_` to override the group timeout, counted
+    from the moment the pipe starts running. Pipes exceeding their timeout
+    are notified with a warning, and the thread pool is replaced, so the
+    hung pipes do not hold the threads needed by the pipes still queued
+    and by the following items.
+
+    If `reuse_results` is True, the results of the pipes are stored as
+    :class:`models.ValidationResult` and reused by packages with the same
+    XML, rule version and SciELO Manager data.
+    """
+    def __init__(self, pipes, workers=4, timeout=30, reuse_results=False):
+        """
+        :param pipes: list of :class:`ValidationPipe` instances.
+        :param workers: (optional) number of threads.
+        :param timeout: (optional) default max time of each pipe, in seconds.
+        :param reuse_results: (optional) reuse stored results.
+        """
+        self._pipes = pipes
+        self._workers = workers
+        self._pool = ThreadPool(workers)
+        self._timeout = timeout
+        self._reuse_results = reuse_results
+        # tasks left running by the pipes that timed out.
+        self._hung = []
+
+    def _result_keys(self, item):
+        """
+        Returns a dict of reusable pipes and their result keys.
+        """
+        pkg_analyzer, journal_and_issue_data = item[1:3]
+        xml_hash = get_xml_hash(pkg_analyzer)
+        data_version = get_data_version(journal_and_issue_data)
+
+        return dict((pipe, (xml_hash, pipe.__class__.__name__, pipe._version_,
+                            data_version if pipe._manager_data_ else ''))
+                    for pipe in self._pipes if pipe._reusable_)
+
+    def _load_results(self, db_session, keys):
+        """
+        Returns a dict of pipes and their stored [status, description].
+        """
+        if not keys:
+            return {}
+
+        xml_hash = keys.values()[0][0]
+        stored = dict(((r.xml_hash, r.rule, r.rule_version, r.data_version), r)
+            for r in db_session.query(models.ValidationResult).filter(
+                models.ValidationResult.xml_hash == xml_hash).filter(
+                models.ValidationResult.rule.in_([key[1] for key in keys.values()])))
+
+        return dict((pipe, [stored[key].status, stored[key].description])
+                    for pipe, key in keys.items() if key in stored)
+
+    def _store_results(self, db_session, results):
+        """
+        :param results: list of (key, status, description).
+        """
+        try:
+            with db_session.begin_nested():
+                for (xml_hash, rule, rule_version, data_version), status, description in results:
+                    db_session.add(models.ValidationResult(xml_hash=xml_hash, rule=rule,
+                        rule_version=rule_version, data_version=data_version,
+                        status=status, description=description))
+        except IntegrityError:
+            # stored concurrently by another worker.
+            logger.debug('Validation results already stored')
+
+    def _submit(self, pipe, item):
+        task = _Task(pipe, item)
+        task.result = self._pool.apply_async(task)
+        return task
+
+    def _replace_pool(self, timed_out):
+        """
+        Leaves the tasks that timed out to the current pool, that exits
+        when they end, and starts a new one.
+
+        :param timed_out: `AsyncResult` of the task that timed out.
+        """
+        self._hung = [result for result in self._hung if not result.ready()]
+        self._hung.append(timed_out)
+        logger.warning('Replacing the thread pool, %s timed out tasks are still running' % (
+            len(self._hung)))
+
+        self._pool.close()
+        self._pool = ThreadPool(self._workers)
+
+    @precondition(attempt_is_valid)
+    @timing.timed
+    def transform(self, item):
+        attempt = item[0]
+        db_session = item[3]
+        logger.debug('%s started processing %s' % (self.__class__.__name__, attempt))
+
+        if self._reuse_results:
+            keys = self._result_keys(item)
+            reused = self._load_results(db_session, keys)
+        else:
+            keys, reused = {}, {}
+
+        tasks = [None if pipe in reused else self._submit(pipe, item)
+                 for pipe in self._pipes]
+
+        new_results = []
+        for i, pipe in enumerate(self._pipes):
+            timeout = getattr(pipe, '_timeout_', self._timeout)
+            try:
+                if tasks[i] is None:
+                    result_status, result_description = reused[pipe]
+                else:
+                    (result_status, result_description), wall, cpu = tasks[i].get(timeout)
+                    timing.record(attempt, pipe.__class__.__name__, wall, cpu)
+
+                    if pipe in keys:
+                        new_results.append((keys[pipe], result_status, result_description))
+
+            except TimeoutError:
+                logger.error('%s timed out validating %s' % (pipe.__class__.__name__, attempt))
+                result_status = models.Status.warning
+                result_description = 'Validation timed out after %s seconds' % timeout
+
+                self._replace_pool(tasks[i].result)
+                # the pipes still queued in the replaced pool run in the new one.
+                for j in range(i + 1, len(tasks)):
+                    if tasks[j] is not None and tasks[j].cancel():
+                        tasks[j] = self._submit(self._pipes[j], item)
+
+            try:
+                pipe._notifier(attempt, db_session).tell(result_description, result_status, label=pipe._stage_)
+            except Exception as e:
+                logger.error('An exception was raised during %s stage: %s' % (pipe._stage_, e))
+                raise
+
+        if new_results:
+            self._store_results(db_session, new_results)
+
+        return item
@@ -0,0 +1,167 @@
+#coding: utf-8
+"""
+Wakeup channel between the processes that enqueue attempts to validation
+and the validator workers.
+
+On PostgreSQL the channel is a LISTEN/NOTIFY channel, so a notification
+is delivered only when the transaction that enqueued the attempt commits.
+Other backends fall back to datagrams sent to local unix sockets after
+the commit. Each listener binds its own socket, named after the configured
+path, so all the validator processes are woken up.
+"""
+import os
+import glob
+import errno
+import select
+import socket
+import logging
+
+import transaction
+from zope.sqlalchemy import mark_changed
+
+
+logger = logging.getLogger('balaio.wakeup')
+
+CHANNEL = 'balaio_validation'
+
+
+def _send_datagram(success, socket_path):
+    """
+    After-commit hook that pokes the listeners bound to `socket_path`.
+    """
+    if not success:
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        for path in glob.glob('%s.*' % socket_path):
+            try:
+                sock.sendto(CHANNEL, path)
+            except socket.error as e:
+                # the safety net polling will catch up.
+                logger.debug('Could not wake up the listener at %s: %s' % (path, e))
+                if e.errno == errno.ECONNREFUSED:
+                    # left behind by a dead listener.
+                    _unlink(path)
+    finally:
+        sock.close()
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def notify(session, socket_path=None):
+    """
+    Wakes up the listeners when the current transaction commits.
+
+    :param session: sqlalchemy db session, joined to the current transaction.
+    :param socket_path: (optional) unix socket path used by non-PostgreSQL backends.
+    """
+    if session.bind.dialect.name == 'postgresql':
+        session.execute('NOTIFY %s' % CHANNEL)
+        # raw statements are not tracked by the session.
+        mark_changed(session)
+    elif socket_path:
+        transaction.get().addAfterCommitHook(_send_datagram, args=(socket_path,))
+
+
+class Listener(object):
+    """
+    Blocks until a notification arrives or a timeout expires.
+
+    Notifications received while the listener is not waiting are kept
+    and make the next call to `wait` return immediately.
+    """
+    def __init__(self, engine, socket_path=None):
+        """
+        :param engine: sqlalchemy engine.
+        :param socket_path: (optional) unix socket path used by non-PostgreSQL backends.
+        """
+        self.engine = engine
+        self.socket_path = socket_path
+        # the socket of this listener, see :func:`_send_datagram`.
+        self._bound_path = socket_path and '%s.%s.%s' % (socket_path, os.getpid(), id(self))
+        self._conn = None
+        self._sock = None
+
+    def listen(self):
+        """
+        Starts listening to the channel. Must be called before the first
+        lookup for pending work, so no notification is missed.
+        """
+        if self.engine.dialect.name == 'postgresql':
+            self._conn = self.engine.raw_connection()
+            self._conn.connection.set_isolation_level(0)  # autocommit
+            cursor = self._conn.cursor()
+            cursor.execute('LISTEN %s' % CHANNEL)
+            cursor.close()
+
+        elif self.socket_path:
+            _unlink(self._bound_path)
+
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock.bind(self._bound_path)
+            self._sock.setblocking(0)
+
+    def _fileno(self):
+        if self._conn is not None:
+            return self._conn.connection.fileno()
+        elif self._sock is not None:
+            return self._sock.fileno()
+
+    def _drain(self):
+        """
+        Consumes all pending notifications. Returns the total consumed.
+        """
+        total = 0
+        if self._conn is not None:
+            self._conn.connection.poll()
+            total = len(self._conn.connection.notifies)
+            del self._conn.connection.notifies[:]
+
+        elif self._sock is not None:
+            while True:
+                try:
+                    self._sock.recv(1024)
+                except socket.error:
+                    break
+                total += 1
+
+        return total
+
+    def wait(self, timeout):
+        """
+        Returns True if woken up by a notification, or False on timeout.
+
+        :param timeout: max time to wait, in seconds.
+        """
+        fileno = self._fileno()
+        if fileno is None:
+            select.select([], [], [], timeout)
+            return False
+
+        if self._drain():
+            return True
+
+        readable, _, _ = select.select([fileno], [], [], timeout)
+        return bool(readable) and self._drain() > 0
+
+    def close(self):
+        if self._conn is not None:
+            # the connection is in autocommit mode, so it must not
+            # return to the pool.
+            self._conn.invalidate()
+            self._conn = None
+
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            try:
+                os.unlink(self._bound_path)
+            except OSError:
+                pass
@@ -23,11 +23,12 @@ if __name__ == '__main__':
     else:
         config = utils.balaio_config_from_env()
 
-    # Setting up SqlAlchemy engine.
+    # Setting up SqlAlchemy engines.
     engine = models.create_engine_from_config(config)
+    replica_engine = models.create_replica_engine_from_config(config)
 
     # Bootstrapping the app and the server.
-    app = httpd.main(config, engine)
+    app = httpd.main(config, engine, replica_engine=replica_engine)
     listening = config.get('http_server', 'ip')
     port = config.getint('http_server', 'port')
     server = make_server(listening, port, app)
@@ -44,9 +45,10 @@ else:
 
     config = utils.balaio_config_from_env()
 
-    # Setting up SqlAlchemy engine.
+    # Setting up SqlAlchemy engines.
     engine = models.create_engine_from_config(config)
+    replica_engine = models.create_replica_engine_from_config(config)
 
     # Bootstrapping the app and the server.
-    app = httpd.main(config, engine)
+    app = httpd.main(config, engine, replica_engine=replica_engine)
 